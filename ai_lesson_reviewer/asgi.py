@@ -2,6 +2,9 @@
 ASGI config for ai_lesson_reviewer project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn ai_lesson_reviewer.asgi:application``)
+so the native async review endpoints under /api/async/ can hold many LLM calls
+in flight per worker.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
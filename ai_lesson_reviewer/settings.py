@@ -47,7 +47,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'notes.authentication.StatelessJWTAuthentication',
 ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
@@ -55,8 +55,27 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'notes.pagination.KeysetPagination',
 }
 
+# Tokens carry the user's Teacher id, username and is_active flag, so views
+# scope reads without looking the Teacher up and reads need no users-table query
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'notes.authentication.TeacherTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'notes.authentication.RevocationCheckedTokenRefreshSerializer',
+}
+
+# Stateless reads: GET/HEAD/OPTIONS requests are authenticated from the signed
+# token claims alone (writes, admin and profile views still load the user).
+# Tokens without the claims load their User at most once per JWT_USER_CACHE_TTL
+# seconds per process. Revoked tokens (RevokedToken rows) are reloaded into
+# every process every JWT_REVOCATION_REFRESH seconds.
+
+JWT_STATELESS_READS = config('JWT_STATELESS_READS', default=True, cast=bool)
+JWT_USER_CACHE_TTL = config('JWT_USER_CACHE_TTL', default=30, cast=float)
+JWT_USER_CACHE_SIZE = config('JWT_USER_CACHE_SIZE', default=10000, cast=int)
+JWT_REVOCATION_REFRESH = config('JWT_REVOCATION_REFRESH', default=5.0, cast=float)
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -151,3 +170,217 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# AI feedback cache
+# Identical lesson notes (same subject/grade/term/content, model and prompt
+# version) are served from cache instead of calling Gemini again.
+
+AI_FEEDBACK_CACHE_ENABLED = config('AI_FEEDBACK_CACHE_ENABLED', default=True, cast=bool)
+AI_FEEDBACK_CACHE_MEMORY_SIZE = config('AI_FEEDBACK_CACHE_MEMORY_SIZE', default=512, cast=int)
+AI_FEEDBACK_CACHE_TTL = config('AI_FEEDBACK_CACHE_TTL', default=7 * 24 * 3600, cast=int)
+AI_FEEDBACK_CACHE_MAX_ENTRIES = config('AI_FEEDBACK_CACHE_MAX_ENTRIES', default=50000, cast=int)
+
+# Gemini clients are created once per worker process and shared. Cap how many
+# LLM calls a single process may have in flight; callers wait up to
+# AI_CALL_SLOT_TIMEOUT seconds for a free slot before falling back.
+
+AI_MAX_CONCURRENT_CALLS = config('AI_MAX_CONCURRENT_CALLS', default=8, cast=int)
+AI_CALL_SLOT_TIMEOUT = config('AI_CALL_SLOT_TIMEOUT', default=30, cast=float)
+AI_MAX_CONCURRENT_ASYNC_CALLS = config('AI_MAX_CONCURRENT_ASYNC_CALLS', default=256, cast=int)
+
+# LLM backend: 'gemini' (needs GEMINI_API_KEY), 'fake' (deterministic local
+# stub for load tests) or 'replay' (serves responses recorded to a JSONL file
+# via AI_RECORD_RESPONSES_TO). The fake backend's latency is log-normal around
+# AI_FAKE_LATENCY seconds; AI_FAKE_ERROR_RATE of calls fail as transient errors.
+
+AI_FEEDBACK_BACKEND = config('AI_FEEDBACK_BACKEND', default='gemini')
+AI_FAKE_LATENCY = config('AI_FAKE_LATENCY', default=0.5, cast=float)
+AI_FAKE_LATENCY_SIGMA = config('AI_FAKE_LATENCY_SIGMA', default=0.0, cast=float)
+AI_FAKE_ERROR_RATE = config('AI_FAKE_ERROR_RATE', default=0.0, cast=float)
+AI_FAKE_SEED = config('AI_FAKE_SEED', default=0, cast=int)
+AI_REPLAY_FILE = config('AI_REPLAY_FILE', default='')
+AI_REPLAY_LATENCY = config('AI_REPLAY_LATENCY', default=True, cast=bool)
+AI_RECORD_RESPONSES_TO = config('AI_RECORD_RESPONSES_TO', default='')
+
+# Outbound LLM backpressure. AI_RATE_LIMIT_RPM / _TPM are shared token buckets
+# (requests and tokens per minute, 0 = unlimited) kept in the database so all
+# worker processes draw from one budget; a call waits up to
+# AI_RATE_LIMIT_MAX_WAIT seconds for capacity. The per-process circuit breaker
+# opens for AI_BREAKER_COOLDOWN seconds once AI_BREAKER_FAILURE_RATE of at least
+# AI_BREAKER_MIN_CALLS calls in the last AI_BREAKER_WINDOW seconds failed with a
+# provider error or timeout (review deadlines and cancellations don't count).
+# Throttled reviews are queued as jobs and retried after REVIEW_DEFER_DELAY
+# seconds (or the limiter's own estimate) instead of storing fallback feedback.
+
+AI_RATE_LIMIT_RPM = config('AI_RATE_LIMIT_RPM', default=1000, cast=int)
+AI_RATE_LIMIT_TPM = config('AI_RATE_LIMIT_TPM', default=1000000, cast=int)
+AI_RATE_LIMIT_MAX_WAIT = config('AI_RATE_LIMIT_MAX_WAIT', default=5, cast=float)
+AI_BREAKER_FAILURE_RATE = config('AI_BREAKER_FAILURE_RATE', default=0.5, cast=float)
+AI_BREAKER_MIN_CALLS = config('AI_BREAKER_MIN_CALLS', default=10, cast=int)
+AI_BREAKER_WINDOW = config('AI_BREAKER_WINDOW', default=60, cast=float)
+AI_BREAKER_COOLDOWN = config('AI_BREAKER_COOLDOWN', default=30, cast=float)
+REVIEW_DEFER_DELAY = config('REVIEW_DEFER_DELAY', default=30, cast=float)
+
+# Tail latency. AI_CALL_TIMEOUT bounds each provider attempt (0 = only the
+# review deadline). Transient errors and attempt timeouts are retried up to
+# AI_RETRY_ATTEMPTS times with full-jitter backoff. AI_HEDGE_DELAY > 0 enables
+# hedging: a second request is sent once an attempt has been pending for the
+# observed AI_HEDGE_PERCENTILE latency (AI_HEDGE_DELAY until
+# AI_HEDGE_MIN_SAMPLES calls were seen; percentile 0 = always the fixed delay).
+# Hedged sync calls run on a pool of AI_HEDGE_POOL_SIZE threads per process,
+# which should be at least twice AI_MAX_CONCURRENT_CALLS.
+# Tune with: python manage.py benchmark_llm_latency
+
+AI_CALL_TIMEOUT = config('AI_CALL_TIMEOUT', default=0, cast=float)
+AI_RETRY_ATTEMPTS = config('AI_RETRY_ATTEMPTS', default=2, cast=int)
+AI_RETRY_BASE_DELAY = config('AI_RETRY_BASE_DELAY', default=0.5, cast=float)
+AI_RETRY_MAX_DELAY = config('AI_RETRY_MAX_DELAY', default=8, cast=float)
+AI_HEDGE_DELAY = config('AI_HEDGE_DELAY', default=0, cast=float)
+AI_HEDGE_PERCENTILE = config('AI_HEDGE_PERCENTILE', default=95, cast=float)
+AI_HEDGE_MIN_SAMPLES = config('AI_HEDGE_MIN_SAMPLES', default=50, cast=int)
+AI_HEDGE_POOL_SIZE = config('AI_HEDGE_POOL_SIZE', default=32, cast=int)
+
+# Per-call LLM metrics. Every request AIFeedbackGenerator makes is stored as an
+# LLMCallMetric row (tokens, network vs parse time, parse path, outcome, cost at
+# AI_PRICE_INPUT_PER_MTOK / AI_PRICE_OUTPUT_PER_MTOK USD per million tokens) and
+# exported at /api/metrics/ in Prometheus format. Scrapers authenticate with
+# "Authorization: Bearer <METRICS_TOKEN>"; admins can use their JWT. Prune old
+# rows with: python manage.py prune_llm_call_metrics --days 30
+
+AI_CALL_METRICS_ENABLED = config('AI_CALL_METRICS_ENABLED', default=True, cast=bool)
+AI_PRICE_INPUT_PER_MTOK = config('AI_PRICE_INPUT_PER_MTOK', default=0.10, cast=float)
+AI_PRICE_OUTPUT_PER_MTOK = config('AI_PRICE_OUTPUT_PER_MTOK', default=0.40, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Long lesson notes. Content estimated above AI_REVIEW_CHUNK_THRESHOLD_TOKENS
+# (0 = never) is split along its section headings into chunks of about
+# AI_REVIEW_CHUNK_TOKENS (at most AI_REVIEW_MAX_CHUNKS), reviewed in parallel
+# (AI_REVIEW_CHUNK_CONCURRENCY per note) and merged into one feedback.
+
+AI_REVIEW_CHUNK_THRESHOLD_TOKENS = config('AI_REVIEW_CHUNK_THRESHOLD_TOKENS', default=6000, cast=int)
+AI_REVIEW_CHUNK_TOKENS = config('AI_REVIEW_CHUNK_TOKENS', default=3000, cast=int)
+AI_REVIEW_MAX_CHUNKS = config('AI_REVIEW_MAX_CHUNKS', default=16, cast=int)
+AI_REVIEW_CHUNK_CONCURRENCY = config('AI_REVIEW_CHUNK_CONCURRENCY', default=4, cast=int)
+
+# Regenerating a review of a note whose material content (ignoring case,
+# whitespace and punctuation) is unchanged reuses the last AI review. If only
+# some sections changed - at most AI_INCREMENTAL_MAX_CHANGED_RATIO of the
+# note's tokens - only those are re-reviewed and merged into it.
+
+AI_INCREMENTAL_MAX_CHANGED_RATIO = config('AI_INCREMENTAL_MAX_CHANGED_RATIO', default=0.6, cast=float)
+
+# Near-duplicate notes (shared school templates). A note without a usable
+# review of its own is looked up in a MinHash LSH index within its subject and
+# grade level: at AI_NEAR_DUPLICATE_REUSE_SIMILARITY estimated similarity or
+# above the other note's review is copied; from AI_NEAR_DUPLICATE_SEED_SIMILARITY
+# it seeds an incremental review of the sections that differ (seeding still
+# requires the section hashes to match, so a low threshold is safe).
+
+AI_NEAR_DUPLICATE_ENABLED = config('AI_NEAR_DUPLICATE_ENABLED', default=True, cast=bool)
+AI_NEAR_DUPLICATE_REUSE_SIMILARITY = config('AI_NEAR_DUPLICATE_REUSE_SIMILARITY', default=0.85, cast=float)
+AI_NEAR_DUPLICATE_SEED_SIMILARITY = config('AI_NEAR_DUPLICATE_SEED_SIMILARITY', default=0.5, cast=float)
+AI_NEAR_DUPLICATE_MAX_CANDIDATES = config('AI_NEAR_DUPLICATE_MAX_CANDIDATES', default=50, cast=int)
+
+
+# Asynchronous review submission
+# When enabled (or requested with ?async=true / 'Prefer: respond-async'),
+# POST /api/lesson-notes/ returns 202 with a review job instead of waiting
+# for Gemini. REVIEW_JOB_BACKEND is 'celery' (needs a broker), 'thread'
+# (in-process pools) or 'database' (the ReviewJob table is the queue, served
+# by `manage.py run_review_workers`).
+#
+# Queued reviews have a priority class: INTERACTIVE (new submissions),
+# REGENERATE (manual re-reviews) and BULK (bulk uploads, backfills). Each class
+# runs on its own workers so backfills can't starve interactive reviews: the
+# thread backend gives each class REVIEW_<CLASS>_CONCURRENCY threads per
+# process; with Celery, each class has a queue named
+# "<REVIEW_CELERY_QUEUE_PREFIX>.<class>" and the worker concurrency per queue
+# sets the class's share. Within a class, teachers take turns; each process
+# recomputes the turn order from the queue every REVIEW_FAIRNESS_REFRESH
+# seconds and rotates it locally in between.
+# Queue wait percentiles per class cover jobs started in the last
+# REVIEW_WAIT_STATS_WINDOW seconds.
+#
+# A running job holds a REVIEW_JOB_LEASE second lease, renewed while it runs;
+# jobs of a lost worker are requeued when it expires. Failed reviews are
+# retried after REVIEW_JOB_RETRY_DELAY seconds, doubling each time, and
+# dead-lettered (status DEAD) after REVIEW_JOB_MAX_ATTEMPTS attempts.
+# run_review_workers starts REVIEW_WORKER_PROCESSES processes by default,
+# each polling every REVIEW_WORKER_POLL_INTERVAL seconds while idle.
+# backfill_reviews keeps at most REVIEW_BACKFILL_MAX_IN_FLIGHT of its jobs
+# queued or running at once.
+
+ASYNC_REVIEW_SUBMISSION = config('ASYNC_REVIEW_SUBMISSION', default=False, cast=bool)
+REVIEW_JOB_BACKEND = config('REVIEW_JOB_BACKEND', default='thread')
+REVIEW_INTERACTIVE_CONCURRENCY = config('REVIEW_INTERACTIVE_CONCURRENCY', default=4, cast=int)
+REVIEW_REGENERATE_CONCURRENCY = config('REVIEW_REGENERATE_CONCURRENCY', default=2, cast=int)
+REVIEW_BULK_CONCURRENCY = config('REVIEW_BULK_CONCURRENCY', default=2, cast=int)
+REVIEW_CELERY_QUEUE_PREFIX = config('REVIEW_CELERY_QUEUE_PREFIX', default='reviews')
+REVIEW_WAIT_STATS_WINDOW = config('REVIEW_WAIT_STATS_WINDOW', default=3600, cast=int)
+REVIEW_FAIRNESS_REFRESH = config('REVIEW_FAIRNESS_REFRESH', default=2.0, cast=float)
+REVIEW_JOB_LEASE = config('REVIEW_JOB_LEASE', default=120, cast=float)
+REVIEW_JOB_MAX_ATTEMPTS = config('REVIEW_JOB_MAX_ATTEMPTS', default=5, cast=int)
+REVIEW_JOB_RETRY_DELAY = config('REVIEW_JOB_RETRY_DELAY', default=30, cast=float)
+REVIEW_WORKER_PROCESSES = config('REVIEW_WORKER_PROCESSES', default=2, cast=int)
+REVIEW_WORKER_POLL_INTERVAL = config('REVIEW_WORKER_POLL_INTERVAL', default=1.0, cast=float)
+REVIEW_BACKFILL_MAX_IN_FLIGHT = config('REVIEW_BACKFILL_MAX_IN_FLIGHT', default=1000, cast=int)
+
+# A queued review leaves a provisional HEURISTIC Feedback, scored locally from
+# the note's structure, length and readability, until the AI review replaces it.
+
+PROVISIONAL_FEEDBACK_ENABLED = config('PROVISIONAL_FEEDBACK_ENABLED', default=True, cast=bool)
+
+# Per-stage deadlines for a synchronous review (seconds). The LLM stage runs
+# outside any DB transaction; if it overruns, the note stays saved and its
+# review is handed to REVIEW_JOB_BACKEND (the API answers 202 with the job).
+# REVIEW_DB_STAGE_TIMEOUT caps lock waits in the short note/feedback commits
+# (MySQL innodb_lock_wait_timeout).
+
+REVIEW_LLM_TIMEOUT = config('REVIEW_LLM_TIMEOUT', default=25, cast=float)
+REVIEW_DB_STAGE_TIMEOUT = config('REVIEW_DB_STAGE_TIMEOUT', default=5, cast=int)
+
+# Single-flight reviews: concurrent reviews of the same lesson note share one
+# LLM call. In-process callers wait on the running review; other workers see
+# its ReviewLock marker and poll every REVIEW_SINGLE_FLIGHT_POLL seconds until
+# it is released. A marker older than REVIEW_SINGLE_FLIGHT_LEASE seconds is
+# treated as left behind by a crashed worker and taken over.
+
+REVIEW_SINGLE_FLIGHT_ENABLED = config('REVIEW_SINGLE_FLIGHT_ENABLED', default=True, cast=bool)
+REVIEW_SINGLE_FLIGHT_LEASE = config('REVIEW_SINGLE_FLIGHT_LEASE', default=120, cast=float)
+REVIEW_SINGLE_FLIGHT_POLL = config('REVIEW_SINGLE_FLIGHT_POLL', default=0.25, cast=float)
+
+# Bulk submission (POST /api/lesson-notes/bulk/). Reviews fan out over
+# BULK_REVIEW_CONCURRENCY threads by default; clients may ask for up to
+# BULK_REVIEW_MAX_CONCURRENCY. Large batches should use ?async=true.
+
+BULK_MAX_NOTES = config('BULK_MAX_NOTES', default=500, cast=int)
+BULK_REVIEW_CONCURRENCY = config('BULK_REVIEW_CONCURRENCY', default=8, cast=int)
+BULK_REVIEW_MAX_CONCURRENCY = config('BULK_REVIEW_MAX_CONCURRENCY', default=32, cast=int)
+
+# List endpoints are cursor-paginated (notes/pagination.py): API_PAGE_SIZE rows
+# per page, clients may ask for up to API_MAX_PAGE_SIZE with ?page_size=, and
+# ?count=true totals are counted up to API_COUNT_LIMIT rows.
+
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=50, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=200, cast=int)
+API_COUNT_LIMIT = config('API_COUNT_LIMIT', default=1000, cast=int)
+
+# Logging: the review pipeline logs through the "notes" logger
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'notes': {
+            'handlers': ['console'],
+            'level': config('LOG_LEVEL', default='INFO'),
+        },
+    },
+}
@@ -1,18 +1,70 @@
-import google.generativeai as genai
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from typing import Dict, Any
+import asyncio
 import json
+import logging
 import re
-from decouple import config
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from .call_metrics import atrack_llm_call, track_llm_call
+from .chunking import (
+    chunk_content, incremental_parts, merge_chunk_feedback, merge_incremental_feedback, needs_chunking
+)
+from .feedback_cache import get_feedback_cache, make_cache_key
+from .heuristics import heuristic_score
+from .llm_backends import LLMTimeout, LLMTransientError, estimate_tokens
+from .llm_clients import get_backend, llm_call_slot, async_llm_call_slot, LLMCapacityError
+from .llm_calls import CallPolicy, call_llm, acall_llm
+from .rate_limits import llm_guard
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'gemini-2.0-flash'
+
+# Bump whenever _create_prompt or the generation config changes so cached
+# feedback produced by the old prompt is no longer served
+PROMPT_VERSION = 2
+
+FALLBACK_FEEDBACK_TEXT = 'AI feedback temporarily unavailable. Please try again later or contact support.'
+
+# Text fallback patterns for responses without usable JSON
+_SCORE_RE = re.compile(r'score[:\s]+(\d+)', re.IGNORECASE)
+_STRENGTHS_RE = re.compile(r'strengths?[:\s]+(.*?)(?=suggestions?|areas?|overall|$)', re.IGNORECASE | re.DOTALL)
+_SUGGESTIONS_RE = re.compile(r'suggestions?[:\s]+(.*?)(?=strengths?|areas?|overall|$)', re.IGNORECASE | re.DOTALL)
+_AREAS_RE = re.compile(r'areas?.*?improvement[:\s]+(.*?)(?=strengths?|suggestions?|overall|$)', re.IGNORECASE | re.DOTALL)
+_NUMBERED_ITEM_RE = re.compile(r'^\d+\.')
+_ITEM_MARKER_RE = re.compile(r'^[•\-\*\d\.\s]+')
+
+
+class ReviewDeferred(Exception):
+    """
+    The review can't run now (provider throttling, rate limit, open circuit
+    breaker) and should be queued for later rather than stored as fallback.
+    retry_after is a hint in seconds, if known.
+    """
+    def __init__(self, message, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ReviewTimeout(ReviewDeferred):
+    """Raised when the LLM stage of a review misses its deadline"""
 
-GEMINI_API_KEY = config('GEMINI_API_KEY')
 
 class AIFeedbackGenerator:
-    def __init__(self):
-        genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+    """
+    Stateless apart from the backend handle, so one instance can serve every
+    request in a process - use llm_clients.get_feedback_generator() rather
+    than constructing this per call. The backend (Gemini, fake, replay) comes
+    from the AI_FEEDBACK_BACKEND setting unless one is passed in.
+    """
+    def __init__(self, model_name: str = MODEL_NAME, backend=None):
+        self.model_name = model_name
+        self.backend = backend or get_backend(model_name)
         
-    def generate_feedback(self, lesson_note) -> Dict[str, Any]:
+    def generate_feedback(self, lesson_note, use_cache: bool = True, timeout: float = None) -> Dict[str, Any]:
         """
         Generate AI feedback for a lesson note
         Returns structured feedback matching the frontend expectations:
@@ -24,67 +76,352 @@ class AIFeedbackGenerator:
             'areas_for_improvement': list,
             'overall_assessment': str
         }
+        Identical notes are served from the feedback cache when use_cache is set.
+        Transient provider errors are retried with backoff and slow calls may
+        be hedged (see llm_calls). Very long notes are reviewed in parallel
+        chunks and merged (see chunking).
+        If timeout (seconds) is given and the LLM stage - waiting for a call
+        slot plus the request itself - overruns it, ReviewTimeout is raised
+        instead of returning fallback feedback. Throttling, rate limiting and
+        an open circuit breaker raise ReviewDeferred.
         """
+        cache, cache_key, cached = self._lookup_cache(lesson_note, use_cache)
+        if cached is not None:
+            return cached
+
         try:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            if needs_chunking(lesson_note.content):
+                return self._review_in_chunks(lesson_note, cache, cache_key, deadline)
+
             prompt = self._create_prompt(lesson_note)
             
-            # Configure generation settings for better JSON output
-            generation_config = genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=1500,
-                top_p=0.9,
-                top_k=40
-            )
+            with track_llm_call('REVIEW', self.backend, lesson_note, prompt) as call:
+                with llm_call_slot(timeout=timeout), call.network():
+                    response = call_llm(
+                        self.backend, prompt, self._generation_config(),
+                        self._token_reservation(prompt), deadline
+                    )
+                call.set_response(response)
+                return self._structure_response(response.text, cache, cache_key, call)
             
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
+        except (LLMTimeout, LLMCapacityError, LLMTransientError) as e:
+            raise self._deferral(e, timeout) from e
+        except Exception:
+            logger.exception("AI feedback generation failed, returning fallback feedback")
+            return self._get_fallback_feedback(lesson_note)
+
+    async def agenerate_feedback(self, lesson_note, use_cache: bool = True,
+                                 timeout: float = None) -> Dict[str, Any]:
+        """
+        Async variant of generate_feedback using the backend's async API, so an
+        ASGI worker can hold many reviews in flight without a thread each.
+        Database work (cache, prompt building) runs via sync_to_async.
+        """
+        cache, cache_key, cached = await sync_to_async(self._lookup_cache)(lesson_note, use_cache)
+        if cached is not None:
+            return cached
+
+        try:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            if needs_chunking(lesson_note.content):
+                return await asyncio.wait_for(
+                    self._areview_in_chunks(lesson_note, cache, cache_key, deadline), timeout
+                )
+
+            prompt = await sync_to_async(self._create_prompt)(lesson_note)
+
+            async with atrack_llm_call('REVIEW', self.backend, lesson_note, prompt) as call:
+                async def call_model():
+                    async with async_llm_call_slot(timeout=timeout):
+                        with call.network():
+                            return await acall_llm(
+                                self.backend, prompt, self._generation_config(),
+                                self._token_reservation(prompt), deadline
+                            )
+
+                response = await asyncio.wait_for(call_model(), timeout)
+                call.set_response(response)
+                return await sync_to_async(self._structure_response)(response.text, cache, cache_key, call)
             
-            # Extract and validate JSON from response
-            feedback_data = self._extract_json_from_response(response.text)
-            return self._validate_and_structure_feedback(feedback_data)
+        except (asyncio.TimeoutError, LLMTimeout, LLMCapacityError, LLMTransientError) as e:
+            raise self._deferral(e, timeout) from e
+        except Exception:
+            logger.exception("AI feedback generation failed, returning fallback feedback")
+            return self._get_fallback_feedback(lesson_note)
+
+    def stream_feedback(self, lesson_note, use_cache: bool = True, timeout: float = None):
+        """
+        Streaming variant of generate_feedback. Yields ('delta', text) events
+        carrying the feedback_text value as the model produces it, then one
+        ('done', structured_feedback) event with the same structure
+        generate_feedback returns (fallback feedback if the model fails).
+        Raises ReviewTimeout / ReviewDeferred like generate_feedback.
+        """
+        cache, cache_key, cached = self._lookup_cache(lesson_note, use_cache)
+        if cached is not None:
+            yield 'delta', cached['feedback_text']
+            yield 'done', cached
+            return
+
+        if needs_chunking(lesson_note.content):
+            # Chunked reviews only have text once every part is merged
+            structured_feedback = self.generate_feedback(lesson_note, use_cache=use_cache, timeout=timeout)
+            yield 'delta', structured_feedback['feedback_text']
+            yield 'done', structured_feedback
+            return
+
+        streamer = FeedbackTextStreamer()
+        chunks = []
+        try:
+            prompt = self._create_prompt(lesson_note)
+            deadline = time.monotonic() + timeout if timeout is not None else None
             
-        except Exception as e:
-            # Log the error in production
-            print(f"AI Feedback Error: {str(e)}")
-            return self._get_fallback_feedback()
+            with track_llm_call('STREAM', self.backend, lesson_note, prompt) as call:
+                with llm_call_slot(timeout=timeout):
+                    # Streams are neither retried nor hedged: deltas may already be out
+                    with llm_guard(self._token_reservation(prompt), CallPolicy.from_settings().max_wait(deadline)):
+                        with call.network():
+                            response = self.backend.stream(
+                                prompt,
+                                self._generation_config(),
+                                timeout=self._remaining(deadline)
+                            )
+                        for text in call.timed(response):
+                            chunks.append(text)
+                            delta = streamer.feed(text)
+                            if delta:
+                                yield 'delta', delta
+                
+                call.set_response(text=''.join(chunks))
+                structured_feedback = self._structure_response(''.join(chunks), cache, cache_key, call)
+        except (LLMTimeout, LLMCapacityError, LLMTransientError) as e:
+            raise self._deferral(e, timeout) from e
+        except Exception:
+            logger.exception("AI feedback generation failed, returning fallback feedback")
+            structured_feedback = self._get_fallback_feedback(lesson_note)
+        yield 'done', structured_feedback
+
+    def generate_incremental_feedback(self, lesson_note, previous_feedback: Dict[str, Any], plan,
+                                      timeout: float = None):
+        """
+        Re-review only the sections fingerprints.plan_review() found changed
+        and merge them into previous_feedback (the structured dict of the last
+        AI review). Returns (structured_feedback, tokens_saved), or None if
+        the partial review failed and a full review should run instead.
+        Raises ReviewTimeout / ReviewDeferred like generate_feedback.
+        """
+        parts, indexes = incremental_parts(lesson_note.content, plan.changed_indexes)
+        try:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            prompts = [self._create_chunk_prompt(lesson_note, parts, i, incremental=True) for i in indexes]
+            results = self._review_parts(lesson_note, prompts, deadline, 'INCREMENTAL')
+            return self._merge_incremental(lesson_note, previous_feedback, plan, parts, indexes, prompts, results)
+        except (LLMTimeout, LLMCapacityError, LLMTransientError) as e:
+            raise self._deferral(e, timeout) from e
+        except Exception:
+            logger.warning("Incremental AI review failed, falling back to a full review", exc_info=True)
+            return None
+
+    async def agenerate_incremental_feedback(self, lesson_note, previous_feedback: Dict[str, Any], plan,
+                                             timeout: float = None):
+        """Async variant of generate_incremental_feedback"""
+        parts, indexes = incremental_parts(lesson_note.content, plan.changed_indexes)
+        try:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            prompts = await sync_to_async(
+                lambda: [self._create_chunk_prompt(lesson_note, parts, i, incremental=True) for i in indexes]
+            )()
+            results = await asyncio.wait_for(
+                self._areview_parts(lesson_note, prompts, deadline, 'INCREMENTAL'), timeout
+            )
+            return await sync_to_async(self._merge_incremental)(
+                lesson_note, previous_feedback, plan, parts, indexes, prompts, results
+            )
+        except (asyncio.TimeoutError, LLMTimeout, LLMCapacityError, LLMTransientError) as e:
+            raise self._deferral(e, timeout) from e
+        except Exception:
+            logger.warning("Incremental AI review failed, falling back to a full review", exc_info=True)
+            return None
+
+    def full_review_tokens(self, lesson_note) -> int:
+        """Estimated tokens a full review of lesson_note would reserve (prompts plus output caps)"""
+        if needs_chunking(lesson_note.content):
+            chunks = chunk_content(lesson_note.content)
+            return sum(
+                self._token_reservation(self._create_chunk_prompt(lesson_note, chunks, i), chunked=True)
+                for i in range(len(chunks))
+            )
+        return self._token_reservation(self._create_prompt(lesson_note))
+
+    def is_fallback(self, feedback_data: Dict[str, Any]) -> bool:
+        """True for the placeholder returned when the model could not be used"""
+        return feedback_data.get('feedback_text') == FALLBACK_FEEDBACK_TEXT
+
+    def _review_in_chunks(self, lesson_note, cache, cache_key, deadline) -> Dict[str, Any]:
+        """
+        Map-reduce review of a long note: one LLM call per chunk, at most
+        AI_REVIEW_CHUNK_CONCURRENCY at a time, merged locally. Each chunk call
+        takes its own call slot; any chunk failing defers the whole review.
+        """
+        chunks = chunk_content(lesson_note.content)
+        # Build prompts here: they read lesson_note.teacher, which may hit the DB
+        prompts = [self._create_chunk_prompt(lesson_note, chunks, i) for i in range(len(chunks))]
+        results = self._review_parts(lesson_note, prompts, deadline)
+        return self._merge_chunks(chunks, results, cache, cache_key)
+
+    async def _areview_in_chunks(self, lesson_note, cache, cache_key, deadline) -> Dict[str, Any]:
+        """asyncio counterpart of _review_in_chunks"""
+        chunks = chunk_content(lesson_note.content)
+        prompts = await sync_to_async(
+            lambda: [self._create_chunk_prompt(lesson_note, chunks, i) for i in range(len(chunks))]
+        )()
+        results = await self._areview_parts(lesson_note, prompts, deadline)
+        return await sync_to_async(self._merge_chunks)(chunks, results, cache, cache_key)
+
+    def _review_parts(self, lesson_note, prompts, deadline, operation: str = 'CHUNK') -> list:
+        """Run part prompts in parallel (AI_REVIEW_CHUNK_CONCURRENCY); structured result per prompt"""
+        def review_part(prompt):
+            try:
+                with track_llm_call(operation, self.backend, lesson_note, prompt) as call:
+                    with llm_call_slot(timeout=self._remaining(deadline)), call.network():
+                        response = call_llm(
+                            self.backend, prompt, self._chunk_generation_config(),
+                            self._token_reservation(prompt, chunked=True), deadline
+                        )
+                    call.set_response(response)
+                    return self._parse_and_validate(response.text, call)
+            finally:
+                # Pool threads touched the DB through the rate limiter
+                connection.close()
+
+        concurrency = min(len(prompts), getattr(settings, 'AI_REVIEW_CHUNK_CONCURRENCY', 4))
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='chunk-review') as pool:
+            return list(pool.map(review_part, prompts))
+
+    async def _areview_parts(self, lesson_note, prompts, deadline, operation: str = 'CHUNK') -> list:
+        """asyncio counterpart of _review_parts"""
+        semaphore = asyncio.Semaphore(max(1, getattr(settings, 'AI_REVIEW_CHUNK_CONCURRENCY', 4)))
+
+        async def review_part(prompt):
+            async with atrack_llm_call(operation, self.backend, lesson_note, prompt) as call:
+                async with semaphore:
+                    async with async_llm_call_slot(timeout=self._remaining(deadline)):
+                        with call.network():
+                            response = await acall_llm(
+                                self.backend, prompt, self._chunk_generation_config(),
+                                self._token_reservation(prompt, chunked=True), deadline
+                            )
+                call.set_response(response)
+                return self._parse_and_validate(response.text, call)
+
+        return await asyncio.gather(*(review_part(prompt) for prompt in prompts))
+
+    def _merge_chunks(self, chunks, results, cache, cache_key) -> Dict[str, Any]:
+        """Reduce step for chunked reviews, caching the merged result"""
+        structured_feedback = self._validate_and_structure_feedback(merge_chunk_feedback(chunks, results))
+        if cache is not None:
+            cache.set(cache_key, structured_feedback, self.backend.cache_namespace, PROMPT_VERSION)
+        return structured_feedback
+
+    def _merge_incremental(self, lesson_note, previous_feedback, plan, parts, indexes, prompts, results):
+        """Reduce step for incremental reviews; returns (structured_feedback, tokens_saved)"""
+        merged = merge_incremental_feedback(
+            previous_feedback, [parts[i] for i in indexes], results, plan.unchanged_tokens, len(plan.sections)
+        )
+        spent = sum(self._token_reservation(prompt, chunked=True) for prompt in prompts)
+        tokens_saved = max(0, self.full_review_tokens(lesson_note) - spent)
+        return self._validate_and_structure_feedback(merged), tokens_saved
+
+    def _generation_config(self) -> Dict[str, Any]:
+        """Generation settings tuned for JSON output"""
+        return {
+            'temperature': 0.7,
+            'max_output_tokens': 1500,
+            'top_p': 0.9,
+            'top_k': 40,
+        }
+
+    def _remaining(self, deadline):
+        """Seconds left before the stage deadline (None = no deadline)"""
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeout("Review deadline passed before the LLM request was sent")
+        return remaining
+
+    def _chunk_generation_config(self) -> Dict[str, Any]:
+        """Per-chunk answers are shorter; the merge rebuilds the full structure"""
+        return {**self._generation_config(), 'max_output_tokens': 800}
+
+    def _token_reservation(self, prompt: str, chunked: bool = False) -> int:
+        """Tokens to reserve from the rate limiter: prompt estimate plus the output cap"""
+        config = self._chunk_generation_config() if chunked else self._generation_config()
+        return estimate_tokens(prompt) + config['max_output_tokens']
+
+    def _deferral(self, error, timeout) -> ReviewDeferred:
+        """Map an LLM-stage failure onto ReviewTimeout (caller's deadline) or ReviewDeferred"""
+        if timeout is not None and not isinstance(error, LLMTransientError):
+            return ReviewTimeout(f"LLM stage exceeded {timeout}s: {str(error)}")
+        logger.warning("AI review deferred: %s", error)
+        retry_after = getattr(error, 'retry_after', None) or getattr(settings, 'REVIEW_DEFER_DELAY', 30)
+        return ReviewDeferred(f"LLM unavailable: {str(error)}", retry_after=max(1.0, retry_after))
+
+    def _lookup_cache(self, lesson_note, use_cache: bool):
+        """Returns (cache, cache_key, cached_feedback_or_None)"""
+        cache = get_feedback_cache() if use_cache else None
+        if cache is None:
+            return None, None, None
+        cache_key = make_cache_key(lesson_note, self.backend.cache_namespace, PROMPT_VERSION)
+        return cache, cache_key, cache.get(cache_key)
+
+    def _structure_response(self, response_text: str, cache, cache_key, call=None) -> Dict[str, Any]:
+        """Parse and validate model output, caching the result"""
+        structured_feedback = self._parse_and_validate(response_text, call)
+        
+        # Only real model output is cached, never the fallback
+        if cache is not None:
+            cache.set(cache_key, structured_feedback, self.backend.cache_namespace, PROMPT_VERSION)
+        return structured_feedback
     
+    def _parse_and_validate(self, response_text: str, call=None) -> Dict[str, Any]:
+        """Structured feedback from model output, timing the parse and noting its path on call"""
+        if call is None:
+            return self._validate_and_structure_feedback(self._extract_json_from_response(response_text))
+        with call.parsing():
+            feedback_data, call.parse_path = self._parse_response(response_text)
+            return self._validate_and_structure_feedback(feedback_data)
+
     def _extract_json_from_response(self, response_text: str) -> Dict[str, Any]:
-        """Extract JSON from Gemini response text"""
-        try:
-            # Find JSON block in response
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(1))
-            
-            # Try to find JSON without code blocks
-            json_match = re.search(r'(\{.*?\})', response_text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(1))
-            
-            # If no JSON found, create structure from text
-            return self._parse_text_response(response_text)
-            
-        except json.JSONDecodeError:
-            return self._parse_text_response(response_text)
+        """Extract JSON from model response text"""
+        return self._parse_response(response_text)[0]
+
+    def _parse_response(self, response_text: str):
+        """(feedback_data, parse_path): FENCED_JSON, BARE_JSON or TEXT"""
+        feedback_data, parse_path = parse_json_response(response_text)
+        if feedback_data is not None:
+            return feedback_data, parse_path
+        
+        # If no JSON found, create structure from text
+        return self._parse_text_response(response_text), 'TEXT'
     
     def _parse_text_response(self, text: str) -> Dict[str, Any]:
         """Parse text response into structured format when JSON parsing fails"""
         # Extract score if present
-        score_match = re.search(r'score[:\s]+(\d+)', text, re.IGNORECASE)
+        score_match = _SCORE_RE.search(text)
         score = int(score_match.group(1)) if score_match else 75
         
         # Extract strengths section
-        strengths_match = re.search(r'strengths?[:\s]+(.*?)(?=suggestions?|areas?|overall|$)', text, re.IGNORECASE | re.DOTALL)
+        strengths_match = _STRENGTHS_RE.search(text)
         strengths = self._extract_list_items(strengths_match.group(1)) if strengths_match else ['Lesson structure is clear']
         
         # Extract suggestions section
-        suggestions_match = re.search(r'suggestions?[:\s]+(.*?)(?=strengths?|areas?|overall|$)', text, re.IGNORECASE | re.DOTALL)
+        suggestions_match = _SUGGESTIONS_RE.search(text)
         suggestions = self._extract_list_items(suggestions_match.group(1)) if suggestions_match else ['Consider adding more interactive elements']
         
         # Extract areas for improvement
-        areas_match = re.search(r'areas?.*?improvement[:\s]+(.*?)(?=strengths?|suggestions?|overall|$)', text, re.IGNORECASE | re.DOTALL)
+        areas_match = _AREAS_RE.search(text)
         areas = self._extract_list_items(areas_match.group(1)) if areas_match else ['Assessment methods could be enhanced']
         
         return {
@@ -103,8 +440,8 @@ class AIFeedbackGenerator:
         lines = text.strip().split('\n')
         for line in lines:
             line = line.strip()
-            if line and (line.startswith('•') or line.startswith('-') or line.startswith('*') or re.match(r'^\d+\.', line)):
-                clean_item = re.sub(r'^[•\-\*\d\.\s]+', '', line).strip()
+            if line and (line.startswith('•') or line.startswith('-') or line.startswith('*') or _NUMBERED_ITEM_RE.match(line)):
+                clean_item = _ITEM_MARKER_RE.sub('', line).strip()
                 if clean_item:
                     items.append(clean_item)
         return items[:5]  # Limit to 5 items
@@ -156,6 +493,60 @@ class AIFeedbackGenerator:
         Please ensure your response is in valid JSON format.
         """
     
+    def _create_chunk_prompt(self, lesson_note, chunks, index, incremental: bool = False) -> str:
+        """
+        Prompt for one part of a lesson note, with an outline of the rest for
+        context: a chunk of a long note, or an edited part being re-reviewed
+        """
+        chunk = chunks[index]
+        if incremental:
+            reason = ("This lesson note was edited since its last review, so only the changed\n"
+                      "        parts are reviewed, one at a time.")
+        else:
+            reason = f"This lesson note is long, so it is reviewed in {len(chunks)} parts."
+        outline = '\n'.join(
+            f"        {i}. {other.label or 'Untitled part'}" + ('  <- this part' if i - 1 == index else '')
+            for i, other in enumerate(chunks, 1)
+        )
+        return f"""
+        You are an experienced educational reviewer specializing in lesson plan evaluation.
+        {reason} Review ONLY
+        part {index + 1} below; the other parts are reviewed separately.
+
+        **Lesson Details:**
+        - Subject: {lesson_note.subject}
+        - Grade Level: {lesson_note.grade_level}
+        - Term: {lesson_note.term}
+        - Teacher: {lesson_note.teacher.name}
+
+        **Outline of the whole note:**
+{outline}
+
+        **Part {index + 1} of {len(chunks)}:**
+        {chunk.text}
+
+        **Please provide your response in JSON format with the following structure:**
+
+        ```json
+        {{
+            "feedback_text": "One concise paragraph (at most 120 words) on this part",
+            "score": 85,
+            "strengths": ["specific strength 1", "specific strength 2"],
+            "suggestions": ["actionable suggestion 1", "actionable suggestion 2"],
+            "areas_for_improvement": ["specific area 1"],
+            "overall_assessment": "One sentence on this part"
+        }}
+        ```
+
+        **Guidelines:**
+        - Score this part between 1-100 using the usual criteria: objectives, content
+          accuracy, methodology, assessment, engagement and differentiation
+        - Do not penalise the part for content that belongs to other parts of the outline
+        - Be constructive and specific
+
+        Please ensure your response is in valid JSON format.
+        """
+
     def _validate_and_structure_feedback(self, feedback_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Validate and structure AI response to match frontend expectations exactly
@@ -193,13 +584,14 @@ class AIFeedbackGenerator:
         else:
             return []
     
-    def _get_fallback_feedback(self) -> Dict[str, Any]:
+    def _get_fallback_feedback(self, lesson_note=None) -> Dict[str, Any]:
         """
-        Fallback feedback if AI fails - matches exact frontend structure
+        Fallback feedback if AI fails - matches exact frontend structure.
+        The score is the local heuristic score of the note (see heuristics).
         """
         return {
-            'feedback_text': 'AI feedback temporarily unavailable. Please try again later or contact support.',
-            'score': 70,
+            'feedback_text': FALLBACK_FEEDBACK_TEXT,
+            'score': heuristic_score(lesson_note.content) if lesson_note is not None else 70,
             'strengths': [
                 'Lesson successfully submitted for review',
                 'Shows commitment to educational improvement'
@@ -212,4 +604,165 @@ class AIFeedbackGenerator:
                 'AI analysis pending - will be available shortly'
             ],
             'overall_assessment': 'Awaiting AI review - technical issue will be resolved soon'
-        }
\ No newline at end of file
+        }
+
+
+# Characters the JSON scanner has to look at; everything else is skipped by the regex engine
+_JSON_TOKEN_RE = re.compile(r'[{}\[\]"\\]')
+_FENCE_RE = re.compile(r'```(?:json|JSON)?')
+_TRAILING_PARTIAL_RE = re.compile(r'(?:,\s*|,?\s*"(?:[^"\\]|\\.)*"\s*:?\s*)$')
+_CLOSERS = {'{': '}', '[': ']'}
+_DECODER = json.JSONDecoder()
+
+
+def find_json_object(text: str):
+    """
+    Return the first JSON object in text as a dict, or None.
+
+    Well-formed objects decode straight from the first brace. Otherwise one
+    left-to-right pass over the structural characters, tracking string
+    and escape state, yields each outermost balanced {...} span; a span that
+    json.loads rejects (braces in prose, say) just moves the scan on. Text
+    inside a ```json fence is tried first. An object cut off mid-way - e.g.
+    by max_output_tokens - is closed off and parsed on a best-effort basis.
+    """
+    return parse_json_response(text)[0]
+
+
+def parse_json_response(text: str):
+    """find_json_object() plus where the object came from: (data, 'FENCED_JSON' / 'BARE_JSON') or (None, None)"""
+    if not text:
+        return None, None
+    fence = _FENCE_RE.search(text)
+    if fence is not None:
+        data = _scan_json_object(text, fence.end())
+        if data is not None:
+            return data, 'FENCED_JSON'
+    data = _scan_json_object(text, 0)
+    return (data, 'BARE_JSON') if data is not None else (None, None)
+
+
+def _scan_json_object(text: str, pos: int):
+    # Fast path: the common well-formed response decodes in C from its first brace
+    start = text.find('{', pos)
+    if start < 0:
+        return None
+    try:
+        data, _ = _DECODER.raw_decode(text, start)
+        if isinstance(data, dict):
+            return data
+    except ValueError:
+        pass
+
+    stack = []
+    span_start = start
+    in_string = False
+    escaped_at = -2
+    for match in _JSON_TOKEN_RE.finditer(text, start):
+        char = match.group()
+        index = match.start()
+        if in_string:
+            if char == '\\' and escaped_at != index - 1:
+                escaped_at = index
+            elif char == '"' and escaped_at != index - 1:
+                in_string = False
+            continue
+        if not stack:
+            if char == '{':
+                span_start = index
+                stack.append(char)
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append(char)
+        elif char in '}]':
+            if _CLOSERS[stack[-1]] != char:
+                # Mismatched bracket: not JSON, look for the next object
+                stack = []
+                continue
+            stack.pop()
+            if not stack:
+                data = _loads_object(text[span_start:index + 1])
+                if data is not None:
+                    return data
+    if stack:
+        return _repair_truncated(text[span_start:], stack, in_string)
+    return None
+
+
+def _loads_object(candidate: str):
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _repair_truncated(candidate: str, stack: list, in_string: bool):
+    """Close an object that stops mid-way, dropping a dangling key or comma"""
+    if in_string:
+        candidate += '"'
+    attempts = [candidate, _TRAILING_PARTIAL_RE.sub('', candidate)]
+    for attempt in attempts:
+        data = _loads_object(attempt.rstrip() + ''.join(_CLOSERS[opener] for opener in reversed(stack)))
+        # A stray "{" closes to {}, which recovers nothing; leave such text to the text parser
+        if data:
+            return data
+    return None
+
+
+class FeedbackTextStreamer:
+    """
+    Incrementally decodes the "feedback_text" string value out of a JSON
+    response that is still being streamed, so partial text can be shown
+    before the whole object has arrived.
+    """
+    _START_RE = re.compile(r'"feedback_text"\s*:\s*"')
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = None  # index of the next undecoded character inside the string
+        self.finished = False
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk of model output; returns newly decoded feedback_text characters"""
+        if self.finished:
+            return ''
+        self.buffer += chunk
+        if self.pos is None:
+            match = self._START_RE.search(self.buffer)
+            if not match:
+                return ''
+            self.pos = match.end()
+
+        out = []
+        buffer, pos = self.buffer, self.pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.finished = True
+                pos += 1
+                break
+            if char != '\\':
+                out.append(char)
+                pos += 1
+                continue
+            # Escape sequence: wait for the rest of it if it's split across chunks
+            if pos + 1 >= len(buffer):
+                break
+            code = buffer[pos + 1]
+            if code == 'u':
+                if pos + 6 > len(buffer):
+                    break
+                try:
+                    out.append(chr(int(buffer[pos + 2:pos + 6], 16)))
+                except ValueError:
+                    pass
+                pos += 6
+            else:
+                out.append(self._ESCAPES.get(code, code))
+                pos += 2
+        self.pos = pos
+        return ''.join(out)
@@ -0,0 +1,173 @@
+"""
+Native async counterparts of the review endpoints.
+
+DRF views are synchronous, so under ASGI each review would still pin a
+thread for the whole Gemini round-trip. These plain Django async views await
+the LLM call instead, letting one ASGI worker (ai_lesson_reviewer/asgi.py)
+hold hundreds of reviews in flight. Database work runs via sync_to_async.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .authentication import StatelessJWTAuthentication
+from .models import Teacher, LessonNote
+from .serializers import LessonNoteSerializer
+from .ai_feedback import ReviewDeferred
+from .reviews import (
+    aincremental_review, areview_lesson_note, feedback_as_data, save_provisional_feedback, short_transaction
+)
+from .review_jobs import enqueue_review
+
+logger = logging.getLogger(__name__)
+
+
+def _authenticate(request):
+    """Resolve (user, teacher) from the JWT bearer token; (None, None) if unauthenticated or revoked"""
+    try:
+        # POSTs, so the user is loaded; revoked tokens are refused
+        result = StatelessJWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None, None
+    if result is None:
+        return None, None
+    user, _ = result
+    return user, Teacher.objects.filter(user=user).first()
+
+
+def _save_lesson_note(data, teacher):
+    """Validate and save a lesson note. Returns (lesson_note, errors)"""
+    serializer = LessonNoteSerializer(data=data)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    with short_transaction():
+        return serializer.save(teacher=teacher), None
+
+
+async def _queued_review_response(request, lesson_note, message, delay=None, priority='INTERACTIVE'):
+    """
+    Hand a timed-out or deferred review to the background queue and answer
+    202 with a provisional heuristic score
+    """
+    job = await sync_to_async(enqueue_review)(lesson_note, delay=delay, priority=priority)
+    provisional = (await sync_to_async(save_provisional_feedback)([lesson_note])).get(lesson_note.id)
+    status_url = request.build_absolute_uri(reverse('review-jobs-detail', args=[job.id]))
+    response = JsonResponse({
+        'message': message,
+        'lesson_note_id': lesson_note.id,
+        'job_id': job.id,
+        'provisional_feedback': feedback_as_data(provisional) if provisional else None,
+        'status_url': status_url,
+        'feedback_url': request.build_absolute_uri(reverse('review-jobs-feedback', args=[job.id])),
+    }, status=202)
+    response['Location'] = status_url
+    return response
+
+
+def _get_lesson_note(pk, teacher):
+    return LessonNote.objects.filter(pk=pk, teacher=teacher).first()
+
+
+def _unauthorized():
+    return JsonResponse(
+        {'detail': 'Authentication credentials were not provided.'},
+        status=401
+    )
+
+
+@csrf_exempt
+@require_POST
+async def create_lesson_note(request):
+    """
+    Create a lesson note and review it without blocking a worker thread
+    Endpoint: POST /api/async/lesson-notes/
+    """
+    user, teacher = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return _unauthorized()
+    if teacher is None:
+        return JsonResponse(['Teacher profile not found for this user'], status=400, safe=False)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'detail': 'JSON parse error'}, status=400)
+
+    lesson_note, errors = await sync_to_async(_save_lesson_note)(data, teacher)
+    if errors:
+        return JsonResponse(errors, status=400)
+
+    try:
+        _, feedback_data = await areview_lesson_note(lesson_note, timeout=settings.REVIEW_LLM_TIMEOUT)
+    except ReviewDeferred as e:
+        return await _queued_review_response(
+            request, lesson_note,
+            'Lesson note created; AI review is taking longer than usual and was queued',
+            delay=e.retry_after
+        )
+    except Exception:
+        logger.exception("Failed to generate AI feedback for lesson note %s", lesson_note.id)
+        return JsonResponse(
+            {'error': 'Lesson note created but AI feedback generation failed'},
+            status=201
+        )
+    return JsonResponse(feedback_data, status=201)
+
+
+@csrf_exempt
+@require_POST
+async def regenerate_ai_feedback(request, pk):
+    """
+    Generate a new AI review for an existing lesson note, reusing the last
+    one or re-reviewing only changed sections where possible (?force=true
+    for a full review)
+    Endpoint: POST /api/async/lesson-notes/{id}/generate-ai-feedback/
+    """
+    user, teacher = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return _unauthorized()
+
+    lesson_note = await sync_to_async(_get_lesson_note)(pk, teacher)
+    if lesson_note is None:
+        return JsonResponse({'detail': 'No LessonNote matches the given query.'}, status=404)
+
+    force = request.GET.get('force', '').lower() in ('1', 'true', 'yes')
+    try:
+        feedback, feedback_data, outcome = await aincremental_review(
+            lesson_note, timeout=settings.REVIEW_LLM_TIMEOUT, force=force
+        )
+    except ReviewDeferred as e:
+        return await _queued_review_response(
+            request, lesson_note, 'AI review is taking longer than usual and was queued',
+            delay=e.retry_after, priority='REGENERATE'
+        )
+    except Exception:
+        logger.exception("Failed to generate AI feedback for lesson note %s", lesson_note.id)
+        return JsonResponse({
+            'error': 'AI feedback generation failed',
+            'lesson_note_id': lesson_note.id
+        }, status=502)
+
+    if outcome['mode'] == 'unchanged':
+        return JsonResponse({
+            'message': 'Lesson note unchanged since its last AI review; existing feedback returned',
+            'lesson_note_id': lesson_note.id,
+            'feedback_id': feedback.id,
+            'feedback': feedback_data,
+            'review': outcome
+        }, status=200)
+    return JsonResponse({
+        'message': 'AI feedback generated successfully',
+        'lesson_note_id': lesson_note.id,
+        'feedback_id': feedback.id,
+        'feedback': feedback_data,
+        'review': outcome
+    }, status=201)
@@ -0,0 +1,193 @@
+"""
+Authentication helpers.
+
+MetricsTokenAuthentication accepts "Authorization: Bearer <METRICS_TOKEN>"
+so a Prometheus scraper needs no user account or expiring JWT; any other
+bearer token is left to JWTAuthentication.
+
+Tokens from /api/token/ carry the user's username, is_active flag and
+Teacher id as claims (copied into every access token the refresh token
+issues), so request_teacher_id() scopes reads to the caller's teacher without
+looking the Teacher up. Tokens without the claim fall back to one lookup per
+request.
+
+StatelessJWTAuthentication goes further for reads: a GET/HEAD/OPTIONS
+request is authenticated from those signed claims alone, with no users-table
+query. Writes and views that set stateless_authentication = False (admin and
+profile views) load the user as JWTAuthentication does. Every token is
+checked against the revocation list (notes/token_revocation.py).
+"""
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+
+from .models import Teacher
+from .token_revocation import is_revoked
+
+METRICS_SCRAPER = 'metrics-token'
+TEACHER_ID_CLAIM = 'teacher_id'
+USERNAME_CLAIM = 'username'
+IS_ACTIVE_CLAIM = 'is_active'
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    def authenticate(self, request):
+        expected = getattr(settings, 'METRICS_TOKEN', '')
+        parts = get_authorization_header(request).split()
+        if not expected or len(parts) != 2 or parts[0].lower() != b'bearer':
+            return None
+        if not hmac.compare_digest(parts[1], expected.encode('utf-8')):
+            return None
+        return AnonymousUser(), METRICS_SCRAPER
+
+
+class IsMetricsScraper(BasePermission):
+    def has_permission(self, request, view):
+        return request.auth == METRICS_SCRAPER
+
+
+class TeacherTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair carrying the claims stateless authentication trusts"""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[USERNAME_CLAIM] = user.get_username()
+        token[IS_ACTIVE_CLAIM] = user.is_active
+        token[TEACHER_ID_CLAIM] = Teacher.objects.filter(user=user).values_list('id', flat=True).first()
+        return token
+
+
+class RevocationCheckedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses to issue access tokens from a revoked refresh token"""
+
+    def validate(self, attrs):
+        if is_revoked(self.token_class(attrs['refresh'])):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return super().validate(attrs)
+
+
+class ClaimsUser(TokenUser):
+    """A user described by a validated token's claims, never loaded from the database"""
+
+    @property
+    def is_active(self):
+        return self.token.get(IS_ACTIVE_CLAIM, True)
+
+
+# Claims a token needs to authenticate a read without loading the user
+STATELESS_CLAIMS = (api_settings.USER_ID_CLAIM, USERNAME_CLAIM, IS_ACTIVE_CLAIM, TEACHER_ID_CLAIM)
+
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+_stats = {'stateless': 0, 'cached_user': 0, 'user_loaded': 0, 'revoked': 0}
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that checks the revocation list and lets reads trust
+    the token's claims. Reads with tokens issued before the claims existed
+    use a short-lived in-process cache of User rows (JWT_USER_CACHE_TTL).
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        token = self.get_validated_token(raw_token)
+
+        if is_revoked(token):
+            self._count('revoked')
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        if not self.allows_stateless(request):
+            self._count('user_loaded')
+            return self.get_user(token), token
+        if all(claim in token for claim in STATELESS_CLAIMS):
+            if not token[IS_ACTIVE_CLAIM]:
+                raise AuthenticationFailed('User is inactive', code='user_inactive')
+            self._count('stateless')
+            return ClaimsUser(token), token
+        return self.get_cached_user(token), token
+
+    def allows_stateless(self, request):
+        if not getattr(settings, 'JWT_STATELESS_READS', True) or request.method not in SAFE_METHODS:
+            return False
+        view = (getattr(request, 'parser_context', None) or {}).get('view')
+        return getattr(view, 'stateless_authentication', True)
+
+    def get_cached_user(self, token):
+        """The token's User, loaded at most once per JWT_USER_CACHE_TTL seconds per process"""
+        key = str(token.get(api_settings.USER_ID_CLAIM))
+        now = time.monotonic()
+        with _user_cache_lock:
+            entry = _user_cache.get(key)
+            if entry is not None and entry[0] > now:
+                _user_cache.move_to_end(key)
+                _stats['cached_user'] += 1
+                return entry[1]
+
+        user = self.get_user(token)
+        with _user_cache_lock:
+            _stats['user_loaded'] += 1
+            _user_cache[key] = (now + getattr(settings, 'JWT_USER_CACHE_TTL', 30), user)
+            _user_cache.move_to_end(key)
+            while len(_user_cache) > getattr(settings, 'JWT_USER_CACHE_SIZE', 10000):
+                _user_cache.popitem(last=False)
+        return user
+
+    @staticmethod
+    def _count(outcome):
+        with _user_cache_lock:
+            _stats[outcome] += 1
+
+
+def forget_cached_user(user_id):
+    """Drop a user from this process's cache, e.g. after the row changed"""
+    with _user_cache_lock:
+        _user_cache.pop(str(user_id), None)
+
+
+def authentication_stats() -> dict:
+    """How JWT-authenticated requests got their user, for /api/ai-stats/"""
+    with _user_cache_lock:
+        return {**_stats, 'cached_users': len(_user_cache)}
+
+
+def teacher_id_from_token(token, user):
+    """The teacher_id claim of a validated token, else the user's Teacher id looked up (or None)"""
+    teacher_id = token.get(TEACHER_ID_CLAIM) if isinstance(token, Token) else None
+    if teacher_id is None and user is not None and user.is_authenticated:
+        teacher_id = Teacher.objects.filter(user_id=user.pk).values_list('id', flat=True).first()
+    return teacher_id
+
+
+def request_teacher_id(request):
+    """The caller's Teacher id (or None), resolved once per request"""
+    if not hasattr(request, '_teacher_id'):
+        request._teacher_id = teacher_id_from_token(request.auth, request.user)
+    return request._teacher_id
+
+
+def request_teacher(request):
+    """The caller's Teacher, for views that need the row itself; raises Teacher.DoesNotExist"""
+    if not hasattr(request, '_teacher'):
+        teacher_id = request_teacher_id(request)
+        if teacher_id is None:
+            raise Teacher.DoesNotExist("Teacher profile not found for this user")
+        request._teacher = Teacher.objects.get(id=teacher_id)
+    return request._teacher
@@ -0,0 +1,287 @@
+"""
+Per-call instrumentation of AIFeedbackGenerator.
+
+Every LLM request a review makes (one per review, or one per part of a
+chunked or incremental review) is stored as an LLMCallMetric row: the model,
+prompt and response tokens (estimated when the provider reports no usage),
+wall-clock time split into network (provider requests, retries and backoff)
+and parsing, which parse path produced the feedback, the outcome and the
+cost at the AI_PRICE_* rates. For a hedged call the tokens are those of the
+winning request.
+
+prometheus_text() renders the table - aggregated across every worker that
+shares the database - with review job queue waits per priority class and
+this process's in-memory metrics, in the Prometheus text exposition format.
+"""
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+
+from .llm_backends import LLMTimeout, LLMTransientError, estimate_tokens
+from .llm_clients import LLMCapacityError
+from .metrics import DEFAULT_BUCKETS, metrics
+from .models import LLMCallMetric, ReviewJob
+
+logger = logging.getLogger(__name__)
+
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+QUEUE_WAIT_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+_PREFIX = 'lesson_review'
+
+
+def call_metrics_enabled() -> bool:
+    return getattr(settings, 'AI_CALL_METRICS_ENABLED', True)
+
+
+def call_cost(prompt_tokens: int, output_tokens: int) -> float:
+    """USD for one call at the configured per-million-token prices"""
+    return (
+        prompt_tokens * getattr(settings, 'AI_PRICE_INPUT_PER_MTOK', 0.10)
+        + output_tokens * getattr(settings, 'AI_PRICE_OUTPUT_PER_MTOK', 0.40)
+    ) / 1_000_000
+
+
+class LLMCall:
+    """Measurements of one generator call, filled in as it runs"""
+
+    def __init__(self, operation: str, backend, lesson_note=None, prompt: str = ''):
+        self.operation = operation
+        self.backend = backend
+        self.lesson_note_id = getattr(lesson_note, 'pk', None)
+        self.prompt = prompt
+        self.started = time.monotonic()
+        self.network_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.parse_path = 'NONE'
+        self.prompt_tokens = None
+        self.output_tokens = None
+        self.response_text = ''
+
+    @contextmanager
+    def network(self):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.network_seconds += time.monotonic() - started
+
+    @contextmanager
+    def parsing(self):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.parse_seconds += time.monotonic() - started
+
+    def timed(self, iterable):
+        """Iterate a streamed response, counting only the waits for the next piece as network time"""
+        iterator = iter(iterable)
+        while True:
+            started = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.network_seconds += time.monotonic() - started
+            yield item
+
+    def set_response(self, response=None, text: str = None):
+        """Record the provider's token usage (response) or, for streams, the streamed text"""
+        if response is not None:
+            self.prompt_tokens = response.prompt_tokens
+            self.output_tokens = response.output_tokens
+            text = response.text
+        self.response_text = text or ''
+
+    def as_metric(self, outcome: str, error: str = '') -> LLMCallMetric:
+        estimated = self.prompt_tokens is None or self.output_tokens is None
+        prompt_tokens = self.prompt_tokens if self.prompt_tokens is not None else estimate_tokens(self.prompt)
+        output_tokens = self.output_tokens if self.output_tokens is not None else estimate_tokens(self.response_text)
+        return LLMCallMetric(
+            lesson_note_id=self.lesson_note_id,
+            backend=self.backend.name,
+            model_name=self.backend.model_name,
+            operation=self.operation,
+            parse_path='FALLBACK' if outcome == 'FALLBACK' else self.parse_path,
+            outcome=outcome,
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            tokens_estimated=estimated,
+            network_seconds=self.network_seconds,
+            parse_seconds=self.parse_seconds,
+            total_seconds=time.monotonic() - self.started,
+            cost_usd=call_cost(prompt_tokens, output_tokens),
+            error=error[:255],
+        )
+
+
+def _outcome_of(error):
+    if error is None:
+        return 'OK'
+    if isinstance(error, (LLMTimeout, asyncio.TimeoutError)):
+        return 'TIMEOUT'
+    if isinstance(error, (LLMTransientError, LLMCapacityError)):
+        return 'DEFERRED'
+    if isinstance(error, Exception):
+        return 'FALLBACK'
+    # GeneratorExit (stream client went away) or CancelledError
+    return 'CANCELLED'
+
+
+def _save(call, error):
+    try:
+        call.as_metric(_outcome_of(error), str(error) if error is not None else '').save()
+    except Exception:
+        # Metrics must never fail a review
+        logger.exception("Could not record LLM call metric")
+
+
+@contextmanager
+def track_llm_call(operation: str, backend, lesson_note=None, prompt: str = ''):
+    """Yield an LLMCall and store it as an LLMCallMetric when the block exits, however it exits"""
+    call = LLMCall(operation, backend, lesson_note, prompt)
+    error = None
+    try:
+        yield call
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        if call_metrics_enabled():
+            _save(call, error)
+
+
+@asynccontextmanager
+async def atrack_llm_call(operation: str, backend, lesson_note=None, prompt: str = ''):
+    """Async variant of track_llm_call"""
+    call = LLMCall(operation, backend, lesson_note, prompt)
+    error = None
+    try:
+        yield call
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        if call_metrics_enabled():
+            await sync_to_async(_save)(call, error)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(values: dict) -> str:
+    if not values:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in values.items()) + '}'
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name: str, help_text: str, series: list) -> list:
+    """series: [(labels, [(bound, cumulative_count), ...], count, total), ...]"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, buckets, count, total in series:
+        for bound, cumulative in buckets:
+            lines.append(f'{name}_bucket{_labels({**labels, "le": _number(bound)})} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {_number(float(total or 0))}')
+        lines.append(f'{name}_count{_labels(labels)} {count}')
+    return lines
+
+
+def _stored_histogram(queryset, field: str, buckets, group_by: str, label: str, lower: bool = False) -> list:
+    """Cumulative buckets of a duration field per group_by value, in one query"""
+    aggregates = {f'le_{i}': Count('id', filter=Q(**{f'{field}__lte': bound})) for i, bound in enumerate(buckets)}
+    rows = queryset.filter(**{f'{field}__isnull': False}).values(group_by).annotate(
+        count=Count('id'), total=Sum(field), **aggregates
+    ).order_by(group_by)
+    return [
+        (
+            {label: row[group_by].lower() if lower else row[group_by]},
+            [(bound, row[f'le_{i}']) for i, bound in enumerate(buckets)] + [(math.inf, row['count'])],
+            row['count'], row['total'],
+        )
+        for row in rows
+    ]
+
+
+def prometheus_text() -> str:
+    lines = []
+    calls = LLMCallMetric.objects.values('model_name', 'operation', 'parse_path', 'outcome').annotate(
+        count=Count('id'), prompt_tokens=Sum('prompt_tokens'), output_tokens=Sum('output_tokens'),
+        cost=Sum('cost_usd'),
+    ).order_by('model_name', 'operation', 'parse_path', 'outcome')
+
+    counters = [
+        ('llm_calls_total', 'LLM calls made by the review pipeline', 'count'),
+        ('llm_prompt_tokens_total', 'Prompt tokens sent (estimated where the provider reports none)', 'prompt_tokens'),
+        ('llm_output_tokens_total', 'Response tokens received (estimated where the provider reports none)',
+         'output_tokens'),
+        ('llm_cost_usd_total', 'Estimated LLM spend in USD', 'cost'),
+    ]
+    for suffix, help_text, key in counters:
+        name = f'{_PREFIX}_{suffix}'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for row in calls:
+            labels = {
+                'model': row['model_name'], 'operation': row['operation'].lower(),
+                'parse_path': row['parse_path'].lower(), 'outcome': row['outcome'].lower(),
+            }
+            lines.append(f'{name}{_labels(labels)} {_number(row[key] or 0)}')
+
+    histograms = [
+        ('llm_network_seconds', 'Time in provider requests per call, retries and backoff included',
+         'network_seconds', DEFAULT_BUCKETS),
+        ('llm_parse_seconds', 'Time parsing and validating the model response per call',
+         'parse_seconds', PARSE_BUCKETS),
+        ('llm_total_seconds', 'Whole LLM call, waiting for a call slot included', 'total_seconds', DEFAULT_BUCKETS),
+    ]
+    for suffix, help_text, field, buckets in histograms:
+        lines += _histogram_lines(
+            f'{_PREFIX}_{suffix}', help_text,
+            _stored_histogram(LLMCallMetric.objects.all(), field, buckets, 'model_name', 'model')
+        )
+    lines += _histogram_lines(
+        f'{_PREFIX}_queue_wait_seconds', 'Time review jobs waited in the queue before starting, per priority class',
+        _stored_histogram(ReviewJob.objects.all(), 'wait_seconds', QUEUE_WAIT_BUCKETS, 'priority', 'priority', lower=True)
+    )
+
+    # This process only: per-attempt latency and hedging, as used by llm_calls
+    for histogram in metrics.histograms():
+        lines += _histogram_lines(
+            f'{_PREFIX}_process_{histogram.name}', f'{histogram.name} in this worker process',
+            [({}, histogram.cumulative_buckets(), histogram.count, histogram.sum)],
+        )
+    for counter in metrics.counters():
+        name = f'{_PREFIX}_process_{counter.name}_total'
+        lines += [f'# HELP {name} {counter.name} in this worker process', f'# TYPE {name} counter',
+                  f'{name} {counter.value}']
+    return '\n'.join(lines) + '\n'
+
+
+def call_metric_stats():
+    totals = LLMCallMetric.objects.aggregate(
+        calls=Count('id'), prompt_tokens=Sum('prompt_tokens'), output_tokens=Sum('output_tokens'),
+        cost_usd=Sum('cost_usd'),
+    )
+    by_path = dict(
+        LLMCallMetric.objects.values_list('parse_path').annotate(count=Count('id')).order_by()
+    )
+    return {
+        'calls': totals['calls'],
+        'prompt_tokens': totals['prompt_tokens'] or 0,
+        'output_tokens': totals['output_tokens'] or 0,
+        'cost_usd': round(totals['cost_usd'] or 0, 4),
+        'parse_paths': by_path,
+    }
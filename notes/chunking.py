@@ -0,0 +1,250 @@
+"""
+Map-reduce helpers for reviewing very long lesson notes.
+
+Content over AI_REVIEW_CHUNK_THRESHOLD_TOKENS is split along its own section
+headings into chunks of at most AI_REVIEW_CHUNK_TOKENS, each chunk is
+reviewed by its own (parallel) LLM call, and merge_chunk_feedback() folds the
+per-chunk results back into the standard feedback structure locally, without
+another LLM round-trip.
+"""
+import math
+import re
+
+from django.conf import settings
+
+from .llm_backends import estimate_tokens
+
+# Lines that start a new section: markdown headings, "Objectives:"-style
+# labels, "Week 2 ..." / "Step 3 ..." markers and short ALL CAPS titles
+_HEADING_RES = [
+    re.compile(r'^\s{0,3}#{1,6}\s+\S'),
+    re.compile(r'^\s*[A-Za-z][\w /&()\-]{1,58}:\s*$'),
+    re.compile(r'^\s*(?:week|day|lesson|step|activity|part|section|unit|topic|period)\s+\d+\b', re.IGNORECASE),
+    re.compile(r'^\s*(?=[^a-z]*[A-Z]{3})[A-Z0-9 &/()\-:]{3,60}$'),
+]
+_PARAGRAPH_RE = re.compile(r'\n\s*\n')
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+class Chunk:
+    def __init__(self, text: str, titles: list, tokens: int):
+        self.text = text
+        self.titles = titles
+        self.tokens = tokens
+
+    @property
+    def label(self) -> str:
+        return ', '.join(title for title in self.titles if title)
+
+
+def is_heading(line: str) -> bool:
+    return bool(line.strip()) and any(pattern.match(line) for pattern in _HEADING_RES)
+
+
+def split_sections(content: str) -> list:
+    """[(title_or_None, text), ...] in document order; text includes the heading line"""
+    sections = []
+    title, lines = None, []
+    for line in content.splitlines():
+        if is_heading(line) and any(existing.strip() for existing in lines):
+            sections.append((title, '\n'.join(lines).strip()))
+            title, lines = None, []
+        if is_heading(line) and title is None:
+            title = line.strip().lstrip('#').strip().rstrip(':')
+        lines.append(line)
+    if any(existing.strip() for existing in lines):
+        sections.append((title, '\n'.join(lines).strip()))
+    return sections
+
+
+def _split_oversized(text: str, max_tokens: int, count_tokens) -> list:
+    """Break one section into pieces under max_tokens: paragraphs, then sentences, then characters"""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    for pattern in (_PARAGRAPH_RE, _SENTENCE_RE):
+        parts = [part.strip() for part in pattern.split(text) if part.strip()]
+        if len(parts) > 1:
+            joiner = '\n\n' if pattern is _PARAGRAPH_RE else ' '
+            packed = _pack(parts, max_tokens, count_tokens, joiner)
+            if len(packed) > 1:
+                pieces = []
+                for part in packed:
+                    pieces.extend(_split_oversized(part, max_tokens, count_tokens))
+                return pieces
+    # A single run-on sentence: fall back to fixed-size slices
+    width = max(1, len(text) * max_tokens // max(1, count_tokens(text)))
+    return [text[start:start + width] for start in range(0, len(text), width)]
+
+
+def _pack(parts: list, max_tokens: int, count_tokens, joiner: str) -> list:
+    """Greedily join consecutive parts while they fit in max_tokens"""
+    packed, current, current_tokens = [], [], 0
+    for part in parts:
+        # +1 leaves room for the joiner and per-part rounding in the estimate
+        tokens = count_tokens(part) + 1
+        if current and current_tokens + tokens > max_tokens:
+            packed.append(joiner.join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += tokens
+    if current:
+        packed.append(joiner.join(current))
+    return packed
+
+
+def chunk_content(content: str, max_tokens: int = None, max_chunks: int = None,
+                  count_tokens=estimate_tokens) -> list:
+    """
+    Split content into Chunks of at most max_tokens (default
+    AI_REVIEW_CHUNK_TOKENS), keeping sections whole where possible. If that
+    would produce more than max_chunks, the chunk size grows instead.
+    """
+    max_tokens = max_tokens or getattr(settings, 'AI_REVIEW_CHUNK_TOKENS', 3000)
+    max_chunks = max_chunks or getattr(settings, 'AI_REVIEW_MAX_CHUNKS', 16)
+    max_tokens = max(max_tokens, math.ceil(count_tokens(content) / max_chunks))
+    chunks = _build_chunks(content, max_tokens, count_tokens)
+    # Sections don't pack perfectly, so the even split may still need more chunks
+    while len(chunks) > max_chunks:
+        max_tokens = max(max_tokens + 1, math.ceil(max_tokens * len(chunks) / max_chunks))
+        chunks = _build_chunks(content, max_tokens, count_tokens)
+    return chunks
+
+
+def _build_chunks(content: str, max_tokens: int, count_tokens) -> list:
+    pieces = []
+    for title, text in split_sections(content):
+        for i, piece in enumerate(_split_oversized(text, max_tokens, count_tokens)):
+            pieces.append((title if i == 0 else f'{title} (cont.)' if title else None, piece))
+
+    chunks, texts, titles, tokens = [], [], [], 0
+    for title, piece in pieces:
+        piece_tokens = count_tokens(piece)
+        if texts and tokens + piece_tokens > max_tokens:
+            chunks.append(Chunk('\n\n'.join(texts), titles, tokens))
+            texts, titles, tokens = [], [], 0
+        texts.append(piece)
+        titles.append(title)
+        tokens += piece_tokens
+    if texts:
+        chunks.append(Chunk('\n\n'.join(texts), titles, tokens))
+    return chunks
+
+
+def incremental_parts(content: str, changed_indexes: list, max_tokens: int = None,
+                      count_tokens=estimate_tokens):
+    """
+    Group a note's sections for an incremental review. Returns (parts,
+    review_indexes): parts is a list of Chunks covering the whole note in
+    order - each run of unchanged sections as one outline entry, changed
+    sections packed up to max_tokens - and review_indexes says which parts
+    need reviewing.
+    """
+    max_tokens = max_tokens or getattr(settings, 'AI_REVIEW_CHUNK_TOKENS', 3000)
+    changed = set(changed_indexes)
+    parts, review_indexes = [], []
+    for i, (title, text) in enumerate(split_sections(content)):
+        tokens = count_tokens(text)
+        is_changed = i in changed
+        previous = parts[-1] if parts else None
+        joins = previous is not None and (len(parts) - 1 in review_indexes) == is_changed and (
+            not is_changed or previous.tokens + tokens <= max_tokens
+        )
+        if joins:
+            previous.text += '\n\n' + text
+            previous.titles.append(title)
+            previous.tokens += tokens
+        else:
+            if is_changed:
+                review_indexes.append(len(parts))
+            parts.append(Chunk(text, [title], tokens))
+    return parts, review_indexes
+
+
+def needs_chunking(content: str, count_tokens=estimate_tokens) -> bool:
+    threshold = getattr(settings, 'AI_REVIEW_CHUNK_THRESHOLD_TOKENS', 6000)
+    return bool(threshold) and count_tokens(content or '') > threshold
+
+
+def _interleave_unique(lists: list, limit: int) -> list:
+    """Round-robin across the per-chunk lists, dropping case-insensitive duplicates"""
+    merged, seen = [], set()
+    for depth in range(max((len(items) for items in lists), default=0)):
+        for items in lists:
+            if depth < len(items):
+                key = ' '.join(items[depth].split()).casefold()
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(items[depth])
+                    if len(merged) == limit:
+                        return merged
+    return merged
+
+
+def merge_chunk_feedback(chunks: list, results: list, list_limit: int = 5) -> dict:
+    """
+    Reduce step: combine per-chunk feedback into one standard feedback dict.
+    The score is the token-weighted mean, so long sections count for more.
+    """
+    total_tokens = sum(max(1, chunk.tokens) for chunk in chunks)
+    score = round(sum(
+        result['score'] * max(1, chunk.tokens) for chunk, result in zip(chunks, results)
+    ) / total_tokens)
+
+    paragraphs, assessments = [], []
+    for i, (chunk, result) in enumerate(zip(chunks, results), 1):
+        heading = f'Part {i} of {len(chunks)}' + (f' ({chunk.label})' if chunk.label else '')
+        paragraphs.append(f"{heading}: {result['feedback_text']}")
+        if result['overall_assessment'] not in assessments:
+            assessments.append(result['overall_assessment'])
+
+    part_scores = ', '.join(str(result['score']) for result in results)
+    return {
+        'feedback_text': '\n\n'.join(paragraphs),
+        'score': score,
+        'strengths': _interleave_unique([r['strengths'] for r in results], list_limit),
+        'suggestions': _interleave_unique([r['suggestions'] for r in results], list_limit),
+        'areas_for_improvement': _interleave_unique([r['areas_for_improvement'] for r in results], list_limit),
+        'overall_assessment': f"Reviewed in {len(chunks)} parts (part scores: {part_scores}). "
+                              + ' '.join(assessments),
+    }
+
+
+_UPDATED_PREFIX = 'Updated section'
+_REREVIEWED_RE = re.compile(r'^Re-reviewed \d+ of \d+ sections after edits \([^)]*\)\. ')
+
+
+def merge_incremental_feedback(previous: dict, chunks: list, results: list, unchanged_tokens: int,
+                               section_count: int, list_limit: int = 5) -> dict:
+    """
+    Fold reviews of the changed parts of a note into its previous feedback.
+    The score is the token-weighted mean of the previous score (standing in
+    for the unchanged sections) and the part scores; list items from the
+    new reviews lead. Earlier update paragraphs for the same sections are replaced.
+    """
+    weights = [max(1, unchanged_tokens)] + [max(1, chunk.tokens) for chunk in chunks]
+    scores = [previous['score']] + [result['score'] for result in results]
+    score = round(sum(s * w for s, w in zip(scores, weights)) / sum(weights))
+
+    headings = [f"{_UPDATED_PREFIX}: {chunk.label or 'untitled'}" for chunk in chunks]
+    paragraphs = [
+        paragraph for paragraph in previous['feedback_text'].split('\n\n')
+        if not any(paragraph.startswith(heading + ':') for heading in headings)
+    ]
+    paragraphs.extend(f"{heading}: {result['feedback_text']}" for heading, result in zip(headings, results))
+
+    changed_sections = sum(len(chunk.titles) for chunk in chunks)
+    part_scores = ', '.join(str(result['score']) for result in results)
+    assessment = _REREVIEWED_RE.sub('', previous['overall_assessment'])
+
+    def merged(key):
+        return _interleave_unique([r[key] for r in results] + [previous[key]], list_limit)
+
+    return {
+        'feedback_text': '\n\n'.join(paragraphs),
+        'score': score,
+        'strengths': merged('strengths'),
+        'suggestions': merged('suggestions'),
+        'areas_for_improvement': merged('areas_for_improvement'),
+        'overall_assessment': f"Re-reviewed {changed_sections} of {section_count} sections after edits "
+                              f"(part scores: {part_scores}). {assessment}",
+    }
@@ -0,0 +1,205 @@
+import copy
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CachedFeedback
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# How often (in stores) the persistent tier is swept for expired/excess rows
+PURGE_EVERY = 100
+
+
+def normalize_text(value) -> str:
+    """Collapse whitespace so trivially re-formatted notes hash the same"""
+    return _WHITESPACE_RE.sub(' ', str(value or '')).strip()
+
+
+def make_cache_key(lesson_note, model_name: str, prompt_version: int) -> str:
+    """
+    Content-addressed key for a review: sha256 over the normalized prompt inputs.
+    Subject, grade level and term are case-folded; content keeps its case.
+    """
+    parts = {
+        'subject': normalize_text(lesson_note.subject).casefold(),
+        'grade_level': normalize_text(lesson_note.grade_level).casefold(),
+        'term': normalize_text(lesson_note.term).casefold(),
+        'content': normalize_text(lesson_note.content),
+        'model': model_name,
+        'prompt_version': prompt_version,
+    }
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class FeedbackCache:
+    """
+    Two-tier cache for generated feedback:
+    a bounded in-process LRU in front of the CachedFeedback table.
+    Both tiers honour the same TTL.
+    """
+
+    def __init__(self, max_memory_entries: int = 512, ttl_seconds: int = 7 * 24 * 3600,
+                 max_db_entries: int = 50000):
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores_since_purge = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return cached feedback for key, or None on a miss"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, data = entry
+                if expires_at > time.monotonic():
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return copy.deepcopy(data)
+                del self._memory[key]
+
+        data = self._get_from_db(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+        self._remember(key, data)
+        return copy.deepcopy(data)
+
+    def set(self, key: str, data: Dict[str, Any], model_name: str, prompt_version: int):
+        """Store feedback in both tiers"""
+        self._remember(key, data)
+        try:
+            CachedFeedback.objects.update_or_create(
+                key=key,
+                defaults={
+                    'model_name': model_name,
+                    'prompt_version': prompt_version,
+                    'payload': data,
+                    'expires_at': timezone.now() + timedelta(seconds=self.ttl_seconds),
+                }
+            )
+        except DatabaseError as e:
+            logger.warning("Feedback cache write failed: %s", e)
+            return
+
+        with self._lock:
+            self.stores += 1
+            self._stores_since_purge += 1
+            should_purge = self._stores_since_purge >= PURGE_EVERY
+            if should_purge:
+                self._stores_since_purge = 0
+        if should_purge:
+            self.purge()
+
+    def purge(self) -> int:
+        """Delete expired rows and trim the persistent tier to max_db_entries"""
+        try:
+            deleted, _ = CachedFeedback.objects.filter(expires_at__lte=timezone.now()).delete()
+            excess = CachedFeedback.objects.count() - self.max_db_entries
+            if excess > 0:
+                # Evict least recently used entries first; never-hit ones count from their creation
+                stale_ids = list(
+                    CachedFeedback.objects.order_by(Coalesce('last_hit_at', 'created_at'))
+                    .values_list('id', flat=True)[:excess]
+                )
+                extra, _ = CachedFeedback.objects.filter(id__in=stale_ids).delete()
+                deleted += extra
+            return deleted
+        except DatabaseError as e:
+            logger.warning("Feedback cache purge failed: %s", e)
+            return 0
+
+    def clear(self):
+        """Empty the in-process tier and reset counters (persistent tier is untouched)"""
+        with self._lock:
+            self._memory.clear()
+            self.memory_hits = self.db_hits = self.misses = self.stores = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus persistent tier totals"""
+        with self._lock:
+            stats = {
+                'memory_entries': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'llm_calls_saved': self.memory_hits + self.db_hits,
+            }
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['llm_calls_saved'] / lookups, 4) if lookups else 0.0
+        try:
+            totals = CachedFeedback.objects.aggregate(total_hits=Sum('hit_count'))
+            stats['db_entries'] = CachedFeedback.objects.count()
+            stats['db_total_hits'] = totals['total_hits'] or 0
+        except DatabaseError:
+            stats['db_entries'] = None
+            stats['db_total_hits'] = None
+        return stats
+
+    def _remember(self, key: str, data: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(data))
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _get_from_db(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            entry = CachedFeedback.objects.filter(key=key).first()
+            if entry is None:
+                return None
+            if entry.is_expired:
+                entry.delete()
+                return None
+            CachedFeedback.objects.filter(pk=entry.pk).update(
+                hit_count=F('hit_count') + 1,
+                last_hit_at=timezone.now()
+            )
+            return entry.payload
+        except DatabaseError as e:
+            logger.warning("Feedback cache read failed: %s", e)
+            return None
+
+
+_feedback_cache = None
+_feedback_cache_lock = threading.Lock()
+
+
+def get_feedback_cache() -> Optional[FeedbackCache]:
+    """Process-wide cache instance configured from settings, or None if disabled"""
+    global _feedback_cache
+    if not getattr(settings, 'AI_FEEDBACK_CACHE_ENABLED', True):
+        return None
+    if _feedback_cache is None:
+        with _feedback_cache_lock:
+            if _feedback_cache is None:
+                _feedback_cache = FeedbackCache(
+                    max_memory_entries=getattr(settings, 'AI_FEEDBACK_CACHE_MEMORY_SIZE', 512),
+                    ttl_seconds=getattr(settings, 'AI_FEEDBACK_CACHE_TTL', 7 * 24 * 3600),
+                    max_db_entries=getattr(settings, 'AI_FEEDBACK_CACHE_MAX_ENTRIES', 50000),
+                )
+    return _feedback_cache
@@ -0,0 +1,104 @@
+"""
+Content fingerprints for skipping or narrowing repeat reviews.
+
+A lesson note keeps a fingerprint of its material content and one hash per
+section (as split by chunking.split_sections). "Material" ignores case,
+whitespace, punctuation and markdown markup, so re-formatting a note or
+fixing its punctuation leaves every hash unchanged. Feedback records the
+hashes of the content it reviewed; plan_review() compares the two to decide
+whether a regeneration can reuse the previous review, re-review only the
+sections that changed, or needs a full review.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+
+from .chunking import split_sections
+from .feedback_cache import normalize_text
+from .llm_backends import estimate_tokens
+
+_IMMATERIAL_RE = re.compile(r'[\W_]+')
+
+
+def material_text(value) -> str:
+    """Case-folded words only: what a review actually depends on"""
+    return ' '.join(_IMMATERIAL_RE.sub(' ', str(value or '')).casefold().split())
+
+
+def _digest(value: str, length: int = 64) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:length]
+
+
+def section_hashes(content: str) -> list:
+    """[{'title', 'hash', 'tokens'}, ...] per section in document order"""
+    return [
+        {'title': title, 'hash': _digest(material_text(text), 16), 'tokens': estimate_tokens(text)}
+        for title, text in split_sections(content or '')
+    ]
+
+
+def content_fingerprint(lesson_note, sections: list = None) -> str:
+    """
+    64 hex characters: 16 for the header (subject, grade level, term) then
+    48 for the section hashes, so a header change can be told apart
+    """
+    if sections is None:
+        sections = section_hashes(lesson_note.content)
+    header = '|'.join(
+        normalize_text(value).casefold() for value in (lesson_note.subject, lesson_note.grade_level, lesson_note.term)
+    )
+    return _digest(header, 16) + _digest(','.join(section['hash'] for section in sections), 48)
+
+
+class ReviewPlan:
+    """
+    mode is 'unchanged' (reuse the previous review), 'incremental' (review
+    changed_indexes only and merge) or 'full'.
+    """
+    def __init__(self, mode: str, sections: list, changed_indexes: list = ()):
+        self.mode = mode
+        self.sections = sections
+        self.changed_indexes = list(changed_indexes)
+
+    @property
+    def changed_tokens(self) -> int:
+        return sum(self.sections[i]['tokens'] for i in self.changed_indexes)
+
+    @property
+    def unchanged_tokens(self) -> int:
+        return sum(section['tokens'] for section in self.sections) - self.changed_tokens
+
+
+def plan_review(lesson_note, previous_feedback, match_header: bool = True) -> ReviewPlan:
+    """
+    Decide how much of lesson_note needs reviewing given its latest AI
+    Feedback (or None). Reuse and incremental review need the same subject,
+    grade level and term (unless match_header is off, as for the review of
+    a near-duplicate note); incremental review also needs section hashes on
+    the previous review and at most AI_INCREMENTAL_MAX_CHANGED_RATIO of the
+    note's tokens changed. Sections are matched by hash, so moving a
+    section around does not count as a change.
+    """
+    sections = lesson_note.section_hashes or section_hashes(lesson_note.content)
+    fingerprint = lesson_note.content_fingerprint or content_fingerprint(lesson_note, sections)
+    if previous_feedback is None or not previous_feedback.content_fingerprint:
+        return ReviewPlan('full', sections)
+    same_header = not match_header or previous_feedback.content_fingerprint[:16] == fingerprint[:16]
+    if same_header and previous_feedback.content_fingerprint[16:] == fingerprint[16:]:
+        return ReviewPlan('unchanged', sections)
+
+    previous_sections = previous_feedback.section_hashes or []
+    if not previous_sections or not same_header:
+        return ReviewPlan('full', sections)
+
+    reviewed = {section['hash'] for section in previous_sections}
+    changed = [i for i, section in enumerate(sections) if section['hash'] not in reviewed]
+    plan = ReviewPlan('incremental', sections, changed)
+    total = max(1, plan.changed_tokens + plan.unchanged_tokens)
+    max_ratio = getattr(settings, 'AI_INCREMENTAL_MAX_CHANGED_RATIO', 0.6)
+    if not changed or plan.changed_tokens / total > max_ratio:
+        # Only deletions, or most of the note rewritten: the old review no longer fits
+        return ReviewPlan('full', sections)
+    return plan
+
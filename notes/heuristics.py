@@ -0,0 +1,171 @@
+"""
+Local heuristic scoring of lesson notes, for an instant provisional score.
+
+No LLM is involved: a note is scored from its structure (objectives,
+activities, assessment, materials and differentiation sections; headings and
+lists), its length and its readability. Counting runs over a whole batch at
+once: the notes are lower-cased and joined into one byte array, and NumPy
+finds word, sentence, syllable and line boundaries across all of them in a
+few vectorised passes, so thousands of notes score in well under a second.
+Provisional scores are stored as HEURISTIC Feedback and replaced by the AI
+review once it lands; the same score stands in for the model when a review
+falls back.
+"""
+import numpy as np
+
+# Evidence of each part of a lesson plan, weighted like the AI prompt's
+# criteria. Plain substring checks: far faster than regex alternations when
+# most notes lack a section and the whole text has to be scanned.
+SECTION_KEYWORDS = {
+    'objectives': ('objective', 'learning outcome', 'by the end of', ' aim', ' goal'),
+    'activities': ('activit', 'procedure', 'introduction', 'step 1', 'group work', 'pairs', 'demonstrat'),
+    'assessment': ('assess', 'evaluat', 'quiz', 'exit ticket', ' test', 'homework', 'exercise'),
+    'materials': ('material', 'resource', 'teaching aid', 'chart', 'worksheet', 'textbook'),
+    'differentiation': ('differentiat', 'extension', 'support for', 'inclusi', 'mixed abilit', 'struggling'),
+}
+SECTION_LABELS = {
+    'objectives': 'learning objectives',
+    'activities': 'lesson activities',
+    'assessment': 'an assessment',
+    'materials': 'teaching materials',
+    'differentiation': 'differentiation for different learners',
+}
+SECTION_WEIGHTS = np.array([20.0, 20.0, 15.0, 5.0, 10.0])
+SECTION_NAMES = list(SECTION_KEYWORDS)
+
+_A, _Z = ord('a'), ord('z')
+_VOWELS = np.zeros(256, dtype=bool)
+_VOWELS[list(b'aeiouy')] = True
+_SENTENCE_END = np.zeros(256, dtype=bool)
+_SENTENCE_END[list(b'.!?')] = True
+_LIST_MARKERS = np.zeros(256, dtype=bool)
+_LIST_MARKERS[list(b'-*0123456789')] = True
+_SEPARATOR = b'\x00'
+
+
+def _segment_sums(mask, starts):
+    """Per-note sums of a boolean mask over the joined byte array"""
+    if not len(starts):
+        return np.zeros(0, dtype=np.int64)
+    return np.add.reduceat(mask, starts, dtype=np.int64)
+
+
+def _shift_right(array):
+    shifted = np.zeros_like(array)
+    shifted[1:] = array[:-1]
+    return shifted
+
+
+def extract_features(contents) -> dict:
+    """
+    Feature columns (NumPy arrays, one entry per note) for a list of note
+    contents: words, sentences, syllables, lines, list_items, headings and
+    one 0/1 column per SECTION_KEYWORDS entry.
+    """
+    lowered = [(content or '').lower() for content in contents]
+    encoded = [text.encode('utf-8', 'ignore') for text in lowered]
+    lengths = np.fromiter((len(data) + 1 for data in encoded), dtype=np.int64, count=len(encoded))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(encoded) else np.zeros(0, dtype=np.int64)
+    data = np.frombuffer(_SEPARATOR.join(encoded) + _SEPARATOR, dtype=np.uint8)
+
+    letters = (data >= _A) & (data <= _Z)
+    vowels = _VOWELS.take(data) & letters
+    # Neighbouring bytes and masks, with the separator beyond either end
+    previous = _shift_right(data)
+    following = np.zeros_like(data)
+    following[:-1] = data[1:]
+    line_start = (previous == ord('\n')) | (previous == 0)
+    following_break = (following == ord('\n')) | (following == 0)
+
+    words = _segment_sums(letters & ~_shift_right(letters), starts)
+    # A sentence ends at . ! or ? followed by whitespace or the end of the note
+    sentences = _segment_sums(_SENTENCE_END.take(data) & (following_break | (following == ord(' '))), starts)
+    # Syllables approximated by runs of vowels
+    syllables = _segment_sums(vowels & ~_shift_right(vowels), starts)
+    lines = _segment_sums(line_start & (data != ord('\n')) & (data != 0), starts)
+    list_items = _segment_sums(line_start & _LIST_MARKERS.take(data), starts)
+    # "Heading:" lines (a colon ending the line) and markdown "# Heading" lines
+    headings = _segment_sums(
+        ((data == ord(':')) & following_break) | (line_start & (data == ord('#'))), starts
+    )
+
+    features = {
+        'words': words,
+        'sentences': np.maximum(sentences, (words > 0).astype(np.int64)),
+        'syllables': np.maximum(syllables, words),
+        'lines': lines,
+        'list_items': list_items,
+        'headings': headings,
+    }
+    for name, keywords in SECTION_KEYWORDS.items():
+        features[name] = np.fromiter(
+            (1.0 if any(keyword in text for keyword in keywords) else 0.0 for text in lowered),
+            dtype=np.float64, count=len(lowered)
+        )
+    return features
+
+
+def score_features(features: dict) -> np.ndarray:
+    """Scores 1-100 from extract_features() output, fully vectorised"""
+    words = features['words'].astype(np.float64)
+    sentences = np.maximum(features['sentences'], 1).astype(np.float64)
+    per_word = np.maximum(words, 1.0)
+
+    sections = np.stack([features[name] for name in SECTION_NAMES], axis=1)
+    section_score = sections @ SECTION_WEIGHTS  # up to 70
+
+    # Length: ramps up to 150 words, full credit to 1500, slowly less beyond
+    length_score = 15.0 * np.clip(words / 150.0, 0.0, 1.0) * np.clip(1500.0 / np.maximum(words, 1500.0), 0.6, 1.0)
+
+    # Flesch reading ease; lesson notes read best around 40-80
+    reading_ease = 206.835 - 1.015 * (words / sentences) - 84.6 * (features['syllables'] / per_word)
+    readability_score = 10.0 * np.clip(1.0 - np.abs(np.clip(reading_ease, 0, 100) - 60.0) / 60.0, 0.0, 1.0)
+
+    # Structure: headings and lists make a plan easy to follow
+    structure = np.minimum(features['headings'], 5) + np.minimum(features['list_items'], 5) / 2.0
+    structure_score = np.clip(structure, 0.0, 5.0)
+
+    scores = 10.0 + section_score + length_score + readability_score + structure_score
+    scores = np.where(words == 0, 1.0, scores)
+    return np.clip(np.rint(scores * 0.9), 1, 100).astype(np.int64)
+
+
+def score_contents(contents) -> np.ndarray:
+    return score_features(extract_features(contents))
+
+
+def heuristic_feedback(contents) -> list:
+    """Structured feedback dicts (the AI feedback shape) for a batch of note contents"""
+    features = extract_features(contents)
+    scores = score_features(features)
+    results = []
+    for i, score in enumerate(scores):
+        present = [name for name in SECTION_NAMES if features[name][i]]
+        missing = [name for name in SECTION_NAMES if not features[name][i]]
+        words = int(features['words'][i])
+
+        strengths = [f"Includes {SECTION_LABELS[name]}" for name in present[:3]] or ['Lesson note submitted for review']
+        if features['headings'][i] >= 3 or features['list_items'][i] >= 3:
+            strengths.append('Clearly structured with headings or lists')
+        suggestions = [f"Add {SECTION_LABELS[name]}" for name in missing[:3]]
+        if words < 150:
+            suggestions.append('Expand the note with more detail on how the lesson runs')
+        areas = [f"No clear {SECTION_LABELS[name]} found" for name in missing[:2]] or ['Detailed pedagogy is assessed by the AI review']
+
+        results.append({
+            'feedback_text': (
+                f"Provisional score from an automatic check of structure, length ({words} words) and "
+                f"readability. Sections found: {', '.join(present) or 'none'}. "
+                "The full AI review will replace this."
+            ),
+            'score': int(score),
+            'strengths': strengths[:5],
+            'suggestions': (suggestions or ['Await the AI review for detailed suggestions'])[:5],
+            'areas_for_improvement': areas[:5],
+            'overall_assessment': 'Provisional automatic assessment; AI review pending',
+        })
+    return results
+
+
+def heuristic_score(content: str) -> int:
+    return int(score_contents([content])[0])
@@ -0,0 +1,358 @@
+"""
+Pluggable LLM backends behind AIFeedbackGenerator, selected by AI_FEEDBACK_BACKEND:
+
+- 'gemini': Google Gemini via google.generativeai (production)
+- 'fake':   deterministic local stub with configurable latency/error
+            distributions, for load tests and benchmarks without network
+- 'replay': serves responses previously recorded with AI_RECORD_RESPONSES_TO
+
+Backends take a prompt plus a plain dict of generation settings and return
+an LLMResponse. Timeouts surface as LLMTimeout and retryable provider errors
+(throttling, 5xx) as LLMTransientError, whatever the backend.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from decouple import config
+from django.core.exceptions import ImproperlyConfigured
+
+GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
+
+
+class LLMError(Exception):
+    """Base class for backend failures"""
+
+
+class LLMTimeout(LLMError):
+    """The request overran its timeout"""
+
+
+class LLMTransientError(LLMError):
+    """A retryable failure such as throttling or a provider 5xx"""
+
+
+class LLMResponse:
+    def __init__(self, text: str, prompt_tokens: int = None, output_tokens: int = None, latency: float = None):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.latency = latency
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for backends without a tokenizer"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+class LLMBackend:
+    name = 'base'
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @property
+    def cache_namespace(self) -> str:
+        """Model identity used in feedback cache keys, so backends never share entries"""
+        return f'{self.name}:{self.model_name}'
+
+    def generate(self, prompt: str, generation_config: dict, timeout: float = None) -> LLMResponse:
+        raise NotImplementedError
+
+    async def agenerate(self, prompt: str, generation_config: dict, timeout: float = None) -> LLMResponse:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, generation_config: dict, timeout: float = None):
+        """Yield the response text in chunks; default is a single chunk"""
+        yield self.generate(prompt, generation_config, timeout=timeout).text
+
+    def count_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
+
+class GeminiBackend(LLMBackend):
+    name = 'gemini'
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        import google.generativeai as genai
+        if not GEMINI_API_KEY:
+            raise ImproperlyConfigured("GEMINI_API_KEY must be set to use the gemini backend")
+        genai.configure(api_key=GEMINI_API_KEY)
+        self.model = genai.GenerativeModel(model_name)
+
+    @property
+    def cache_namespace(self) -> str:
+        return self.model_name
+
+    def generate(self, prompt, generation_config, timeout=None):
+        started = time.monotonic()
+        with _translate_gemini_errors():
+            response = self.model.generate_content(
+                prompt, generation_config=generation_config, **self._request_options(timeout)
+            )
+        return self._to_response(response, time.monotonic() - started)
+
+    async def agenerate(self, prompt, generation_config, timeout=None):
+        started = time.monotonic()
+        with _translate_gemini_errors():
+            response = await self.model.generate_content_async(
+                prompt, generation_config=generation_config, **self._request_options(timeout)
+            )
+        return self._to_response(response, time.monotonic() - started)
+
+    def stream(self, prompt, generation_config, timeout=None):
+        with _translate_gemini_errors():
+            response = self.model.generate_content(
+                prompt, generation_config=generation_config, stream=True, **self._request_options(timeout)
+            )
+            for chunk in response:
+                yield chunk.text
+
+    def count_tokens(self, text):
+        try:
+            with _translate_gemini_errors():
+                return self.model.count_tokens(text).total_tokens
+        except LLMError:
+            return estimate_tokens(text)
+
+    def _request_options(self, timeout):
+        return {'request_options': {'timeout': timeout}} if timeout is not None else {}
+
+    def _to_response(self, response, latency):
+        usage = getattr(response, 'usage_metadata', None)
+        return LLMResponse(
+            response.text,
+            prompt_tokens=getattr(usage, 'prompt_token_count', None),
+            output_tokens=getattr(usage, 'candidates_token_count', None),
+            latency=latency,
+        )
+
+@contextmanager
+def _translate_gemini_errors():
+    """Map google.api_core exceptions onto the backend-neutral LLMError types"""
+    from google.api_core import exceptions as google_exceptions
+    try:
+        yield
+    except google_exceptions.DeadlineExceeded as e:
+        raise LLMTimeout(str(e)) from e
+    except (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError) as e:
+        raise LLMTransientError(str(e)) from e
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic stand-in for Gemini. The response is derived from the prompt
+    hash, so the same note always gets the same feedback. Latency is log-normal
+    around `latency` seconds (sigma 0 = fixed) and `error_rate` of calls raise
+    LLMTransientError; both are drawn from a seeded RNG for repeatable runs.
+    """
+    name = 'fake'
+
+    def __init__(self, model_name: str, latency: float = 0.5, latency_sigma: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        super().__init__(model_name)
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def generate(self, prompt, generation_config, timeout=None):
+        latency, fail = self._draw()
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise LLMTimeout(f"Fake backend latency {latency:.2f}s exceeded timeout {timeout}s")
+        time.sleep(latency)
+        if fail:
+            raise LLMTransientError("Fake backend injected error")
+        return self._respond(prompt, latency)
+
+    async def agenerate(self, prompt, generation_config, timeout=None):
+        latency, fail = self._draw()
+        if timeout is not None and latency > timeout:
+            await asyncio.sleep(timeout)
+            raise LLMTimeout(f"Fake backend latency {latency:.2f}s exceeded timeout {timeout}s")
+        await asyncio.sleep(latency)
+        if fail:
+            raise LLMTransientError("Fake backend injected error")
+        return self._respond(prompt, latency)
+
+    def stream(self, prompt, generation_config, timeout=None):
+        response = self.generate(prompt, generation_config, timeout=timeout)
+        text = response.text
+        for start in range(0, len(text), 24):
+            yield text[start:start + 24]
+
+    def _draw(self):
+        with self._rng_lock:
+            if self.latency_sigma > 0:
+                latency = self.latency * self._rng.lognormvariate(0, self.latency_sigma)
+            else:
+                latency = self.latency
+            fail = self._rng.random() < self.error_rate
+        return latency, fail
+
+    def _respond(self, prompt, latency):
+        digest = prompt_hash(prompt)
+        score = 50 + int(digest[:4], 16) % 46
+        payload = {
+            'feedback_text': f'Deterministic review {digest[:8]}: the lesson is well organised '
+                             f'and objectives are stated; assessment could be more varied.',
+            'score': score,
+            'strengths': ['Clear lesson structure', 'Stated learning objectives'],
+            'suggestions': ['Add a group activity', 'Include an exit ticket'],
+            'areas_for_improvement': ['Differentiation for mixed abilities'],
+            'overall_assessment': f'Synthetic assessment (score {score})',
+        }
+        text = f"```json\n{json.dumps(payload, indent=2)}\n```"
+        return LLMResponse(text, estimate_tokens(prompt), estimate_tokens(text), latency)
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Serves recorded responses from a JSONL file written by RecordingBackend.
+    Prompts seen during recording get their own response back; unseen prompts
+    get a recording picked deterministically by prompt hash. Recorded latency
+    is replayed unless replay_latency is False.
+    """
+    name = 'replay'
+
+    def __init__(self, model_name: str, path: str, replay_latency: bool = True):
+        super().__init__(model_name)
+        self.replay_latency = replay_latency
+        self.by_hash = {}
+        self.records = []
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        self.records.append(record)
+                        self.by_hash.setdefault(record['prompt_hash'], record)
+        except OSError as e:
+            raise ImproperlyConfigured(f"Cannot read replay file {path}: {e}")
+        if not self.records:
+            raise ImproperlyConfigured(f"Replay file {path} contains no recordings")
+
+    def generate(self, prompt, generation_config, timeout=None):
+        record = self._lookup(prompt)
+        latency = record.get('latency') or 0.0
+        if self.replay_latency:
+            if timeout is not None and latency > timeout:
+                time.sleep(timeout)
+                raise LLMTimeout(f"Recorded latency {latency:.2f}s exceeded timeout {timeout}s")
+            time.sleep(latency)
+        return self._to_response(record)
+
+    async def agenerate(self, prompt, generation_config, timeout=None):
+        record = self._lookup(prompt)
+        latency = record.get('latency') or 0.0
+        if self.replay_latency:
+            if timeout is not None and latency > timeout:
+                await asyncio.sleep(timeout)
+                raise LLMTimeout(f"Recorded latency {latency:.2f}s exceeded timeout {timeout}s")
+            await asyncio.sleep(latency)
+        return self._to_response(record)
+
+    def _lookup(self, prompt):
+        digest = prompt_hash(prompt)
+        record = self.by_hash.get(digest)
+        if record is None:
+            record = self.records[int(digest[:8], 16) % len(self.records)]
+        return record
+
+    def _to_response(self, record):
+        return LLMResponse(
+            record['text'], record.get('prompt_tokens'), record.get('output_tokens'), record.get('latency')
+        )
+
+
+class RecordingBackend(LLMBackend):
+    """Wraps another backend and appends every response to a JSONL file for ReplayBackend"""
+
+    def __init__(self, inner: LLMBackend, path: str):
+        super().__init__(inner.model_name)
+        self.inner = inner
+        self.name = inner.name
+        self.path = path
+        self._lock = threading.Lock()
+
+    @property
+    def cache_namespace(self):
+        return self.inner.cache_namespace
+
+    def generate(self, prompt, generation_config, timeout=None):
+        response = self.inner.generate(prompt, generation_config, timeout=timeout)
+        self._record(prompt, response)
+        return response
+
+    async def agenerate(self, prompt, generation_config, timeout=None):
+        response = await self.inner.agenerate(prompt, generation_config, timeout=timeout)
+        self._record(prompt, response)
+        return response
+
+    def stream(self, prompt, generation_config, timeout=None):
+        started = time.monotonic()
+        chunks = []
+        for chunk in self.inner.stream(prompt, generation_config, timeout=timeout):
+            chunks.append(chunk)
+            yield chunk
+        self._record(prompt, LLMResponse(''.join(chunks), latency=time.monotonic() - started))
+
+    def count_tokens(self, text):
+        return self.inner.count_tokens(text)
+
+    def _record(self, prompt, response):
+        line = json.dumps({
+            'prompt_hash': prompt_hash(prompt),
+            'model': self.model_name,
+            'text': response.text,
+            'prompt_tokens': response.prompt_tokens,
+            'output_tokens': response.output_tokens,
+            'latency': response.latency,
+        })
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def build_backend(name: str, model_name: str, options: dict = None) -> LLMBackend:
+    """Construct a backend by name; options override the AI_FAKE_* / AI_REPLAY_* settings"""
+    from django.conf import settings
+    options = options or {}
+    if name == 'gemini':
+        backend = GeminiBackend(model_name)
+    elif name == 'fake':
+        backend = FakeBackend(
+            model_name,
+            latency=options.get('latency', getattr(settings, 'AI_FAKE_LATENCY', 0.5)),
+            latency_sigma=options.get('latency_sigma', getattr(settings, 'AI_FAKE_LATENCY_SIGMA', 0.0)),
+            error_rate=options.get('error_rate', getattr(settings, 'AI_FAKE_ERROR_RATE', 0.0)),
+            seed=options.get('seed', getattr(settings, 'AI_FAKE_SEED', 0)),
+        )
+    elif name == 'replay':
+        path = options.get('path', getattr(settings, 'AI_REPLAY_FILE', ''))
+        if not path:
+            raise ImproperlyConfigured("AI_REPLAY_FILE must be set to use the replay backend")
+        backend = ReplayBackend(
+            model_name, path,
+            replay_latency=options.get('replay_latency', getattr(settings, 'AI_REPLAY_LATENCY', True)),
+        )
+    else:
+        raise ImproperlyConfigured(f"Unknown AI_FEEDBACK_BACKEND: {name}")
+
+    record_to = options.get('record_to', getattr(settings, 'AI_RECORD_RESPONSES_TO', ''))
+    if record_to and name != 'replay':
+        backend = RecordingBackend(backend, record_to)
+    return backend
@@ -0,0 +1,259 @@
+"""
+Resilient provider calls used by AIFeedbackGenerator.
+
+Each attempt gets its own deadline (AI_CALL_TIMEOUT, capped by what is left
+of the review's stage deadline) and passes llm_guard (rate limiter + circuit
+breaker). Transient failures and per-attempt timeouts are retried up to
+AI_RETRY_ATTEMPTS times with full-jitter exponential backoff. With hedging
+enabled (AI_HEDGE_DELAY > 0), an attempt that has not answered after the
+hedge delay - the observed AI_HEDGE_PERCENTILE call latency once enough
+samples exist - gets a second, identical request; the first answer wins and
+the other is cancelled (async) or abandoned (sync, its result is dropped).
+Hedges cost extra provider calls, so they also draw from the rate limiter.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from .llm_backends import LLMTimeout, LLMTransientError
+from .metrics import metrics
+from .rate_limits import CircuitOpen, RateLimited, allm_guard, llm_guard
+
+# Own backpressure signals: retrying them immediately would defeat their purpose
+_NOT_RETRIED = (RateLimited, CircuitOpen)
+
+
+class CallPolicy:
+    def __init__(self, call_timeout: float = 0, retries: int = 2, base_delay: float = 0.5,
+                 max_delay: float = 8.0, hedge_delay: float = 0, hedge_percentile: float = 95,
+                 hedge_min_samples: int = 50, rate_limit_wait: float = 5):
+        self.call_timeout = call_timeout
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.rate_limit_wait = rate_limit_wait
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        options = {
+            'call_timeout': getattr(settings, 'AI_CALL_TIMEOUT', 0),
+            'retries': getattr(settings, 'AI_RETRY_ATTEMPTS', 2),
+            'base_delay': getattr(settings, 'AI_RETRY_BASE_DELAY', 0.5),
+            'max_delay': getattr(settings, 'AI_RETRY_MAX_DELAY', 8.0),
+            'hedge_delay': getattr(settings, 'AI_HEDGE_DELAY', 0),
+            'hedge_percentile': getattr(settings, 'AI_HEDGE_PERCENTILE', 95),
+            'hedge_min_samples': getattr(settings, 'AI_HEDGE_MIN_SAMPLES', 50),
+            'rate_limit_wait': getattr(settings, 'AI_RATE_LIMIT_MAX_WAIT', 5),
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    def attempt_timeout(self, deadline):
+        """Timeout for the next attempt; raises LLMTimeout if the deadline has passed"""
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeout("Review deadline passed before the LLM request was sent")
+        if self.call_timeout:
+            return min(self.call_timeout, remaining) if remaining is not None else self.call_timeout
+        return remaining
+
+    def backoff(self, retry: int) -> float:
+        """Full jitter: uniform over [0, min(max_delay, base * 2^retry)]"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+    def current_hedge_delay(self):
+        """Seconds to wait before hedging, or None if hedging is off"""
+        if not self.hedge_delay:
+            return None
+        if self.hedge_percentile and metrics.llm_call_seconds.sample_count() >= self.hedge_min_samples:
+            observed = metrics.llm_call_seconds.percentile(self.hedge_percentile)
+            if observed:
+                return observed
+        return self.hedge_delay
+
+    def max_wait(self, deadline) -> float:
+        """How long an attempt may wait on the shared rate limiter"""
+        if deadline is None:
+            return self.rate_limit_wait
+        return min(self.rate_limit_wait, max(0.0, deadline - time.monotonic()))
+
+
+def call_llm(backend, prompt, generation_config, reserved_tokens, deadline=None, policy=None):
+    """Blocking provider call with retries and optional hedging; returns an LLMResponse"""
+    policy = policy or CallPolicy.from_settings()
+
+    def attempt(timeout):
+        with llm_guard(reserved_tokens, policy.max_wait(deadline)) as guard:
+            started = time.monotonic()
+            try:
+                response = backend.generate(prompt, generation_config, timeout=timeout)
+            finally:
+                metrics.llm_call_seconds.observe(time.monotonic() - started)
+            guard.settle(response)
+        return response
+
+    started = time.monotonic()
+    retry = 0
+    while True:
+        timeout = policy.attempt_timeout(deadline)
+        try:
+            hedge_delay = policy.current_hedge_delay()
+            if hedge_delay is None:
+                response = attempt(timeout)
+            else:
+                response = _hedged(attempt, timeout, hedge_delay)
+            metrics.llm_review_seconds.observe(time.monotonic() - started)
+            return response
+        except _NOT_RETRIED:
+            raise
+        except (LLMTransientError, LLMTimeout):
+            retry += 1
+            delay = policy.backoff(retry)
+            if retry > policy.retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            metrics.llm_retries.inc()
+            time.sleep(delay)
+
+
+async def acall_llm(backend, prompt, generation_config, reserved_tokens, deadline=None, policy=None):
+    """asyncio counterpart of call_llm; losing hedges are cancelled"""
+    policy = policy or CallPolicy.from_settings()
+
+    async def attempt(timeout):
+        async with allm_guard(reserved_tokens, policy.max_wait(deadline)) as guard:
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    backend.agenerate(prompt, generation_config, timeout=timeout), timeout
+                )
+            finally:
+                metrics.llm_call_seconds.observe(time.monotonic() - started)
+            await sync_to_async(guard.settle)(response)
+        return response
+
+    started = time.monotonic()
+    retry = 0
+    while True:
+        timeout = policy.attempt_timeout(deadline)
+        try:
+            hedge_delay = policy.current_hedge_delay()
+            if hedge_delay is None:
+                response = await attempt(timeout)
+            else:
+                response = await _ahedged(attempt, timeout, hedge_delay)
+            metrics.llm_review_seconds.observe(time.monotonic() - started)
+            return response
+        except _NOT_RETRIED:
+            raise
+        except (LLMTransientError, LLMTimeout, asyncio.TimeoutError):
+            retry += 1
+            delay = policy.backoff(retry)
+            if retry > policy.retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            metrics.llm_retries.inc()
+            await asyncio.sleep(delay)
+
+
+class _HedgePool:
+    """
+    Threads for hedged sync calls, rebuilt per process like the review job
+    pool. Both the primary and the hedge run here, so AI_HEDGE_POOL_SIZE must
+    comfortably exceed the reviews in flight or attempts queue for a thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._executor = None
+
+    def get(self):
+        key = (os.getpid(), getattr(settings, 'AI_HEDGE_POOL_SIZE', 32))
+        with self._lock:
+            if self._executor is None or self._key != key:
+                self._executor = ThreadPoolExecutor(max_workers=key[1], thread_name_prefix='llm-hedge')
+                self._key = key
+            return self._executor
+
+
+_hedge_pool = _HedgePool()
+
+
+def _in_pool(attempt, timeout):
+    try:
+        return attempt(timeout)
+    finally:
+        # The rate limiter touched the DB from this pool thread
+        connection.close()
+
+
+def _hedged(attempt, timeout, hedge_delay):
+    """
+    Run attempt(timeout) and, if it is still pending after hedge_delay, a
+    second copy; return the first success. Blocking calls can't be
+    interrupted, so the loser runs to completion in the pool and is dropped.
+    """
+    pool = _hedge_pool.get()
+    primary = pool.submit(_in_pool, attempt, timeout)
+    done, _ = wait([primary], timeout=hedge_delay)
+    if done:
+        return primary.result()
+
+    hedge_timeout = None if timeout is None else max(0.0, timeout - hedge_delay)
+    if hedge_timeout == 0:
+        return primary.result()
+    metrics.llm_hedges_fired.inc()
+    hedge = pool.submit(_in_pool, attempt, hedge_timeout)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    metrics.llm_hedges_won.inc()
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _ahedged(attempt, timeout, hedge_delay):
+    """asyncio counterpart of _hedged; the losing request is cancelled"""
+    primary = asyncio.ensure_future(attempt(timeout))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+    if done:
+        return primary.result()
+
+    hedge_timeout = None if timeout is None else max(0.0, timeout - hedge_delay)
+    if hedge_timeout == 0:
+        return await primary
+    metrics.llm_hedges_fired.inc()
+    hedge = asyncio.ensure_future(attempt(hedge_timeout))
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        metrics.llm_hedges_won.inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,165 @@
+"""
+Process-wide registry of configured LLM backends (see llm_backends).
+
+Backends - and for Gemini, genai.configure() and GenerativeModel
+construction - are created once per worker process, lazily, on first use.
+The underlying gRPC channel is then reused by every review in that process.
+Channels must not be shared across fork(), so the registry resets itself in
+forked children (gunicorn / Celery prefork).
+"""
+import asyncio
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from .llm_backends import build_backend
+
+
+class LLMCapacityError(Exception):
+    """Raised when no in-flight call slot frees up in time"""
+
+
+class _Registry:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # A lock inherited across fork() may be held by a thread that no longer exists
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.backends = {}
+        self.generators = {}
+        self.semaphore = None
+        self.async_semaphores = weakref.WeakKeyDictionary()
+        self.max_in_flight = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.rejected = 0
+
+    def ensure_current_process(self):
+        # Fallback for platforms without os.register_at_fork
+        if self.pid != os.getpid():
+            self.reset()
+
+
+_registry = _Registry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_registry.reset)
+
+
+def get_backend(model_name: str, backend_name: str = None):
+    """Return this process's shared backend (default AI_FEEDBACK_BACKEND) for model_name"""
+    backend_name = backend_name or getattr(settings, 'AI_FEEDBACK_BACKEND', 'gemini')
+    _registry.ensure_current_process()
+    key = (backend_name, model_name)
+    backend = _registry.backends.get(key)
+    if backend is None:
+        with _registry.lock:
+            backend = _registry.backends.get(key)
+            if backend is None:
+                backend = build_backend(backend_name, model_name)
+                _registry.backends[key] = backend
+    return backend
+
+
+def get_feedback_generator(model_name: str = None):
+    """Return this process's shared AIFeedbackGenerator"""
+    from .ai_feedback import AIFeedbackGenerator, MODEL_NAME
+    model_name = model_name or MODEL_NAME
+    _registry.ensure_current_process()
+    generator = _registry.generators.get(model_name)
+    if generator is None:
+        # dict.setdefault is atomic, so racing threads still end up sharing one instance
+        generator = _registry.generators.setdefault(
+            model_name, AIFeedbackGenerator(model_name=model_name)
+        )
+    return generator
+
+
+def _get_semaphore():
+    if _registry.semaphore is None:
+        with _registry.lock:
+            if _registry.semaphore is None:
+                _registry.max_in_flight = getattr(settings, 'AI_MAX_CONCURRENT_CALLS', 8)
+                _registry.semaphore = threading.BoundedSemaphore(_registry.max_in_flight)
+    return _registry.semaphore
+
+
+@contextmanager
+def llm_call_slot(timeout: float = None):
+    """
+    Hold one of the per-process in-flight call slots for the duration of an
+    LLM request. Raises LLMCapacityError if none frees up within timeout
+    (default AI_CALL_SLOT_TIMEOUT) seconds.
+    """
+    _registry.ensure_current_process()
+    semaphore = _get_semaphore()
+    if timeout is None:
+        timeout = getattr(settings, 'AI_CALL_SLOT_TIMEOUT', 30)
+    if not semaphore.acquire(timeout=timeout):
+        with _registry.lock:
+            _registry.rejected += 1
+        raise LLMCapacityError(
+            f"No LLM call slot available after {timeout}s "
+            f"({_registry.max_in_flight} calls already in flight)"
+        )
+    with _registry.lock:
+        _registry.in_flight += 1
+        _registry.calls += 1
+    try:
+        yield
+    finally:
+        with _registry.lock:
+            _registry.in_flight -= 1
+        semaphore.release()
+
+
+@asynccontextmanager
+async def async_llm_call_slot(timeout: float = None):
+    """
+    asyncio counterpart of llm_call_slot, bounded per event loop by
+    AI_MAX_CONCURRENT_ASYNC_CALLS. Async calls do not tie up a thread, so
+    this limit is normally much higher than the sync one.
+    """
+    _registry.ensure_current_process()
+    loop = asyncio.get_running_loop()
+    semaphore = _registry.async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(getattr(settings, 'AI_MAX_CONCURRENT_ASYNC_CALLS', 256))
+        _registry.async_semaphores[loop] = semaphore
+    if timeout is None:
+        timeout = getattr(settings, 'AI_CALL_SLOT_TIMEOUT', 30)
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout)
+    except asyncio.TimeoutError:
+        with _registry.lock:
+            _registry.rejected += 1
+        raise LLMCapacityError(f"No async LLM call slot available after {timeout}s")
+    with _registry.lock:
+        _registry.in_flight += 1
+        _registry.calls += 1
+    try:
+        yield
+    finally:
+        with _registry.lock:
+            _registry.in_flight -= 1
+        semaphore.release()
+
+
+def client_stats():
+    """Per-process client pool counters"""
+    _registry.ensure_current_process()
+    with _registry.lock:
+        return {
+            'pid': _registry.pid,
+            'backends': sorted(f'{name}:{model}' for name, model in _registry.backends),
+            'max_in_flight': getattr(settings, 'AI_MAX_CONCURRENT_CALLS', 8),
+            'max_async_in_flight': getattr(settings, 'AI_MAX_CONCURRENT_ASYNC_CALLS', 256),
+            'in_flight': _registry.in_flight,
+            'calls': _registry.calls,
+            'rejected': _registry.rejected,
+        }
@@ -0,0 +1,189 @@
+import argparse
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from notes.models import LessonNote, ReviewBackfill, ReviewJob
+from notes.review_jobs import class_concurrency, enqueue_reviews, get_review_backend
+
+
+def _date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise argparse.ArgumentTypeError(f"Not a YYYY-MM-DD date: {value}")
+    return parsed.isoformat()
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-review every lesson note matching the filters, e.g. after a prompt or model "
+        "change. Note ids are read in chunks and queued as BULK review jobs, at most "
+        "--max-in-flight at a time; progress is checkpointed so an interrupted run resumes "
+        "where it stopped when started again with the same filters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', help='Only notes for this term')
+        parser.add_argument('--subject', help='Only notes for this subject')
+        parser.add_argument('--grade-level', help='Only notes for this grade level')
+        parser.add_argument('--submitted-from', type=_date, help='Only notes submitted on or after YYYY-MM-DD')
+        parser.add_argument('--submitted-to', type=_date, help='Only notes submitted on or before YYYY-MM-DD')
+        parser.add_argument('--name', help='Checkpoint name (default: derived from the filters)')
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and start over')
+        parser.add_argument('--reuse', action='store_true',
+                            help='Let unchanged notes keep their last review instead of re-reviewing from scratch')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Note ids read and queued per step')
+        parser.add_argument('--max-in-flight', type=int,
+                            default=getattr(settings, 'REVIEW_BACKFILL_MAX_IN_FLIGHT', 1000),
+                            help='Most review jobs of this backfill queued or running at once')
+        parser.add_argument('--report-every', type=float, default=10, help='Seconds between progress lines')
+        parser.add_argument('--no-wait', action='store_true', help='Exit once every note is queued')
+        parser.add_argument('--dry-run', action='store_true', help='Count matching notes and exit')
+
+    def handle(self, *args, **options):
+        filters = {
+            key: options[key] for key in ('term', 'subject', 'grade_level', 'submitted_from', 'submitted_to')
+            if options[key]
+        }
+        notes = self._notes(filters)
+        if options['dry_run']:
+            self.stdout.write(f"{notes.count()} lesson notes match {filters or 'no filters'}")
+            return
+
+        name = options['name'] or 'backfill-' + hashlib.sha256(
+            json.dumps(filters, sort_keys=True).encode('utf-8')
+        ).hexdigest()[:12]
+        backfill = self._checkpoint(name, filters, notes, options)
+        self.max_in_flight = max(1, options['max_in_flight'])
+        self.report_every = options['report_every']
+        self.started = time.monotonic()
+        self.last_report = 0.0
+        self.finished_at_start = self._progress(backfill)['finished']
+
+        try:
+            chunk_size = max(1, min(options['chunk_size'], self.max_in_flight))
+            for chunk in self._id_chunks(notes, backfill.last_note_id, chunk_size):
+                self._wait(backfill, until_in_flight=self.max_in_flight - len(chunk))
+                lesson_notes = list(LessonNote.objects.filter(id__in=chunk).only('id', 'teacher_id'))
+                # Jobs and checkpoint commit together, so a crash can't queue a chunk twice
+                with transaction.atomic():
+                    enqueue_reviews(lesson_notes, backfill.batch_id, priority='BULK', force=backfill.force)
+                    ReviewBackfill.objects.filter(pk=backfill.pk).update(
+                        last_note_id=chunk[-1], notes_queued=F('notes_queued') + len(lesson_notes)
+                    )
+                backfill.last_note_id = chunk[-1]
+                backfill.notes_queued += len(lesson_notes)
+            if options['no_wait']:
+                self.stdout.write(f"All {backfill.notes_queued} notes queued under batch {backfill.batch_id}")
+                return
+            self._wait(backfill, until_in_flight=0)
+        except KeyboardInterrupt:
+            self.stdout.write(f"\nInterrupted after queueing up to note {backfill.last_note_id}; "
+                              f"run the same command again to resume")
+            return
+
+        ReviewBackfill.objects.filter(pk=backfill.pk).update(finished_at=timezone.now())
+        progress = self._progress(backfill)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f"Backfill {name} finished: {progress['done']} reviewed, {progress['failed']} failed "
+            f"in {timedelta(seconds=int(elapsed))} "
+            f"({(progress['finished'] - self.finished_at_start) / max(elapsed, 1e-9):.1f} notes/s)"
+        )
+
+    def _notes(self, filters):
+        notes = LessonNote.objects.all()
+        if 'term' in filters:
+            notes = notes.filter(term=filters['term'])
+        if 'subject' in filters:
+            notes = notes.filter(subject=filters['subject'])
+        if 'grade_level' in filters:
+            notes = notes.filter(grade_level=filters['grade_level'])
+        if 'submitted_from' in filters:
+            notes = notes.filter(submitted_at__date__gte=filters['submitted_from'])
+        if 'submitted_to' in filters:
+            notes = notes.filter(submitted_at__date__lte=filters['submitted_to'])
+        return notes
+
+    def _id_chunks(self, notes, after_id, chunk_size):
+        """
+        Note ids after after_id in ascending chunks. Each chunk is its own
+        short keyset query rather than one cursor held open for the whole
+        run, which can last hours.
+        """
+        while True:
+            chunk = list(
+                notes.filter(id__gt=after_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+                .iterator(chunk_size=chunk_size)
+            )
+            if not chunk:
+                return
+            yield chunk
+            after_id = chunk[-1]
+
+    def _checkpoint(self, name, filters, notes, options):
+        backfill = ReviewBackfill.objects.filter(name=name).first()
+        if backfill is not None and options['restart']:
+            backfill.delete()
+            backfill = None
+        if backfill is None:
+            backfill = ReviewBackfill.objects.create(
+                name=name, filters=filters, force=not options['reuse'], total_notes=notes.count()
+            )
+            self.stdout.write(f"Backfill {name}: {backfill.total_notes} lesson notes to review")
+            return backfill
+
+        if backfill.filters != filters:
+            raise CommandError(f"Checkpoint {name} was started with filters {backfill.filters}; "
+                               f"use another --name or --restart")
+        if backfill.finished_at is not None:
+            raise CommandError(f"Backfill {name} finished at {backfill.finished_at:%Y-%m-%d %H:%M}; "
+                               f"pass --restart to run it again")
+        self.stdout.write(
+            f"Resuming backfill {name} after note {backfill.last_note_id} "
+            f"({backfill.notes_queued}/{backfill.total_notes} queued)"
+        )
+        # Thread-backend tokens died with the previous run; each new token drains the class
+        queued = ReviewJob.objects.filter(batch_id=backfill.batch_id, status='QUEUED').count()
+        backend = get_review_backend()
+        for _ in range(min(queued, class_concurrency('BULK'))):
+            backend.dispatch('BULK')
+        return backfill
+
+    def _progress(self, backfill):
+        counts = ReviewJob.objects.filter(batch_id=backfill.batch_id).aggregate(
+            in_flight=Count('id', filter=Q(status__in=['QUEUED', 'RUNNING'])),
+            done=Count('id', filter=Q(status='DONE')),
+            failed=Count('id', filter=Q(status__in=['FAILED', 'DEAD'])),
+        )
+        counts['finished'] = counts['done'] + counts['failed']
+        return counts
+
+    def _wait(self, backfill, until_in_flight):
+        """Report progress until at most until_in_flight of the backfill's jobs are queued or running"""
+        while True:
+            progress = self._progress(backfill)
+            if time.monotonic() - self.last_report >= self.report_every:
+                self._report(backfill, progress)
+            if progress['in_flight'] <= max(0, until_in_flight):
+                return
+            time.sleep(0.5)
+
+    def _report(self, backfill, progress):
+        self.last_report = time.monotonic()
+        elapsed = self.last_report - self.started
+        rate = (progress['finished'] - self.finished_at_start) / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, backfill.total_notes - progress['finished'])
+        eta = str(timedelta(seconds=int(remaining / rate))) if rate > 0 else 'unknown'
+        self.stdout.write(
+            f"{progress['finished']}/{backfill.total_notes} reviewed ({progress['failed']} failed), "
+            f"{progress['in_flight']} in flight, {rate:.1f} notes/s, ETA {eta}"
+        )
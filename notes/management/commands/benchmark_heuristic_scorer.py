@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from notes.heuristics import extract_features, heuristic_feedback, score_features
+from notes.models import LessonNote
+
+SECTIONS = {
+    'Objectives': 'By the end of the lesson students will {verb} {topic} and explain their reasoning.',
+    'Materials': 'Worksheet on {topic}, chart paper and counters for each group.',
+    'Activities': 'Introduction with a quick recap. Students work in pairs to {verb} {topic}; the teacher demonstrates first.',
+    'Assessment': 'Exit ticket with three questions on {topic}. Homework: exercise 4 in the textbook.',
+    'Differentiation': 'Extension problems for advanced learners and picture support for struggling readers.',
+}
+TOPICS = ['fractions', 'photosynthesis', 'the water cycle', 'persuasive writing', 'map reading', 'simple machines']
+VERBS = ['compare', 'describe', 'model', 'investigate', 'summarise']
+
+
+def synthetic_note(rng, paragraphs):
+    """A lesson note with a random subset of the usual sections"""
+    parts = []
+    for title, template in SECTIONS.items():
+        if rng.random() < 0.75:
+            body = ' '.join(
+                template.format(verb=rng.choice(VERBS), topic=rng.choice(TOPICS)) for _ in range(paragraphs)
+            )
+            parts.append(f"{title}:\n{body}")
+    return '\n\n'.join(parts) or 'Teach the topic.'
+
+
+class Command(BaseCommand):
+    help = "Time the vectorised heuristic scorer on a batch of synthetic (or stored) lesson notes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notes', type=int, default=10000, help='Batch size')
+        parser.add_argument('--paragraphs', type=int, default=4, help='Sentences per section of synthetic notes')
+        parser.add_argument('--from-db', action='store_true', help='Score stored lesson notes instead')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['from_db']:
+            contents = list(LessonNote.objects.values_list('content', flat=True)[:options['notes']])
+        else:
+            rng = random.Random(options['seed'])
+            contents = [synthetic_note(rng, options['paragraphs']) for _ in range(options['notes'])]
+        megabytes = sum(len(content) for content in contents) / 1e6
+        self.stdout.write(f"{len(contents)} notes, {megabytes:.1f} MB of text")
+
+        started = time.perf_counter()
+        features = extract_features(contents)
+        extracted = time.perf_counter()
+        scores = score_features(features)
+        scored = time.perf_counter()
+        heuristic_feedback(contents)
+        finished = time.perf_counter()
+
+        self.stdout.write(f"feature extraction  {extracted - started:8.3f}s")
+        self.stdout.write(f"scoring             {scored - extracted:8.3f}s")
+        self.stdout.write(f"full feedback       {finished - scored:8.3f}s")
+        if len(scores):
+            self.stdout.write(
+                f"scores: mean {scores.mean():.1f}, min {scores.min()}, max {scores.max()}; "
+                f"{len(contents) / max(finished - scored, 1e-9):,.0f} notes/s with feedback"
+            )
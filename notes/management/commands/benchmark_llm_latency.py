@@ -0,0 +1,118 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from notes.ai_feedback import MODEL_NAME
+from notes.llm_backends import FakeBackend, LLMError
+from notes.llm_calls import CallPolicy, call_llm
+from notes.metrics import metrics
+from notes.rate_limits import reset_backpressure
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure LLM-stage latency percentiles and provider calls per review with "
+        "retries and hedging at several hedge delays, against the fake backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Reviews per configuration')
+        parser.add_argument('--concurrency', type=int, default=16, help='Reviews in flight at once')
+        parser.add_argument('--latency', type=float, default=1.0, help='Median fake LLM latency in seconds')
+        parser.add_argument('--latency-sigma', type=float, default=0.6,
+                            help='Log-normal spread of fake latency; the tail comes from here')
+        parser.add_argument('--error-rate', type=float, default=0.02, help='Fraction of calls that fail')
+        parser.add_argument('--retries', type=int, default=2, help='Retries per review for transient errors')
+        parser.add_argument('--hedge-delays', default='p90,p95,p99',
+                            help='Comma-separated hedge delays: seconds, or pNN for that percentile '
+                                 'of the unhedged run')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        self.stdout.write(
+            f"{n} reviews per configuration, {options['concurrency']} in flight, fake latency "
+            f"{options['latency']}s (sigma {options['latency_sigma']}), error rate {options['error_rate']}\n"
+        )
+        # Measure the call path alone: no shared rate limiter, no circuit breaker trips
+        with override_settings(AI_RATE_LIMIT_RPM=0, AI_RATE_LIMIT_TPM=0, AI_BREAKER_MIN_CALLS=10 ** 9,
+                               AI_HEDGE_POOL_SIZE=options['concurrency'] * 2):
+            reset_backpressure()
+            try:
+                rows = [self._run('no retries', CallPolicy.from_settings(retries=0, hedge_delay=0), options)]
+                baseline = rows[0][1]
+                rows.append(self._run(
+                    f"retries={options['retries']}",
+                    CallPolicy.from_settings(retries=options['retries'], hedge_delay=0), options
+                ))
+                for spec in filter(None, (s.strip() for s in options['hedge_delays'].split(','))):
+                    delay = self._hedge_delay(spec, baseline)
+                    rows.append(self._run(
+                        f"hedge {spec} ({delay:.2f}s)",
+                        CallPolicy.from_settings(
+                            retries=options['retries'], hedge_delay=delay, hedge_percentile=0
+                        ),
+                        options
+                    ))
+            finally:
+                reset_backpressure()
+
+        self.stdout.write(
+            f"{'configuration':<24}{'ok':>6}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'max s':>9}"
+            f"{'calls/rev':>11}{'hedges':>8}{'won':>6}{'retries':>9}"
+        )
+        for label, latencies, ok, calls, fired, won, retries in rows:
+            p50, p95, p99 = (self._percentile(latencies, pct) for pct in (50, 95, 99))
+            self.stdout.write(
+                f"{label:<24}{ok:>6}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{max(latencies, default=0):>9.2f}"
+                f"{calls / n:>11.2f}{fired:>8}{won:>6}{retries:>9}"
+            )
+
+    def _run(self, label, policy, options):
+        metrics.reset()
+        backend = FakeBackend(
+            MODEL_NAME, latency=options['latency'], latency_sigma=options['latency_sigma'],
+            error_rate=options['error_rate'], seed=options['seed']
+        )
+
+        def review(i):
+            started = time.monotonic()
+            try:
+                call_llm(backend, f'benchmark prompt {i}', {}, 0, policy=policy)
+                return time.monotonic() - started, True
+            except LLMError:
+                return time.monotonic() - started, False
+
+        self.stderr.write(f"running {label}...")
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            outcomes = list(pool.map(review, range(options['requests'])))
+        # Let abandoned hedge losers finish so they are counted as calls
+        time.sleep(min(5.0, options['latency'] * 3))
+        return (
+            label,
+            [latency for latency, _ in outcomes],
+            sum(ok for _, ok in outcomes),
+            metrics.llm_call_seconds.count,
+            metrics.llm_hedges_fired.value,
+            metrics.llm_hedges_won.value,
+            metrics.llm_retries.value,
+        )
+
+    def _hedge_delay(self, spec, baseline):
+        if spec.startswith('p'):
+            try:
+                return self._percentile(baseline, float(spec[1:]))
+            except ValueError:
+                raise CommandError(f"Bad hedge delay: {spec}")
+        try:
+            return float(spec)
+        except ValueError:
+            raise CommandError(f"Bad hedge delay: {spec}")
+
+    def _percentile(self, values, pct):
+        if len(values) < 2:
+            return values[0] if values else 0.0
+        return statistics.quantiles(values, n=100)[max(0, min(98, int(pct) - 1))]
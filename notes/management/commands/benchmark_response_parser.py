@@ -0,0 +1,122 @@
+import json
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.ai_feedback import AIFeedbackGenerator, find_json_object
+from notes.llm_backends import FakeBackend
+
+FEEDBACK = {
+    'feedback_text': 'The lesson has clear objectives and a logical sequence of activities.',
+    'score': 82,
+    'strengths': ['Clear objectives', 'Good use of manipulatives', 'Logical pacing'],
+    'suggestions': ['Add a group activity', 'Include an exit ticket'],
+    'areas_for_improvement': ['Differentiation for mixed abilities'],
+    'overall_assessment': 'A solid, well-structured lesson plan',
+}
+
+# The pre-scanner extractor, kept for comparison
+_LEGACY_FENCED_RE = re.compile(r'```json\s*(\{.*?\})\s*```', re.DOTALL)
+_LEGACY_BARE_RE = re.compile(r'(\{.*?\})', re.DOTALL)
+
+
+def legacy_find_json(text):
+    try:
+        match = _LEGACY_FENCED_RE.search(text) or _LEGACY_BARE_RE.search(text)
+        return json.loads(match.group(1)) if match else None
+    except json.JSONDecodeError:
+        return None
+
+
+def synthetic_corpus():
+    """(category, response_text) pairs covering the shapes Gemini actually returns"""
+    plain = json.dumps(FEEDBACK, indent=2)
+    nested = json.dumps({**FEEDBACK, 'rubric': {'objectives': 18, 'assessment': {'variety': 3, 'alignment': 4}}},
+                        indent=2)
+    tricky = json.dumps({**FEEDBACK, 'feedback_text': 'Use "think-pair-share" {briefly}; avoid \\ and } in notes.'})
+    long_text = json.dumps({**FEEDBACK, 'feedback_text': ' '.join(['The lesson covers fractions well.'] * 150)})
+    return [
+        ('fenced', f'```json\n{plain}\n```'),
+        ('fenced nested', f'```json\n{nested}\n```'),
+        ('bare', plain),
+        ('bare nested', nested),
+        ('prose around', f'Here is my review of the lesson:\n{plain}\nLet me know if you need more detail.'),
+        ('prose with braces', f'Objectives {{fractions}} were reviewed.\n{nested}'),
+        ('escaped strings', f'```json\n{tricky}\n```'),
+        ('truncated', f'```json\n{plain[:len(plain) * 2 // 3]}'),
+        ('long', f'```json\n{long_text}\n```'),
+        ('crlf', f'```json\r\n{plain}\r\n```'.replace('\n', '\r\n')),
+        ('text only', 'Score: 78\nStrengths:\n- Clear objectives\n- Good pacing\n'
+                      'Suggestions:\n- Add group work\nAreas for improvement:\n- Assessment\nOverall: good'),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the model-response JSON extractor against the previous "
+        "regex extractor: parse success rate and microseconds per parse."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='Parses per response')
+        parser.add_argument('--replay-file', default=None,
+                            help='JSONL of recorded responses (default: AI_REPLAY_FILE) to add as "recorded"')
+
+    def handle(self, *args, **options):
+        corpus = synthetic_corpus()
+        replay_file = options['replay_file'] or getattr(settings, 'AI_REPLAY_FILE', '')
+        if replay_file:
+            try:
+                with open(replay_file, encoding='utf-8') as f:
+                    corpus.extend(('recorded', json.loads(line)['text']) for line in f if line.strip())
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Cannot read recorded responses from {replay_file}: {e}")
+
+        # Only the parsing methods are used; no backend call is made
+        generator = AIFeedbackGenerator(backend=FakeBackend('benchmark'))
+
+        def legacy_extract(text):
+            return legacy_find_json(text) or generator._parse_text_response(text)
+
+        n = options['iterations']
+        self.stdout.write(f"{len(corpus)} responses, {n} parses each\n")
+        self.stdout.write(
+            f"{'category':<20}{'legacy ok':>10}{'new ok':>8}{'legacy us':>11}{'new us':>9}{'speedup':>9}"
+        )
+        totals = {'legacy_ok': 0, 'new_ok': 0, 'legacy_us': 0.0, 'new_us': 0.0}
+        rows = {}
+        for category, text in corpus:
+            row = rows.setdefault(category, {'count': 0, 'legacy_ok': 0, 'new_ok': 0, 'legacy_us': 0.0, 'new_us': 0.0})
+            row['count'] += 1
+            row['legacy_ok'] += self._is_feedback(legacy_find_json(text))
+            row['new_ok'] += self._is_feedback(find_json_object(text))
+            row['legacy_us'] += self._time(legacy_extract, text, n)
+            row['new_us'] += self._time(generator._extract_json_from_response, text, n)
+
+        for category, row in rows.items():
+            count = row['count']
+            self.stdout.write(
+                f"{category:<20}{row['legacy_ok']:>6}/{count:<3}{row['new_ok']:>4}/{count:<3}"
+                f"{row['legacy_us'] / count:>11.1f}{row['new_us'] / count:>9.1f}"
+                f"{row['legacy_us'] / max(row['new_us'], 1e-9):>8.1f}x"
+            )
+            for key in totals:
+                totals[key] += row[key]
+
+        total = len(corpus)
+        self.stdout.write(
+            f"\nJSON parse success: legacy {totals['legacy_ok'] / total:.0%}, new {totals['new_ok'] / total:.0%}; "
+            f"mean us/parse (incl. text fallback): legacy {totals['legacy_us'] / total:.1f}, "
+            f"new {totals['new_us'] / total:.1f}"
+        )
+
+    def _is_feedback(self, data):
+        return isinstance(data, dict) and 'score' in data
+
+    def _time(self, extract, text, n):
+        started = time.perf_counter()
+        for _ in range(n):
+            extract(text)
+        return (time.perf_counter() - started) / n * 1e6
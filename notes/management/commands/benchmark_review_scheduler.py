@@ -0,0 +1,111 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from notes.llm_backends import build_backend
+from notes.llm_clients import get_feedback_generator
+from notes.models import LessonNote, ReviewJob, Teacher
+from notes.review_jobs import enqueue_review, enqueue_reviews
+
+User = get_user_model()
+
+BENCHMARK_USERNAME = 'benchmark-scheduler-{}'
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue a bulk backfill from one teacher, then trickle in interactive submissions "
+        "from others, and compare queue waits when the submissions share the BULK class "
+        "(per-teacher fairness only) against their own INTERACTIVE class. Uses the thread "
+        "job backend and the fake LLM backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', type=int, default=60, help='Notes in the backfill')
+        parser.add_argument('--interactive', type=int, default=20, help='Interactive submissions')
+        parser.add_argument('--interval', type=float, default=0.2, help='Seconds between interactive submissions')
+        parser.add_argument('--teachers', type=int, default=4, help='Teachers submitting interactively')
+        parser.add_argument('--latency', type=float, default=0.3, help='Fake LLM latency in seconds')
+        parser.add_argument('--timeout', type=float, default=600, help='Give up waiting for a run after this many seconds')
+
+    def handle(self, *args, **options):
+        teachers = [self._teacher(i) for i in range(options['teachers'] + 1)]
+        generator = get_feedback_generator()
+        original_backend = generator.backend
+        generator.backend = build_backend('fake', generator.model_name, {
+            'latency': options['latency'], 'latency_sigma': 0.0, 'error_rate': 0.0, 'record_to': '',
+        })
+        self.stdout.write(
+            f"Backfill of {options['bulk']} notes, {options['interactive']} interactive submissions every "
+            f"{options['interval']}s, fake latency {options['latency']}s\n"
+        )
+        results = []
+        try:
+            with override_settings(
+                REVIEW_JOB_BACKEND='thread', AI_FEEDBACK_CACHE_ENABLED=False, AI_NEAR_DUPLICATE_ENABLED=False,
+                PROVISIONAL_FEEDBACK_ENABLED=False,
+            ):
+                for mode, interactive_priority in (('shared class', 'BULK'), ('priority classes', 'INTERACTIVE')):
+                    results.append((mode, *self._run(teachers, options, interactive_priority)))
+        finally:
+            generator.backend = original_backend
+            LessonNote.objects.filter(teacher__in=teachers).delete()
+
+        self.stdout.write(f"{'mode':<20}{'class':<13}{'jobs':>6}{'wait p50':>10}{'wait p95':>10}{'wall s':>9}")
+        for mode, waits, wall in results:
+            for label, samples in waits.items():
+                p50, p95 = self._percentiles(samples)
+                self.stdout.write(f"{mode:<20}{label:<13}{len(samples):>6}{p50:>10.2f}{p95:>10.2f}{wall:>9.1f}")
+
+    def _teacher(self, i):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME.format(i))
+        teacher, _ = Teacher.objects.get_or_create(user=user, defaults={'name': f'Scheduler Teacher {i}'})
+        return teacher
+
+    def _note(self, teacher, batch_id=None):
+        return LessonNote(
+            teacher=teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1', batch_id=batch_id,
+            content=f"Objectives: practise fractions ({uuid.uuid4().hex}).\nActivities: group work.\nAssessment: quiz.",
+        )
+
+    def _run(self, teachers, options, interactive_priority):
+        started = time.monotonic()
+        batch_id = uuid.uuid4()
+        bulk_notes = [self._note(teachers[0], batch_id) for _ in range(options['bulk'])]
+        for note in bulk_notes:
+            note.update_fingerprint()
+        bulk_notes = LessonNote.objects.bulk_create(bulk_notes)
+        if bulk_notes and bulk_notes[0].pk is None:
+            bulk_notes = list(LessonNote.objects.filter(batch_id=batch_id).order_by('id'))
+        bulk_jobs = enqueue_reviews(bulk_notes, batch_id)
+
+        interactive_jobs = []
+        for i in range(options['interactive']):
+            time.sleep(options['interval'])
+            note = self._note(teachers[1 + i % (len(teachers) - 1)])
+            note.save()
+            interactive_jobs.append(enqueue_review(note, priority=interactive_priority))
+
+        job_ids = [job.id for job in bulk_jobs + interactive_jobs]
+        while ReviewJob.objects.filter(id__in=job_ids, status__in=['QUEUED', 'RUNNING']).exists():
+            if time.monotonic() - started > options['timeout']:
+                raise CommandError(f"Review jobs still unfinished after {options['timeout']:.0f}s")
+            time.sleep(0.2)
+        wall = time.monotonic() - started
+
+        def waits(jobs):
+            return list(ReviewJob.objects.filter(id__in=[job.id for job in jobs]).values_list('wait_seconds', flat=True))
+
+        return {'backfill': waits(bulk_jobs), 'interactive': waits(interactive_jobs)}, wall
+
+    def _percentiles(self, samples):
+        samples = [sample for sample in samples if sample is not None]
+        if len(samples) < 2:
+            value = samples[0] if samples else 0.0
+            return value, value
+        cuts = statistics.quantiles(samples, n=100, method='inclusive')
+        return cuts[49], cuts[94]
@@ -0,0 +1,133 @@
+import asyncio
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from notes.authentication import TeacherTokenObtainPairSerializer
+from notes.llm_backends import build_backend
+from notes.llm_clients import get_feedback_generator
+from notes.models import Teacher, LessonNote
+
+User = get_user_model()
+
+BENCHMARK_USERNAME = 'benchmark-user'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare review throughput of the sync (WSGI) create endpoint against the "
+        "native async (ASGI) one, using the fake LLM backend (or --backend replay)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=64, help='Reviews to submit per mode')
+        parser.add_argument('--backend', choices=['fake', 'replay'], default='fake',
+                            help='LLM backend to benchmark against')
+        parser.add_argument('--latency', type=float, default=2.0, help='Fake LLM median latency in seconds')
+        parser.add_argument('--latency-sigma', type=float, default=0.0,
+                            help='Log-normal spread of fake latency (0 = fixed)')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of fake LLM calls that fail')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Sync worker threads (stand-in for gunicorn sync workers)')
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help='Max in-flight async requests (default: all at once)')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        teacher, _ = Teacher.objects.get_or_create(user=user, defaults={'name': 'Benchmark Teacher'})
+        token = str(TeacherTokenObtainPairSerializer.get_token(user).access_token)
+        self.auth = f'Bearer {token}'
+        self.marker = f'benchmark-{uuid.uuid4().hex}'
+
+        generator = get_feedback_generator()
+        original_backend = generator.backend
+        generator.backend = build_backend(options['backend'], generator.model_name, {
+            'latency': options['latency'],
+            'latency_sigma': options['latency_sigma'],
+            'error_rate': options['error_rate'],
+            'record_to': '',
+        })
+        try:
+            n = options['requests']
+            self.stdout.write(
+                f"{n} reviews per mode, {options['backend']} backend, latency {options['latency']}s "
+                f"(sigma {options['latency_sigma']}), {options['workers']} sync workers\n"
+            )
+            # The test clients always send Host: testserver
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                results = [
+                    ('sync WSGI', *self._run_sync(n, options['workers'])),
+                    ('async ASGI', *self._run_async(n, options['concurrency'] or n)),
+                ]
+        finally:
+            generator.backend = original_backend
+            LessonNote.objects.filter(teacher=teacher, content__startswith=self.marker).delete()
+
+        self.stdout.write(f"{'mode':<12}{'ok':>6}{'wall s':>10}{'req/s':>10}{'p50 s':>10}{'p95 s':>10}")
+        for mode, wall, latencies, ok in results:
+            p50, p95 = self._percentiles(latencies)
+            self.stdout.write(f"{mode:<12}{ok:>6}{wall:>10.2f}{ok / wall:>10.2f}{p50:>10.2f}{p95:>10.2f}")
+
+    def _payload(self, i):
+        return {
+            'subject': 'Mathematics',
+            'grade_level': 'Grade 5',
+            'term': 'Term 1',
+            # Unique content so the feedback cache never short-circuits the backend
+            'content': f'{self.marker} note {i}: Introduction to fractions',
+        }
+
+    def _run_sync(self, n, workers):
+        def submit(i):
+            try:
+                client = Client()
+                started = time.perf_counter()
+                response = client.post(
+                    '/api/lesson-notes/', self._payload(i),
+                    content_type='application/json', HTTP_AUTHORIZATION=self.auth
+                )
+                return time.perf_counter() - started, response.status_code == 201
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(submit, range(n)))
+        wall = time.perf_counter() - started
+        return wall, [latency for latency, _ in outcomes], sum(ok for _, ok in outcomes)
+
+    def _run_async(self, n, concurrency):
+        async def run():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def submit(i):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post(
+                        '/api/async/lesson-notes/', self._payload(i),
+                        content_type='application/json', headers={'authorization': self.auth}
+                    )
+                    return time.perf_counter() - started, response.status_code == 201
+
+            return await asyncio.gather(*(submit(i) for i in range(n)))
+
+        started = time.perf_counter()
+        outcomes = asyncio.run(run())
+        wall = time.perf_counter() - started
+        return wall, [latency for latency, _ in outcomes], sum(ok for _, ok in outcomes)
+
+    def _percentiles(self, latencies):
+        if len(latencies) < 2:
+            value = latencies[0] if latencies else 0.0
+            return value, value
+        cuts = statistics.quantiles(latencies, n=100)
+        return cuts[49], cuts[94]
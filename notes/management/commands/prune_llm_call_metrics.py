@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from notes.models import LLMCallMetric
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete LLM call metrics older than --days. Prometheus sees the exported "
+        "counters drop and treats it as a counter reset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Keep calls from the last N days')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError("--days must not be negative")
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = max(1, options['batch_size'])
+        deleted = 0
+        while True:
+            # Small batches keep each delete's locks short on a busy table
+            ids = list(
+                LLMCallMetric.objects.filter(created_at__lt=cutoff).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deleted += LLMCallMetric.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {deleted} LLM call metrics older than {cutoff:%Y-%m-%d %H:%M}")
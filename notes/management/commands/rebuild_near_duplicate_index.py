@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notes.models import LessonNote, NearDuplicateBucket, NoteSignature
+from notes.near_duplicates import index_lesson_notes
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the MinHash near-duplicate index of lesson notes. By default only "
+        "notes with a missing or outdated signature are indexed; --clear rebuilds everything."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Drop the whole index first')
+        parser.add_argument('--batch-size', type=int, default=500, help='Notes indexed per transaction')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            NearDuplicateBucket.objects.all().delete()
+            NoteSignature.objects.all().delete()
+            self.stdout.write("Cleared the near-duplicate index")
+
+        batch_size = max(1, options['batch_size'])
+        total = LessonNote.objects.count()
+        started = time.monotonic()
+        seen = indexed = 0
+        last_id = 0
+        while True:
+            # Keyset pagination: stable and cheap however many notes there are
+            batch = list(
+                LessonNote.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'subject', 'grade_level', 'content', 'content_fingerprint')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            seen += len(batch)
+            indexed += index_lesson_notes(batch)
+            self.stdout.write(f"{seen}/{total} notes checked, {indexed} indexed")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} of {seen} lesson notes in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notes.models import LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS, LessonNote
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored feedback summary columns of lesson notes from their "
+        "feedback, repairing drift from writes that bypassed the model (raw SQL, "
+        "fixtures, restores). Notes are processed in id batches of one UPDATE each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('lesson_note_ids', nargs='*', type=int, help='Notes to recompute (default: all)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Notes per UPDATE')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report notes whose stored summary differs from their feedback')
+
+    def handle(self, *args, **options):
+        notes = LessonNote.objects.all()
+        if options['lesson_note_ids']:
+            notes = notes.filter(id__in=options['lesson_note_ids'])
+        batch_size = max(1, options['batch_size'])
+
+        processed = drifted = 0
+        for batch in self._id_batches(notes, batch_size):
+            processed += len(batch)
+            if options['check']:
+                drifted += self._report_drift(batch)
+                continue
+            with transaction.atomic():
+                LessonNote.objects.filter(id__in=batch).refresh_feedback_summary()
+
+        if options['check']:
+            self.stdout.write(f"{drifted} of {processed} lesson notes have drifted feedback summaries")
+        else:
+            self.stdout.write(f"Recomputed feedback summaries for {processed} lesson notes")
+
+    def _id_batches(self, notes, batch_size):
+        after_id = 0
+        while True:
+            batch = list(notes.filter(id__gt=after_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            after_id = batch[-1]
+
+    def _report_drift(self, batch):
+        rows = LessonNote.objects.filter(id__in=batch).with_live_feedback_summary().values(
+            'id', *LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS,
+            *(f'live_{column}' for column in LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS)
+        )
+        drifted = 0
+        for row in rows:
+            stale = [
+                column for column in LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS
+                if row[column] != row[f'live_{column}']
+            ]
+            if stale:
+                drifted += 1
+                self.stdout.write(f"Lesson note {row['id']}: {', '.join(stale)}")
+        return drifted
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from notes.models import ReviewJob
+from notes.review_jobs import requeue_dead_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "List dead-lettered review jobs (status DEAD), or with --requeue give them "
+        "a fresh set of attempts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_ids', nargs='*', type=int, help='Jobs to requeue (default: all dead jobs)')
+        parser.add_argument('--requeue', action='store_true', help='Requeue instead of listing')
+
+    def handle(self, *args, **options):
+        job_ids = options['job_ids'] or None
+        if options['requeue']:
+            requeued = requeue_dead_jobs(job_ids)
+            self.stdout.write(f"Requeued {requeued} dead review jobs")
+            return
+
+        jobs = ReviewJob.objects.filter(status='DEAD').order_by('id')
+        if job_ids:
+            jobs = jobs.filter(id__in=job_ids)
+        for job in jobs.only('id', 'lesson_note_id', 'priority', 'attempts', 'finished_at', 'error'):
+            self.stdout.write(
+                f"{job.id:>8}  note {job.lesson_note_id:<8} {job.priority:<12} {job.attempts} attempts  "
+                f"{job.finished_at:%Y-%m-%d %H:%M}  {job.error[:80]}"
+            )
@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.token_revocation import prune_revocations, revoke_user_tokens
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Revoke every JWT issued so far to the given users (e.g. after a password "
+        "leak), or with --prune delete revocations whose tokens have all expired."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Users whose tokens to revoke')
+        parser.add_argument('--reason', default='', help='Stored with the revocation')
+        parser.add_argument('--prune', action='store_true', help='Delete expired revocations')
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            self.stdout.write(f"Pruned {prune_revocations()} expired revocations")
+        if not options['usernames']:
+            if not options['prune']:
+                raise CommandError("Name at least one user, or pass --prune")
+            return
+
+        users = {user.get_username(): user for user in User.objects.filter(username__in=options['usernames'])}
+        missing = sorted(set(options['usernames']) - set(users))
+        if missing:
+            raise CommandError(f"No such users: {', '.join(missing)}")
+        for username, user in users.items():
+            revoke_user_tokens(user, reason=options['reason'])
+            self.stdout.write(f"Revoked all tokens of {username}")
@@ -0,0 +1,84 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from notes.review_jobs import PRIORITIES, run_worker
+
+
+def _work(priorities, poll_interval, exit_when_idle):
+    """Worker process: run jobs until SIGTERM/SIGINT, finishing the current one first"""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    try:
+        run_worker(priorities, stop, poll_interval, exit_when_idle)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run database-backed review workers (REVIEW_JOB_BACKEND=database). Each process "
+        "claims queued ReviewJobs with SELECT ... FOR UPDATE SKIP LOCKED, highest priority "
+        "class first; run one set of workers per --priority to give each class its own capacity."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'REVIEW_WORKER_PROCESSES', 2),
+                            help='Worker processes to run')
+        parser.add_argument('--priority', action='append', choices=PRIORITIES,
+                            help='Priority class to serve (repeatable; default all, highest first)')
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'REVIEW_WORKER_POLL_INTERVAL', 1.0),
+                            help='Seconds an idle worker waits before looking for jobs again')
+        parser.add_argument('--exit-when-idle', action='store_true',
+                            help='Exit once no job is runnable instead of polling')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError("--processes must be at least 1")
+        priorities = [priority for priority in PRIORITIES if priority in (options['priority'] or PRIORITIES)]
+        worker_args = (priorities, options['poll_interval'], options['exit_when_idle'])
+        self.stdout.write(f"Starting {options['processes']} review workers for {', '.join(priorities)}")
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stopping = threading.Event()
+
+        def stop(*args):
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        workers = []
+        for _ in range(options['processes']):
+            worker = context.Process(target=_work, args=worker_args, daemon=False)
+            worker.start()
+            workers.append(worker)
+
+        while not stopping.is_set():
+            alive = [worker for worker in workers if worker.is_alive()]
+            if options['exit_when_idle']:
+                if not alive:
+                    break
+            else:
+                # Replace workers that crashed; their jobs come back when the lease runs out
+                for i, worker in enumerate(workers):
+                    if not worker.is_alive():
+                        self.stderr.write(f"Review worker {worker.pid} exited ({worker.exitcode}); restarting")
+                        workers[i] = context.Process(target=_work, args=worker_args, daemon=False)
+                        workers[i].start()
+            time.sleep(0.5)
+
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+        self.stdout.write("Review workers stopped")
@@ -0,0 +1,128 @@
+"""
+In-process latency histograms and counters for the AI review pipeline.
+
+Histograms keep cumulative bucket counts (cheap to export) plus a ring of
+recent samples for percentile estimates, which hedging uses to pick its
+delay. Everything here is per worker process.
+"""
+import math
+import os
+import threading
+from collections import deque
+
+# Upper bounds in seconds; LLM calls range from sub-second cache-warm answers
+# to 30s+ stragglers
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 21, 34, 60)
+
+
+class Histogram:
+    def __init__(self, name: str, buckets=DEFAULT_BUCKETS, window: int = 1000):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._recent = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            self._counts[index] += 1
+            self._recent.append(value)
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, pct: float):
+        """pct-th percentile of the recent samples, or None if there are none"""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        rank = max(0, math.ceil(pct / 100.0 * len(samples)) - 1)
+        return samples[min(rank, len(samples) - 1)]
+
+    def sample_count(self) -> int:
+        with self._lock:
+            return len(self._recent)
+
+    def cumulative_buckets(self):
+        """[(upper_bound, cumulative_count), ...] ending with +Inf"""
+        with self._lock:
+            counts = list(self._counts)
+        cumulative, total = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._recent.clear()
+            self.count = 0
+            self.sum = 0.0
+
+    def stats(self):
+        p50, p95, p99 = self.percentile(50), self.percentile(95), self.percentile(99)
+        with self._lock:
+            count, total = self.count, self.sum
+        return {
+            'count': count,
+            'mean': round(total / count, 3) if count else None,
+            'p50': round(p50, 3) if p50 is not None else None,
+            'p95': round(p95, 3) if p95 is not None else None,
+            'p99': round(p99, 3) if p99 is not None else None,
+        }
+
+
+class Counter:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+    def reset(self):
+        with self._lock:
+            self.value = 0
+
+
+class _Metrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Per attempt sent to the provider, failed, hedged and retried ones included
+        self.llm_call_seconds = Histogram('llm_call_seconds')
+        # Whole LLM stage of one review: retries, backoff and hedging included
+        self.llm_review_seconds = Histogram('llm_review_seconds')
+        self.llm_retries = Counter('llm_retries')
+        self.llm_hedges_fired = Counter('llm_hedges_fired')
+        self.llm_hedges_won = Counter('llm_hedges_won')
+
+    def histograms(self):
+        return [self.llm_call_seconds, self.llm_review_seconds]
+
+    def counters(self):
+        return [self.llm_retries, self.llm_hedges_fired, self.llm_hedges_won]
+
+
+metrics = _Metrics()
+
+if hasattr(os, 'register_at_fork'):
+    # Children start with fresh counters (and locks no thread holds)
+    os.register_at_fork(after_in_child=metrics.reset)
+
+
+def latency_stats():
+    stats = {histogram.name: histogram.stats() for histogram in metrics.histograms()}
+    stats.update({counter.name: counter.value for counter in metrics.counters()})
+    return stats
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_alter_feedback_options_alter_lessonnote_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedFeedback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model_name', models.CharField(max_length=100)),
+                ('prompt_version', models.PositiveIntegerField()),
+                ('payload', models.JSONField(help_text='Structured feedback returned by the model')),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Cached Feedback',
+                'verbose_name_plural': 'Cached Feedback',
+                'indexes': [models.Index(fields=['expires_at'], name='notes_cache_expires_7a80ac_idx'), models.Index(fields=['created_at'], name='notes_cache_created_27cbeb_idx')],
+            },
+        ),
+    ]
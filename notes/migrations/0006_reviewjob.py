@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_cachedfeedback'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=10)),
+                ('backend', models.CharField(help_text='Backend the job was dispatched to', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('feedback', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='notes.feedback')),
+                ('lesson_note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_jobs', to='notes.lessonnote')),
+            ],
+            options={
+                'verbose_name': 'Review Job',
+                'verbose_name_plural': 'Review Jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='notes_revie_status_6a342a_idx')],
+            },
+        ),
+    ]
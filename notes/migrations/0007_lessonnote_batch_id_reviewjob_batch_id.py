@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0006_reviewjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lessonnote',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, help_text='Set on notes submitted together in one bulk upload', null=True),
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, help_text='Groups jobs queued by one bulk submission', null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0007_lessonnote_batch_id_reviewjob_batch_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('tokens', models.FloatField(help_text='Tokens available as of updated_at')),
+                ('updated_at', models.FloatField(help_text='Unix time of the last refill')),
+                ('rejected', models.PositiveBigIntegerField(default=0, help_text='Requests turned away by this bucket')),
+            ],
+            options={
+                'verbose_name': 'Rate Limit Bucket',
+                'verbose_name_plural': 'Rate Limit Buckets',
+            },
+        ),
+    ]
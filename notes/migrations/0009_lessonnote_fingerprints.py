@@ -0,0 +1,126 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:00
+
+import hashlib
+import re
+
+from django.db import migrations, models
+
+# A frozen copy of notes.fingerprints (and the chunking and token helpers it
+# uses) as of this migration, so later changes to the live code can't alter
+# what it computes on a fresh database
+_HEADING_RES = [
+    re.compile(r'^\s{0,3}#{1,6}\s+\S'),
+    re.compile(r'^\s*[A-Za-z][\w /&()\-]{1,58}:\s*$'),
+    re.compile(r'^\s*(?:week|day|lesson|step|activity|part|section|unit|topic|period)\s+\d+\b', re.IGNORECASE),
+    re.compile(r'^\s*(?=[^a-z]*[A-Z]{3})[A-Z0-9 &/()\-:]{3,60}$'),
+]
+_IMMATERIAL_RE = re.compile(r'[\W_]+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _is_heading(line):
+    return bool(line.strip()) and any(pattern.match(line) for pattern in _HEADING_RES)
+
+
+def _split_sections(content):
+    sections = []
+    title, lines = None, []
+    for line in content.splitlines():
+        if _is_heading(line) and any(existing.strip() for existing in lines):
+            sections.append((title, '\n'.join(lines).strip()))
+            title, lines = None, []
+        if _is_heading(line) and title is None:
+            title = line.strip().lstrip('#').strip().rstrip(':')
+        lines.append(line)
+    if any(existing.strip() for existing in lines):
+        sections.append((title, '\n'.join(lines).strip()))
+    return sections
+
+
+def _material_text(value):
+    return ' '.join(_IMMATERIAL_RE.sub(' ', str(value or '')).casefold().split())
+
+
+def _normalize_text(value):
+    return _WHITESPACE_RE.sub(' ', str(value or '')).strip()
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4) if text else 0
+
+
+def _digest(value, length=64):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:length]
+
+
+def _section_hashes(content):
+    return [
+        {'title': title, 'hash': _digest(_material_text(text), 16), 'tokens': _estimate_tokens(text)}
+        for title, text in _split_sections(content or '')
+    ]
+
+
+def _content_fingerprint(lesson_note, sections):
+    header = '|'.join(
+        _normalize_text(value).casefold() for value in (lesson_note.subject, lesson_note.grade_level, lesson_note.term)
+    )
+    return _digest(header, 16) + _digest(','.join(section['hash'] for section in sections), 48)
+
+
+def fingerprint_existing_notes(apps, schema_editor):
+    LessonNote = apps.get_model('notes', 'LessonNote')
+    for lesson_note in LessonNote.objects.iterator(chunk_size=500):
+        lesson_note.section_hashes = _section_hashes(lesson_note.content)
+        lesson_note.content_fingerprint = _content_fingerprint(lesson_note, lesson_note.section_hashes)
+        lesson_note.save(update_fields=['content_fingerprint', 'section_hashes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedback',
+            name='content_fingerprint',
+            field=models.CharField(blank=True, help_text='Lesson note fingerprint at review time', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='review_mode',
+            field=models.CharField(choices=[('FULL', 'Full review'), ('INCREMENTAL', 'Changed sections re-reviewed')], default='FULL', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='section_hashes',
+            field=models.JSONField(blank=True, default=list, help_text='Lesson note section hashes at review time'),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='tokens_saved',
+            field=models.PositiveIntegerField(default=0, help_text='Estimated LLM tokens an incremental review avoided'),
+        ),
+        migrations.AddField(
+            model_name='lessonnote',
+            name='content_fingerprint',
+            field=models.CharField(blank=True, help_text='Hash of the material review inputs', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='lessonnote',
+            name='review_tokens_saved',
+            field=models.PositiveBigIntegerField(default=0, help_text='Estimated LLM tokens avoided by reuse and incremental reviews'),
+        ),
+        migrations.AddField(
+            model_name='lessonnote',
+            name='reviews_skipped',
+            field=models.PositiveIntegerField(default=0, help_text='Regenerations answered by reusing the previous review'),
+        ),
+        migrations.AddField(
+            model_name='lessonnote',
+            name='section_hashes',
+            field=models.JSONField(blank=True, default=list, help_text='Per-section content hashes, in order'),
+        ),
+        migrations.RunPython(fingerprint_existing_notes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0009_lessonnote_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteSignature',
+            fields=[
+                ('lesson_note', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='notes.lessonnote')),
+                ('content_fingerprint', models.CharField(help_text='Fingerprint the signature was computed from', max_length=64)),
+                ('signature', models.BinaryField(help_text='MinHash values, packed unsigned 32-bit')),
+            ],
+            options={
+                'verbose_name': 'Note Signature',
+                'verbose_name_plural': 'Note Signatures',
+            },
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='source_feedback',
+            field=models.ForeignKey(blank=True, help_text='Review of a near-duplicate note this one was reused or seeded from', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='notes.feedback'),
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='review_mode',
+            field=models.CharField(choices=[('FULL', 'Full review'), ('INCREMENTAL', 'Changed sections re-reviewed'), ('NEAR_DUPLICATE', 'Reused from a near-duplicate note')], default='FULL', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='NearDuplicateBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('lesson_note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='notes.lessonnote')),
+            ],
+            options={
+                'verbose_name': 'Near-Duplicate Bucket',
+                'verbose_name_plural': 'Near-Duplicate Buckets',
+            },
+        ),
+    ]
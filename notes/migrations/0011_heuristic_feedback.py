@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0010_near_duplicate_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='feedback',
+            name='reviewer_type',
+            field=models.CharField(choices=[('AI', 'AI Generated'), ('HUMAN', 'Human Reviewer'), ('HEURISTIC', 'Provisional Heuristic')], default='AI', max_length=10),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0011_heuristic_feedback'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewLock',
+            fields=[
+                ('lesson_note', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='notes.lessonnote')),
+                ('owner', models.CharField(help_text='host:pid:token of the worker running the review', max_length=100)),
+                ('acquired_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(help_text='Lease end; an expired marker may be taken over')),
+            ],
+            options={
+                'verbose_name': 'Review Lock',
+                'verbose_name_plural': 'Review Locks',
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0012_review_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCallMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('backend', models.CharField(max_length=20)),
+                ('model_name', models.CharField(max_length=100)),
+                ('operation', models.CharField(choices=[('REVIEW', 'Review'), ('CHUNK', 'Part of a long note'), ('INCREMENTAL', 'Changed sections'), ('STREAM', 'Streamed review')], default='REVIEW', max_length=12)),
+                ('parse_path', models.CharField(choices=[('FENCED_JSON', 'Fenced JSON'), ('BARE_JSON', 'Bare JSON'), ('TEXT', 'Text fallback'), ('FALLBACK', 'Hard fallback'), ('NONE', 'No response')], default='NONE', max_length=12)),
+                ('outcome', models.CharField(choices=[('OK', 'OK'), ('FALLBACK', 'Fallback'), ('DEFERRED', 'Deferred'), ('TIMEOUT', 'Timed out'), ('CANCELLED', 'Cancelled')], default='OK', max_length=10)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('tokens_estimated', models.BooleanField(default=False, help_text='The provider reported no usage; counts are estimates')),
+                ('network_seconds', models.FloatField(default=0, help_text='Provider requests, retries and backoff included')),
+                ('parse_seconds', models.FloatField(default=0, help_text='Extracting and validating the structured feedback')),
+                ('total_seconds', models.FloatField(default=0, help_text='Whole call, waiting for a call slot included')),
+                ('cost_usd', models.FloatField(default=0, help_text='At the AI_PRICE_* rates when the call was made')),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('lesson_note', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='notes.lessonnote')),
+            ],
+            options={
+                'verbose_name': 'LLM Call Metric',
+                'verbose_name_plural': 'LLM Call Metrics',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:15
+
+from django.db import migrations, models
+
+
+def classify_existing_jobs(apps, schema_editor):
+    # Jobs from bulk uploads carry their batch id
+    ReviewJob = apps.get_model('notes', 'ReviewJob')
+    ReviewJob.objects.filter(batch_id__isnull=False).update(priority='BULK')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0013_llm_call_metric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewjob',
+            name='available_at',
+            field=models.DateTimeField(blank=True, help_text='A deferred job is not run before this time', null=True),
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='priority',
+            field=models.CharField(choices=[('INTERACTIVE', 'Interactive submission'), ('REGENERATE', 'Manual regenerate'), ('BULK', 'Bulk upload or backfill')], default='INTERACTIVE', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='wait_seconds',
+            field=models.FloatField(blank=True, help_text='Time from submission until the job last started', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reviewjob',
+            index=models.Index(fields=['status', 'priority', 'available_at'], name='notes_revie_status_1ad332_idx'),
+        ),
+        migrations.RunPython(classify_existing_jobs, migrations.RunPython.noop),
+    ]
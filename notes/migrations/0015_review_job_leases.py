@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_job_teachers(apps, schema_editor):
+    ReviewJob = apps.get_model('notes', 'ReviewJob')
+    LessonNote = apps.get_model('notes', 'LessonNote')
+    ReviewJob.objects.update(
+        teacher_id=Subquery(LessonNote.objects.filter(id=OuterRef('lesson_note_id')).values('teacher_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0014_review_job_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedback',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Set by the review job that stored this feedback, so a retried job never stores it twice', max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, help_text='Times the job has been claimed, deferrals excluded'),
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text='A RUNNING job whose lease runs out is requeued or dead-lettered', null=True),
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='lease_owner',
+            field=models.CharField(blank=True, help_text='Worker running the job', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='teacher',
+            field=models.ForeignKey(blank=True, help_text="The lesson note's teacher, copied so claiming a job reads one table", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='notes.teacher'),
+        ),
+        migrations.AlterField(
+            model_name='reviewjob',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed'), ('DEAD', 'Dead-lettered after its last attempt')], default='QUEUED', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='reviewjob',
+            index=models.Index(fields=['status', 'priority', 'teacher'], name='notes_revie_status_d383b3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewjob',
+            index=models.Index(fields=['status', 'lease_expires_at'], name='notes_revie_status_6a8858_idx'),
+        ),
+        migrations.RunPython(copy_job_teachers, migrations.RunPython.noop),
+    ]
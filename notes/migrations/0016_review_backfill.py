@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:27
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0015_review_job_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewBackfill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('filters', models.JSONField(default=dict, help_text='Note filters the run was started with')),
+                ('force', models.BooleanField(default=True, help_text='Queued jobs reuse no earlier review')),
+                ('batch_id', models.UUIDField(default=uuid.uuid4, help_text="batch_id of the run's review jobs", unique=True)),
+                ('total_notes', models.PositiveIntegerField(default=0, help_text='Notes matching the filters when the run started')),
+                ('last_note_id', models.PositiveBigIntegerField(default=0, help_text='Highest note id queued so far')),
+                ('notes_queued', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Review Backfill',
+                'verbose_name_plural': 'Review Backfills',
+            },
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='force',
+            field=models.BooleanField(default=False, help_text='Review from scratch, reusing no earlier review'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0016_review_backfill'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['lesson_note', '-created_at'], name='notes_feedb_lesson__f671f0_idx'),
+        ),
+    ]
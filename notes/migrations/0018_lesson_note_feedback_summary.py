@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_feedback_summaries(apps, schema_editor):
+    LessonNote = apps.get_model('notes', 'LessonNote')
+    Feedback = apps.get_model('notes', 'Feedback')
+    feedback = Feedback.objects.filter(lesson_note_id=OuterRef('pk')).order_by()
+    newest = feedback.order_by('-created_at', '-id')
+
+    def count(rows):
+        return Coalesce(Subquery(rows.values('lesson_note_id').annotate(total=Count('id')).values('total')), 0)
+
+    LessonNote.objects.update(
+        feedback_count=count(feedback),
+        ai_feedback_count=count(feedback.filter(reviewer_type='AI')),
+        latest_feedback_id=Subquery(newest.values('id')[:1]),
+        latest_score=Subquery(newest.values('score')[:1]),
+        last_reviewed_at=Subquery(newest.exclude(reviewer_type='HEURISTIC').values('created_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0017_feedback_newest_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lessonnote',
+            name='ai_feedback_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lessonnote',
+            name='feedback_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lessonnote',
+            name='last_reviewed_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the newest AI or human review was stored', null=True),
+        ),
+        migrations.AddField(
+            model_name='lessonnote',
+            name='latest_feedback',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='notes.feedback'),
+        ),
+        migrations.AddField(
+            model_name='lessonnote',
+            name='latest_score',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_feedback_summaries, migrations.RunPython.noop),
+    ]
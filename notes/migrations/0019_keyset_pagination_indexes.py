@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0018_lesson_note_feedback_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lessonnote',
+            index=models.Index(fields=['teacher', '-submitted_at', '-id'], name='notes_lesso_teacher_c6f6e6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewjob',
+            index=models.Index(fields=['teacher', '-created_at', '-id'], name='notes_revie_teacher_c4fce2_idx'),
+        ),
+    ]
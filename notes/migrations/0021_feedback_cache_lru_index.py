@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:07
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0020_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cachedfeedback',
+            name='notes_cache_created_27cbeb_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cachedfeedback',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('last_hit_at', 'created_at'), name='notes_cachedfeedback_lru_idx'),
+        ),
+    ]
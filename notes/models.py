@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.conf import settings
 import json
+import uuid
 
 class Teacher(models.Model):
     """Teacher model linked to Django User"""
@@ -24,6 +26,56 @@ class Teacher(models.Model):
         verbose_name = "Teacher"
         verbose_name_plural = "Teachers"
 
+# Fields of a note's newest feedback that LessonNoteSerializer includes
+LESSON_NOTE_FEEDBACK_SUMMARY_FIELDS = ('id', 'reviewer', 'reviewer_type', 'score', 'created_at', 'overall_assessment')
+
+# LessonNote columns kept in step with the note's feedback on every write
+LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS = (
+    'feedback_count', 'ai_feedback_count', 'latest_feedback_id', 'latest_score', 'last_reviewed_at'
+)
+
+
+def _feedback_count(feedback):
+    return Coalesce(
+        models.Subquery(feedback.values('lesson_note').annotate(total=models.Count('id')).values('total')),
+        0,
+    )
+
+
+class LessonNoteQuerySet(models.QuerySet):
+    def with_feedback_summary(self):
+        """
+        Join the teacher and the newest feedback, which with the stored
+        summary columns is all LessonNoteSerializer shows, so a page of
+        notes is served in one query however long it is
+        """
+        return self.select_related('teacher', 'latest_feedback')
+
+    def _live_feedback_summary(self):
+        """Expressions computing each summary column from the note's feedback rows"""
+        feedback = Feedback.objects.filter(lesson_note=models.OuterRef('pk')).order_by()
+        newest = feedback.order_by('-created_at', '-id')
+        return {
+            'feedback_count': _feedback_count(feedback),
+            'ai_feedback_count': _feedback_count(feedback.filter(reviewer_type='AI')),
+            'latest_feedback_id': models.Subquery(newest.values('id')[:1]),
+            'latest_score': models.Subquery(newest.values('score')[:1]),
+            'last_reviewed_at': models.Subquery(
+                newest.exclude(reviewer_type='HEURISTIC').values('created_at')[:1]
+            ),
+        }
+
+    def with_live_feedback_summary(self):
+        """Annotate live_<column> for each summary column, for spotting drift"""
+        return self.annotate(**{
+            f'live_{column}': expression for column, expression in self._live_feedback_summary().items()
+        })
+
+    def refresh_feedback_summary(self):
+        """Recompute the summary columns of these notes in one UPDATE; returns the rows updated"""
+        return self.update(**self._live_feedback_summary())
+
+
 class LessonNote(models.Model):
     """Lesson note model for storing teacher submissions"""
     STATUS_CHOICES = [
@@ -40,24 +92,54 @@ class LessonNote(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    batch_id = models.UUIDField(blank=True, null=True, db_index=True, help_text="Set on notes submitted together in one bulk upload")
+    content_fingerprint = models.CharField(max_length=64, blank=True, help_text="Hash of the material review inputs")
+    section_hashes = models.JSONField(default=list, blank=True, help_text="Per-section content hashes, in order")
+    reviews_skipped = models.PositiveIntegerField(default=0, help_text="Regenerations answered by reusing the previous review")
+    review_tokens_saved = models.PositiveBigIntegerField(default=0, help_text="Estimated LLM tokens avoided by reuse and incremental reviews")
+
+    # Summary of the note's feedback, maintained by Feedback writes
+    feedback_count = models.PositiveIntegerField(default=0, editable=False)
+    ai_feedback_count = models.PositiveIntegerField(default=0, editable=False)
+    latest_feedback = models.ForeignKey(
+        'Feedback', on_delete=models.SET_NULL, blank=True, null=True, related_name='+', editable=False
+    )
+    latest_score = models.IntegerField(blank=True, null=True, editable=False)
+    last_reviewed_at = models.DateTimeField(
+        blank=True, null=True, editable=False, help_text="When the newest AI or human review was stored"
+    )
+
+    objects = LessonNoteQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.subject} - {self.grade_level} - {self.teacher.name}"
 
-    @property
-    def feedback_count(self):
-        """Get total feedback count"""
-        return self.feedback_set.count()
+    def update_fingerprint(self):
+        """Recompute content_fingerprint and section_hashes from the current fields"""
+        from .fingerprints import content_fingerprint, section_hashes
+        self.section_hashes = section_hashes(self.content)
+        self.content_fingerprint = content_fingerprint(self, self.section_hashes)
+
+    def save(self, *args, **kwargs):
+        self.update_fingerprint()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'content_fingerprint', 'section_hashes'}
+        elif not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        if update_fields is not None:
+            # The feedback summary is written in SQL by Feedback writes; a note
+            # loaded before one of them must not save its stale copy back
+            kwargs['update_fields'] = [
+                name for name in update_fields
+                if self._meta.get_field(name).attname not in LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS
+            ]
+        super().save(*args, **kwargs)
 
     @property
     def has_ai_feedback(self):
         """Check if lesson note has AI feedback"""
-        return self.feedback_set.filter(reviewer_type='AI').exists()
-
-    @property
-    def latest_feedback(self):
-        """Get latest feedback"""
-        return self.feedback_set.first()
+        return self.ai_feedback_count > 0
 
     @property
     def ai_feedback(self):
@@ -72,13 +154,60 @@ class LessonNote(models.Model):
             models.Index(fields=['teacher', 'subject']),
             models.Index(fields=['status']),
             models.Index(fields=['submitted_at']),
+            models.Index(fields=['teacher', '-submitted_at', '-id']),
         ]
 
+class FeedbackQuerySet(models.QuerySet):
+    """
+    Bulk writes that refresh the feedback summary columns of the notes
+    they touch, once per call and in the same transaction
+    """
+
+    def _refresh_notes(self, lesson_note_ids):
+        if lesson_note_ids:
+            LessonNote.objects.using(self.db).filter(id__in=lesson_note_ids).refresh_feedback_summary()
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            lesson_note_ids = set(self.values_list('lesson_note_id', flat=True))
+            deleted = super().delete()
+            self._refresh_notes(lesson_note_ids)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            lesson_note_ids = set(self.values_list('lesson_note_id', flat=True))
+            updated = super().update(**kwargs)
+            if 'lesson_note' in kwargs or 'lesson_note_id' in kwargs:
+                lesson_note_ids |= set(self.values_list('lesson_note_id', flat=True))
+            self._refresh_notes(lesson_note_ids)
+        return updated
+
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            self._refresh_notes({feedback.lesson_note_id for feedback in created})
+        return created
+
+    bulk_create.alters_data = True
+
+
 class Feedback(models.Model):
     """Feedback model for both AI and human reviews"""
     REVIEWER_TYPES = [
         ('AI', 'AI Generated'),
         ('HUMAN', 'Human Reviewer'),
+        ('HEURISTIC', 'Provisional Heuristic'),
+    ]
+    REVIEW_MODES = [
+        ('FULL', 'Full review'),
+        ('INCREMENTAL', 'Changed sections re-reviewed'),
+        ('NEAR_DUPLICATE', 'Reused from a near-duplicate note'),
     ]
     
     lesson_note = models.ForeignKey(LessonNote, on_delete=models.CASCADE, related_name='feedback_set')
@@ -94,6 +223,20 @@ class Feedback(models.Model):
     suggestions = models.JSONField(default=list, blank=True, help_text="List of suggestions for improvement")
     areas_for_improvement = models.JSONField(default=list, blank=True, help_text="List of areas needing improvement")
     overall_assessment = models.TextField(blank=True, help_text="Overall assessment summary")
+
+    # What the AI review covered, for skipping or narrowing the next one
+    review_mode = models.CharField(max_length=16, choices=REVIEW_MODES, default='FULL')
+    content_fingerprint = models.CharField(max_length=64, blank=True, help_text="Lesson note fingerprint at review time")
+    section_hashes = models.JSONField(default=list, blank=True, help_text="Lesson note section hashes at review time")
+    tokens_saved = models.PositiveIntegerField(default=0, help_text="Estimated LLM tokens an incremental review avoided")
+    source_feedback = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, blank=True, null=True, related_name='+',
+        help_text="Review of a near-duplicate note this one was reused or seeded from"
+    )
+    idempotency_key = models.CharField(
+        max_length=64, blank=True, null=True, unique=True,
+        help_text="Set by the review job that stored this feedback, so a retried job never stores it twice"
+    )
     
     def __str__(self):
         return f"{self.reviewer_type} Feedback for {self.lesson_note.subject} by {self.lesson_note.teacher.name}"
@@ -114,10 +257,20 @@ class Feedback(models.Model):
         if not isinstance(self.areas_for_improvement, list):
             self.areas_for_improvement = []
 
+    objects = FeedbackQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
-        """Override save to run clean validation"""
+        """Override save to run clean validation and refresh the note's feedback summary"""
         self.clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            LessonNote.objects.filter(pk=self.lesson_note_id).refresh_feedback_summary()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            deleted = super().delete(*args, **kwargs)
+            LessonNote.objects.filter(pk=self.lesson_note_id).refresh_feedback_summary()
+        return deleted
 
     @property
     def is_ai_generated(self):
@@ -129,6 +282,11 @@ class Feedback(models.Model):
         """Check if feedback is human review"""
         return self.reviewer_type == 'HUMAN'
 
+    @property
+    def is_provisional(self):
+        """Check if feedback is a provisional heuristic score awaiting the AI review"""
+        return self.reviewer_type == 'HEURISTIC'
+
     class Meta:
         verbose_name = "Feedback"
         verbose_name_plural = "Feedback"
@@ -137,6 +295,7 @@ class Feedback(models.Model):
             models.Index(fields=['lesson_note', 'reviewer_type']),
             models.Index(fields=['reviewer_type']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['lesson_note', '-created_at']),
         ]
 
     # Additional methods for better data handling
@@ -156,4 +315,254 @@ class Feedback(models.Model):
         """Get areas for improvement as formatted string"""
         if self.areas_for_improvement:
             return "; ".join(self.areas_for_improvement)
-        return "None specified"
\ No newline at end of file
+        return "None specified"
+
+class CachedFeedback(models.Model):
+    """Persistent tier of the AI feedback cache, keyed on a hash of the prompt inputs"""
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100)
+    prompt_version = models.PositiveIntegerField()
+    payload = models.JSONField(help_text="Structured feedback returned by the model")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Cached feedback {self.key[:12]} ({self.model_name} v{self.prompt_version})"
+
+    @property
+    def is_expired(self):
+        """Check if the cache entry has passed its TTL"""
+        from django.utils import timezone
+        return self.expires_at <= timezone.now()
+
+    class Meta:
+        verbose_name = "Cached Feedback"
+        verbose_name_plural = "Cached Feedback"
+        indexes = [
+            models.Index(fields=['expires_at']),
+            # Eviction order: least recently used (hit, or stored if never hit) first
+            models.Index(Coalesce('last_hit_at', 'created_at'), name='notes_cachedfeedback_lru_idx'),
+        ]
+
+
+class ReviewJob(models.Model):
+    """Background AI review of a lesson note, polled by clients of the async submission mode"""
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+        ('DEAD', 'Dead-lettered after its last attempt'),
+    ]
+    # Highest priority first
+    PRIORITY_CHOICES = [
+        ('INTERACTIVE', 'Interactive submission'),
+        ('REGENERATE', 'Manual regenerate'),
+        ('BULK', 'Bulk upload or backfill'),
+    ]
+
+    lesson_note = models.ForeignKey(LessonNote, on_delete=models.CASCADE, related_name='review_jobs')
+    teacher = models.ForeignKey(
+        Teacher, on_delete=models.CASCADE, blank=True, null=True, related_name='+',
+        help_text="The lesson note's teacher, copied so claiming a job reads one table"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    priority = models.CharField(max_length=12, choices=PRIORITY_CHOICES, default='INTERACTIVE')
+    backend = models.CharField(max_length=20, help_text="Backend the job was dispatched to")
+    batch_id = models.UUIDField(blank=True, null=True, db_index=True, help_text="Groups jobs queued by one bulk submission")
+    feedback = models.ForeignKey(Feedback, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    available_at = models.DateTimeField(blank=True, null=True, help_text="A deferred job is not run before this time")
+    wait_seconds = models.FloatField(blank=True, null=True, help_text="Time from submission until the job last started")
+    force = models.BooleanField(default=False, help_text="Review from scratch, reusing no earlier review")
+    attempts = models.PositiveIntegerField(default=0, help_text="Times the job has been claimed, deferrals excluded")
+    lease_owner = models.CharField(max_length=100, blank=True, help_text="Worker running the job")
+    lease_expires_at = models.DateTimeField(
+        blank=True, null=True, help_text="A RUNNING job whose lease runs out is requeued or dead-lettered"
+    )
+
+    def __str__(self):
+        return f"Review job {self.id} for lesson note {self.lesson_note_id} ({self.status})"
+
+    def save(self, *args, **kwargs):
+        # Copy the teacher for fair claiming (enqueue_reviews sets it itself: bulk_create skips save)
+        if self.teacher_id is None and self.lesson_note_id is not None:
+            self.teacher_id = self.lesson_note.teacher_id
+        super().save(*args, **kwargs)
+
+    @property
+    def is_finished(self):
+        """Check if the job reached a terminal state"""
+        return self.status in ('DONE', 'FAILED', 'DEAD')
+
+    class Meta:
+        verbose_name = "Review Job"
+        verbose_name_plural = "Review Jobs"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'priority', 'available_at']),
+            models.Index(fields=['status', 'priority', 'teacher']),
+            models.Index(fields=['status', 'lease_expires_at']),
+            models.Index(fields=['teacher', '-created_at', '-id']),
+        ]
+
+
+class ReviewBackfill(models.Model):
+    """Checkpoint of a backfill_reviews run, so an interrupted run resumes where it stopped"""
+    name = models.CharField(max_length=100, unique=True)
+    filters = models.JSONField(default=dict, help_text="Note filters the run was started with")
+    force = models.BooleanField(default=True, help_text="Queued jobs reuse no earlier review")
+    batch_id = models.UUIDField(default=uuid.uuid4, unique=True, help_text="batch_id of the run's review jobs")
+    total_notes = models.PositiveIntegerField(default=0, help_text="Notes matching the filters when the run started")
+    last_note_id = models.PositiveBigIntegerField(default=0, help_text="Highest note id queued so far")
+    notes_queued = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Review backfill {self.name} ({self.notes_queued}/{self.total_notes} queued)"
+
+    class Meta:
+        verbose_name = "Review Backfill"
+        verbose_name_plural = "Review Backfills"
+
+
+class RateLimitBucket(models.Model):
+    """Shared token bucket for outbound LLM calls, refilled lazily on each take"""
+    name = models.CharField(max_length=50, unique=True)
+    tokens = models.FloatField(help_text="Tokens available as of updated_at")
+    updated_at = models.FloatField(help_text="Unix time of the last refill")
+    rejected = models.PositiveBigIntegerField(default=0, help_text="Requests turned away by this bucket")
+
+    def __str__(self):
+        return f"Rate limit bucket {self.name} ({self.tokens:.0f} tokens)"
+
+    class Meta:
+        verbose_name = "Rate Limit Bucket"
+        verbose_name_plural = "Rate Limit Buckets"
+
+
+class NoteSignature(models.Model):
+    """MinHash signature of a lesson note's content, for near-duplicate lookups"""
+    lesson_note = models.OneToOneField(LessonNote, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    content_fingerprint = models.CharField(max_length=64, help_text="Fingerprint the signature was computed from")
+    signature = models.BinaryField(help_text="MinHash values, packed unsigned 32-bit")
+
+    def __str__(self):
+        return f"Signature of lesson note {self.lesson_note_id}"
+
+    class Meta:
+        verbose_name = "Note Signature"
+        verbose_name_plural = "Note Signatures"
+
+
+class NearDuplicateBucket(models.Model):
+    """
+    LSH band of a note's signature: notes sharing any key (same subject and
+    grade level, same band values) are near-duplicate candidates
+    """
+    key = models.BigIntegerField(db_index=True)
+    lesson_note = models.ForeignKey(LessonNote, on_delete=models.CASCADE, related_name='+')
+
+    def __str__(self):
+        return f"LSH bucket {self.key} -> lesson note {self.lesson_note_id}"
+
+    class Meta:
+        verbose_name = "Near-Duplicate Bucket"
+        verbose_name_plural = "Near-Duplicate Buckets"
+
+
+class ReviewLock(models.Model):
+    """
+    Marks a lesson note's review as in flight so concurrent requests in other
+    workers wait for it instead of calling the LLM again (see single_flight)
+    """
+    lesson_note = models.OneToOneField(LessonNote, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    owner = models.CharField(max_length=100, help_text="host:pid:token of the worker running the review")
+    acquired_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(help_text="Lease end; an expired marker may be taken over")
+
+    def __str__(self):
+        return f"Review lock on lesson note {self.lesson_note_id} ({self.owner})"
+
+    class Meta:
+        verbose_name = "Review Lock"
+        verbose_name_plural = "Review Locks"
+
+
+class LLMCallMetric(models.Model):
+    """One LLM request made by AIFeedbackGenerator: tokens, latency, parse path and cost"""
+    OPERATIONS = [
+        ('REVIEW', 'Review'),
+        ('CHUNK', 'Part of a long note'),
+        ('INCREMENTAL', 'Changed sections'),
+        ('STREAM', 'Streamed review'),
+    ]
+    PARSE_PATHS = [
+        ('FENCED_JSON', 'Fenced JSON'),
+        ('BARE_JSON', 'Bare JSON'),
+        ('TEXT', 'Text fallback'),
+        ('FALLBACK', 'Hard fallback'),
+        ('NONE', 'No response'),
+    ]
+    OUTCOMES = [
+        ('OK', 'OK'),
+        ('FALLBACK', 'Fallback'),
+        ('DEFERRED', 'Deferred'),
+        ('TIMEOUT', 'Timed out'),
+        ('CANCELLED', 'Cancelled'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    lesson_note = models.ForeignKey(LessonNote, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    backend = models.CharField(max_length=20)
+    model_name = models.CharField(max_length=100)
+    operation = models.CharField(max_length=12, choices=OPERATIONS, default='REVIEW')
+    parse_path = models.CharField(max_length=12, choices=PARSE_PATHS, default='NONE')
+    outcome = models.CharField(max_length=10, choices=OUTCOMES, default='OK')
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    tokens_estimated = models.BooleanField(default=False, help_text="The provider reported no usage; counts are estimates")
+    network_seconds = models.FloatField(default=0, help_text="Provider requests, retries and backoff included")
+    parse_seconds = models.FloatField(default=0, help_text="Extracting and validating the structured feedback")
+    total_seconds = models.FloatField(default=0, help_text="Whole call, waiting for a call slot included")
+    cost_usd = models.FloatField(default=0, help_text="At the AI_PRICE_* rates when the call was made")
+    error = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.operation} call to {self.model_name} ({self.outcome}, {self.total_seconds:.2f}s)"
+
+    class Meta:
+        verbose_name = "LLM Call Metric"
+        verbose_name_plural = "LLM Call Metrics"
+        ordering = ['-created_at']
+
+
+class RevokedToken(models.Model):
+    """
+    A JWT revoked before it expires: one token by its jti, or, with a blank
+    jti, every token of the user issued at or before revoked_at
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    jti = models.CharField(max_length=64, blank=True)
+    revoked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(help_text="When every token this revokes has expired anyway")
+    reason = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        revoked = f"Token {self.jti}" if self.jti else "All tokens"
+        return f"{revoked} of user {self.user_id} revoked at {self.revoked_at:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        verbose_name = "Revoked Token"
+        verbose_name_plural = "Revoked Tokens"
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
@@ -0,0 +1,179 @@
+"""
+Near-duplicate lesson notes via MinHash locality-sensitive hashing.
+
+Schools share templates, so notes from different teachers are often almost
+but not byte-for-byte identical. Each note gets a MinHash signature of its
+word 5-shingles (NoteSignature); the signature is cut into BANDS bands whose
+hashes, scoped to the note's subject and grade level, are stored as
+NearDuplicateBucket keys. Notes sharing any key are candidates, and their
+signatures estimate the Jaccard similarity of the two notes' shingles. A
+lookup is one indexed IN query over BANDS keys, limited to notes whose
+current content has an AI review and to a fixed number of bucket rows, plus
+a signature fetch, so it stays in the milliseconds however many notes share
+a template.
+
+The index is maintained by a post_save signal on LessonNote (see signals)
+and rebuilt with `manage.py rebuild_near_duplicate_index`.
+"""
+import hashlib
+import random
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from .feedback_cache import normalize_text
+from .fingerprints import material_text
+from .models import Feedback, NearDuplicateBucket, NoteSignature
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+
+# Universal hashing (a*x + b) mod p over 61-bit shingle hashes; fixed seed so
+# signatures stay comparable across processes and rebuilds
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def shingles(content: str) -> set:
+    """Hashes of the overlapping SHINGLE_WORDS-word runs of the material text"""
+    words = material_text(content).split()
+    if len(words) <= SHINGLE_WORDS:
+        runs = [' '.join(words)]
+    else:
+        runs = (' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+    return {
+        int.from_bytes(hashlib.blake2b(run.encode('utf-8'), digest_size=8).digest(), 'big') & _PRIME
+        for run in runs
+    }
+
+
+def minhash_signature(content: str) -> array:
+    values = shingles(content)
+    return array('I', (
+        min([(a * x + b) % _PRIME for x in values]) & _MASK for a, b in _PERMUTATIONS
+    ))
+
+
+def similarity(signature, other) -> float:
+    """Estimated Jaccard similarity: the fraction of agreeing MinHash values"""
+    return sum(1 for x, y in zip(signature, other) if x == y) / NUM_PERM
+
+
+def pack(signature) -> bytes:
+    return signature.tobytes()
+
+
+def unpack(data) -> array:
+    signature = array('I')
+    signature.frombytes(bytes(data))
+    return signature
+
+
+def scope_of(lesson_note) -> str:
+    return f"{normalize_text(lesson_note.subject).casefold()}|{normalize_text(lesson_note.grade_level).casefold()}"
+
+
+def band_keys(signature, scope: str) -> list:
+    """One signed 64-bit key per band, mixing in the scope"""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(f'{scope}|{band}|'.encode('utf-8') + rows, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def index_lesson_notes(lesson_notes):
+    """
+    (Re)index notes whose signature is missing or computed from older
+    content. Returns the number of notes indexed.
+    """
+    lesson_notes = [note for note in lesson_notes if note.pk is not None]
+    if not lesson_notes:
+        return 0
+    current = dict(
+        NoteSignature.objects.filter(lesson_note__in=lesson_notes).values_list('lesson_note_id', 'content_fingerprint')
+    )
+    stale = [note for note in lesson_notes if current.get(note.pk) != note.content_fingerprint]
+    if not stale:
+        return 0
+
+    signatures, buckets = [], []
+    for note in stale:
+        signature = minhash_signature(note.content)
+        signatures.append(NoteSignature(
+            lesson_note_id=note.pk, content_fingerprint=note.content_fingerprint, signature=pack(signature)
+        ))
+        buckets.extend(
+            NearDuplicateBucket(key=key, lesson_note_id=note.pk) for key in band_keys(signature, scope_of(note))
+        )
+    stale_ids = [note.pk for note in stale]
+    with transaction.atomic():
+        NearDuplicateBucket.objects.filter(lesson_note_id__in=stale_ids).delete()
+        NoteSignature.objects.filter(lesson_note_id__in=stale_ids).delete()
+        NoteSignature.objects.bulk_create(signatures)
+        NearDuplicateBucket.objects.bulk_create(buckets, batch_size=1000)
+    return len(stale)
+
+
+def find_near_duplicate(lesson_note, min_similarity: float = None):
+    """
+    Most similar other note in the same subject and grade level that has a
+    reusable AI review. Returns (feedback, similarity) or None; the donor
+    note and its teacher are loaded with the feedback.
+    """
+    if min_similarity is None:
+        min_similarity = getattr(settings, 'AI_NEAR_DUPLICATE_SEED_SIMILARITY', 0.5)
+    stored = NoteSignature.objects.filter(
+        lesson_note_id=lesson_note.pk, content_fingerprint=lesson_note.content_fingerprint
+    ).values_list('signature', flat=True).first()
+    signature = unpack(stored) if stored is not None else minhash_signature(lesson_note.content)
+
+    # Only notes whose latest content has a real AI review can donate one.
+    # The row limit bounds the scan when a popular template fills a bucket;
+    # notes sharing the most of the sampled bands go first.
+    max_candidates = getattr(settings, 'AI_NEAR_DUPLICATE_MAX_CANDIDATES', 50)
+    reviewed = Feedback.objects.filter(
+        lesson_note_id=OuterRef('lesson_note_id'), reviewer_type='AI',
+        content_fingerprint=OuterRef('lesson_note__content_fingerprint'),
+    ).exclude(content_fingerprint='')
+    rows = list(
+        NearDuplicateBucket.objects.filter(key__in=band_keys(signature, scope_of(lesson_note)))
+        .exclude(lesson_note_id=lesson_note.pk).filter(Exists(reviewed))
+        .values_list('lesson_note_id', flat=True)[:max_candidates * BANDS]
+    )
+    candidates = [note_id for note_id, _ in Counter(rows).most_common(max_candidates)]
+    if not candidates:
+        return None
+
+    best, best_similarity = None, min_similarity
+    for note_id, fingerprint, data in NoteSignature.objects.filter(
+        lesson_note_id__in=candidates, content_fingerprint=F('lesson_note__content_fingerprint')
+    ).values_list('lesson_note_id', 'content_fingerprint', 'signature'):
+        score = similarity(signature, unpack(data))
+        if score >= best_similarity:
+            best, best_similarity = (note_id, fingerprint), score
+    if best is None:
+        return None
+
+    feedback = Feedback.objects.filter(
+        lesson_note_id=best[0], reviewer_type='AI', content_fingerprint=best[1]
+    ).select_related('lesson_note__teacher').order_by('-created_at').first()
+    if feedback is None:
+        return None
+    return feedback, best_similarity
+
+
+def near_duplicate_stats():
+    return {
+        'indexed_notes': NoteSignature.objects.count(),
+        'reused_reviews': Feedback.objects.filter(review_mode='NEAR_DUPLICATE').count(),
+        'seeded_reviews': Feedback.objects.filter(review_mode='INCREMENTAL', source_feedback__isnull=False).count(),
+    }
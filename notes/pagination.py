@@ -0,0 +1,50 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+Pages are read with "WHERE <ordering field> < <cursor value> ORDER BY ...
+LIMIT n", which an index on the ordering field serves in the same time on
+page 500 as on page 1, where an OFFSET would scan every skipped row. The
+id is always the last ordering field, so rows with the same timestamp keep
+a stable order between pages.
+
+Lists carry no total by default. ?count=true adds one, counted up to
+API_COUNT_LIMIT rows; beyond that the count is the limit and
+count_is_estimate is true.
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+FEEDBACK_ORDERING = ('-created_at', '-id')
+LESSON_NOTE_ORDERING = ('-submitted_at', '-id')
+
+
+class KeysetPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+
+    def __init__(self, ordering=None):
+        # Explicit ordering (custom actions) > the view's pagination_ordering > the default
+        self.explicit_ordering = ordering
+        self.page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+        self.count_limit = getattr(settings, 'API_COUNT_LIMIT', 1000)
+
+    def get_ordering(self, request, queryset, view):
+        return self.explicit_ordering or getattr(view, 'pagination_ordering', None) or self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            # COUNT over at most count_limit + 1 rows, however many match
+            self.count = queryset.order_by()[:self.count_limit + 1].count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data, results_key='results', **extra):
+        body = {**extra, 'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.count is not None:
+            body['count'] = min(self.count, self.count_limit)
+            body['count_is_estimate'] = self.count > self.count_limit
+        body[results_key] = data
+        return Response(body)
@@ -0,0 +1,458 @@
+"""
+Backpressure for outbound LLM calls.
+
+- TokenBucketLimiter: requests/min and tokens/min buckets stored in the
+  RateLimitBucket table, so every worker process (and host) sharing the
+  database draws from the same budget. A call takes one request and its
+  estimated tokens from both buckets, each with one conditional UPDATE
+  ("... WHERE refilled level >= amount") rather than a locking read, so
+  concurrent takers only ever wait for a single statement; if a later
+  bucket is short, what the earlier ones gave is handed back. Unused tokens
+  are refunded once the provider reports real usage.
+- CircuitBreaker: per-process. Trips open when the provider failure rate
+  (errors and timeouts) over a sliding window spikes, so reviews fail fast (and get queued) instead
+  of hammering a throttled API; after a cooldown one probe call is let
+  through to decide whether to close again.
+
+Both raise LLMTransientError subclasses carrying retry_after, which the
+review pipeline turns into a deferred (queued) review.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.db.models.lookups import GreaterThanOrEqual
+
+from .llm_backends import LLMError, LLMTransientError
+from .models import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_BUCKET = 'llm-requests'
+TOKENS_BUCKET = 'llm-tokens'
+
+
+class RateLimited(LLMTransientError):
+    """The shared request/token budget is exhausted"""
+
+    def __init__(self, message, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(LLMTransientError):
+    """The circuit breaker is open; the provider is not being called"""
+
+    def __init__(self, message, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        # Per-minute capacity of each enabled bucket; 0 disables a bucket
+        self.limits = {}
+        if requests_per_minute:
+            self.limits[REQUESTS_BUCKET] = requests_per_minute
+        if tokens_per_minute:
+            self.limits[TOKENS_BUCKET] = tokens_per_minute
+        self._lock = threading.Lock()
+        self._buckets_ready = False
+        self.granted = 0
+        self.rejected = 0
+        self.waited_seconds = 0.0
+        self.errors = 0
+
+    def acquire(self, tokens: int, max_wait: float = 0.0):
+        """
+        Take one request and `tokens` tokens, sleeping up to max_wait seconds
+        for the buckets to refill. Raises RateLimited otherwise.
+        """
+        started = time.monotonic()
+        while True:
+            wait, bucket = self.try_take(tokens)
+            if wait == 0:
+                self._granted(time.monotonic() - started)
+                return
+            if time.monotonic() - started + wait > max_wait:
+                self._reject(bucket)
+                raise RateLimited(f"LLM rate limit reached ({bucket})", retry_after=wait)
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int, max_wait: float = 0.0):
+        """asyncio counterpart of acquire"""
+        started = time.monotonic()
+        while True:
+            wait, bucket = await sync_to_async(self.try_take)(tokens)
+            if wait == 0:
+                self._granted(time.monotonic() - started)
+                return
+            if time.monotonic() - started + wait > max_wait:
+                await sync_to_async(self._reject)(bucket)
+                raise RateLimited(f"LLM rate limit reached ({bucket})", retry_after=wait)
+            await asyncio.sleep(wait)
+
+    def try_take(self, tokens: int):
+        """
+        Take from every enabled bucket, or from none. Returns (0.0, None)
+        when granted, else (seconds until the call would fit, name of the
+        limiting bucket). Fails open if the table is unavailable.
+        """
+        if not self.limits:
+            return 0.0, None
+        # A single call larger than a bucket must still be able to run
+        amounts = {
+            name: min(1 if name == REQUESTS_BUCKET else tokens, capacity)
+            for name, capacity in self.limits.items()
+        }
+        try:
+            for _ in range(2):
+                self._ensure_buckets()
+                now = time.time()
+                short = self._take_all(amounts, now)
+                if short is None:
+                    return 0.0, None
+                wait = self._wait(amounts, now, short)
+                if wait is not None:
+                    return wait
+                # A bucket row has gone (deleted, flushed); recreate it and try again
+                self._buckets_ready = False
+            return 0.0, None
+        except DatabaseError as e:
+            logger.warning("Rate limiter unavailable, allowing call: %s", e)
+            with self._lock:
+                self.errors += 1
+            return 0.0, None
+
+    def settle(self, reserved_tokens: int, used_tokens: int = None):
+        """Refund tokens reserved for a call but not consumed by it"""
+        if TOKENS_BUCKET not in self.limits or used_tokens is None or used_tokens >= reserved_tokens:
+            return
+        try:
+            self._refund(TOKENS_BUCKET, reserved_tokens - used_tokens)
+        except DatabaseError as e:
+            logger.warning("Rate limiter refund failed: %s", e)
+
+    def stats(self):
+        """Bucket levels (shared) plus this process's counters"""
+        buckets = {}
+        try:
+            now = time.time()
+            for bucket in RateLimitBucket.objects.filter(name__in=self.limits):
+                capacity = self.limits[bucket.name]
+                level = min(capacity, bucket.tokens + max(0.0, now - bucket.updated_at) * capacity / 60.0)
+                buckets[bucket.name] = {
+                    'per_minute': capacity,
+                    'available': round(level, 1),
+                    'rejected': bucket.rejected,
+                }
+        except DatabaseError as e:
+            logger.warning("Rate limiter stats failed: %s", e)
+        with self._lock:
+            return {
+                'enabled': bool(self.limits),
+                'buckets': buckets,
+                'granted': self.granted,
+                'rejected': self.rejected,
+                'waited_seconds': round(self.waited_seconds, 3),
+                'errors': self.errors,
+            }
+
+    def _level(self, name, now):
+        """SQL expression for a bucket's level at now, refilled since updated_at"""
+        capacity = self.limits[name]
+        elapsed = Greatest(Value(now) - F('updated_at'), Value(0.0))
+        return Least(Value(float(capacity)), F('tokens') + elapsed * Value(capacity / 60.0))
+
+    def _take_all(self, amounts, now):
+        """Take every bucket's amount or none; returns the bucket that was short, if any"""
+        taken = []
+        for name in sorted(amounts):
+            if not self._take(name, amounts[name], now):
+                for earlier in taken:
+                    self._refund(earlier, amounts[earlier])
+                return name
+            taken.append(name)
+        return None
+
+    def _take(self, name, amount, now):
+        # The WHERE is re-checked against the latest row if a concurrent UPDATE got there first
+        level = self._level(name, now)
+        return bool(RateLimitBucket.objects.filter(GreaterThanOrEqual(level, amount), name=name).update(
+            tokens=level - amount, updated_at=Greatest(F('updated_at'), Value(now)),
+        ))
+
+    def _refund(self, name, amount):
+        RateLimitBucket.objects.filter(name=name).update(
+            tokens=Least(F('tokens') + amount, self.limits[name])
+        )
+
+    def _wait(self, amounts, now, limiting):
+        """
+        Seconds until every bucket holds its amount and the bucket furthest
+        off, or None if a bucket row is missing.
+        """
+        rows = list(RateLimitBucket.objects.filter(name__in=amounts).values_list('name', 'tokens', 'updated_at'))
+        if len(rows) < len(amounts):
+            return None
+        wait = 0.0
+        for name, tokens, updated_at in rows:
+            rate = self.limits[name] / 60.0
+            level = min(self.limits[name], tokens + max(0.0, now - updated_at) * rate)
+            if (amounts[name] - level) / rate > wait:
+                wait, limiting = (amounts[name] - level) / rate, name
+        # Never 0: the take failed, and 0 means granted
+        return max(wait, 0.01), limiting
+
+    def _ensure_buckets(self):
+        if self._buckets_ready:
+            return
+        for name, capacity in self.limits.items():
+            try:
+                RateLimitBucket.objects.get_or_create(
+                    name=name, defaults={'tokens': capacity, 'updated_at': time.time()}
+                )
+            except IntegrityError:
+                # Another process created it first
+                pass
+        self._buckets_ready = True
+
+    def _granted(self, waited):
+        with self._lock:
+            self.granted += 1
+            self.waited_seconds += waited
+
+    def _reject(self, bucket):
+        with self._lock:
+            self.rejected += 1
+        try:
+            RateLimitBucket.objects.filter(name=bucket).update(rejected=F('rejected') + 1)
+        except DatabaseError:
+            pass
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate: float = 0.5, min_calls: int = 10,
+                 window: float = 60.0, cooldown: float = 30.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._outcomes = deque()
+        self.state = self.CLOSED
+        self.opened_until = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go to the provider now"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now < self.opened_until:
+                    self.short_circuited += 1
+                    raise CircuitOpen("LLM circuit breaker is open", retry_after=self.opened_until - now)
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.short_circuited += 1
+                    raise CircuitOpen("LLM circuit breaker is probing", retry_after=self.cooldown)
+                self._probe_in_flight = True
+
+    def release(self):
+        """The allowed call never reached the provider"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                return
+            self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+            self._record(False)
+            total = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if self.state == self.CLOSED and total >= self.min_calls and failures / total >= self.failure_rate:
+                self._open()
+
+    def stats(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            total = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                'state': self.state,
+                'window_calls': total,
+                'window_failures': failures,
+                'failure_rate': round(failures / total, 3) if total else 0.0,
+                'retry_after': round(max(0.0, self.opened_until - time.monotonic()), 1)
+                if self.state == self.OPEN else 0.0,
+                'times_opened': self.times_opened,
+                'short_circuited': self.short_circuited,
+            }
+
+    def _record(self, ok):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        self._prune(now)
+
+    def _prune(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _open(self):
+        logger.warning("LLM circuit breaker opened for %ss", self.cooldown)
+        self.state = self.OPEN
+        self.opened_until = time.monotonic() + self.cooldown
+        self._probe_in_flight = False
+        self._outcomes.clear()
+        self.times_opened += 1
+
+
+def _provider_failure(exc) -> bool:
+    """
+    Whether an exception raised during a guarded call says the provider is
+    failing: its errors and timeouts. Review deadlines (ReviewTimeout),
+    cancelled or abandoned calls and our own bugs don't count.
+    """
+    if isinstance(exc, (RateLimited, CircuitOpen)):
+        return False
+    return isinstance(exc, (LLMError, TimeoutError, asyncio.TimeoutError))
+
+
+class CallGuard:
+    """Handle yielded by llm_guard; report the provider's token usage through settle()"""
+
+    def __init__(self, limiter, reserved_tokens):
+        self.limiter = limiter
+        self.reserved_tokens = reserved_tokens
+
+    def settle(self, response):
+        if response.prompt_tokens is not None and response.output_tokens is not None:
+            self.limiter.settle(self.reserved_tokens, response.prompt_tokens + response.output_tokens)
+
+
+@contextmanager
+def llm_guard(reserved_tokens: int, max_wait: float = 0.0):
+    """
+    Admit one provider call through the circuit breaker and the shared rate
+    limiter, then record its outcome. Provider errors and timeouts raised
+    inside the block count as failures; any other exception leaves the
+    breaker's counts alone.
+    """
+    breaker = get_circuit_breaker()
+    limiter = get_rate_limiter()
+    breaker.allow()
+    try:
+        limiter.acquire(reserved_tokens, max_wait=max_wait)
+    except BaseException:
+        breaker.release()
+        raise
+    try:
+        yield CallGuard(limiter, reserved_tokens)
+    except BaseException as e:
+        if _provider_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        raise
+    breaker.record_success()
+
+
+@asynccontextmanager
+async def allm_guard(reserved_tokens: int, max_wait: float = 0.0):
+    """asyncio counterpart of llm_guard"""
+    breaker = get_circuit_breaker()
+    limiter = get_rate_limiter()
+    breaker.allow()
+    try:
+        await limiter.aacquire(reserved_tokens, max_wait=max_wait)
+    except BaseException:
+        breaker.release()
+        raise
+    try:
+        yield CallGuard(limiter, reserved_tokens)
+    except BaseException as e:
+        if _provider_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        raise
+    breaker.record_success()
+
+
+_limiter = None
+_breaker = None
+_instances_lock = threading.Lock()
+
+
+def reset_backpressure():
+    """Drop this process's limiter and breaker so they are rebuilt from settings"""
+    global _limiter, _breaker, _instances_lock
+    _instances_lock = threading.Lock()
+    _limiter = None
+    _breaker = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_backpressure)
+
+
+def get_rate_limiter() -> TokenBucketLimiter:
+    """Process-wide limiter configured from AI_RATE_LIMIT_* settings"""
+    global _limiter
+    if _limiter is None:
+        with _instances_lock:
+            if _limiter is None:
+                _limiter = TokenBucketLimiter(
+                    requests_per_minute=getattr(settings, 'AI_RATE_LIMIT_RPM', 0),
+                    tokens_per_minute=getattr(settings, 'AI_RATE_LIMIT_TPM', 0),
+                )
+    return _limiter
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Process-wide breaker configured from AI_BREAKER_* settings"""
+    global _breaker
+    if _breaker is None:
+        with _instances_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_rate=getattr(settings, 'AI_BREAKER_FAILURE_RATE', 0.5),
+                    min_calls=getattr(settings, 'AI_BREAKER_MIN_CALLS', 10),
+                    window=getattr(settings, 'AI_BREAKER_WINDOW', 60),
+                    cooldown=getattr(settings, 'AI_BREAKER_COOLDOWN', 30),
+                )
+    return _breaker
+
+
+def backpressure_stats():
+    return {
+        'rate_limiter': get_rate_limiter().stats(),
+        'circuit_breaker': get_circuit_breaker().stats(),
+    }
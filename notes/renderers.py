@@ -0,0 +1,36 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets Server-Sent Events endpoints pass content negotiation for
+    'Accept: text/event-stream'. Streaming views return a StreamingHttpResponse
+    directly; this only renders responses produced before streaming starts
+    (auth failures, 404s) as a single SSE error event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data)
+
+
+def format_event(event: str, data) -> bytes:
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode('utf-8')
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Prometheus text exposition format; views pass the rendered text as data"""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        # Errors (auth failures) come through as dicts
+        return json.dumps(data).encode(self.charset)
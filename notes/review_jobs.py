@@ -0,0 +1,633 @@
+"""
+Background review jobs for the async submission mode.
+
+A ReviewJob row tracks each queued review; the work itself is dispatched to
+a backend selected by the REVIEW_JOB_BACKEND setting:
+
+- 'celery': the run_next_review_job task, one queue per priority class
+  (needs a broker)
+- 'thread': in-process thread pools, one per priority class, for
+  deployments without a broker
+- 'database': nothing is dispatched; run_review_workers processes poll the
+  ReviewJob table, so the queue survives restarts without a broker
+
+Every job has a priority class: INTERACTIVE (a teacher waiting on a new
+submission), REGENERATE (a manually re-triggered review) or BULK (bulk
+uploads and backfills). Each class has its own workers - REVIEW_<CLASS>_
+CONCURRENCY threads per process, the Celery workers consuming its queue, or
+database workers started with --priority - so a backfill can't take the
+capacity interactive reviews need.
+
+Submitting a job hands its class a token rather than the job itself: a
+running token claims the class's jobs from the database one at a time,
+fairly across teachers - the teacher with the fewest jobs of that class
+running goes first, then the oldest job - so one teacher's 200 uploads take
+turns with everyone else's. Claims lock the job row with SELECT ... FOR
+UPDATE SKIP LOCKED, so concurrent workers never queue behind each other.
+Each job records how long it waited (wait_seconds), which queue_wait_stats()
+summarises per class.
+
+A claimed job holds a lease (REVIEW_JOB_LEASE) that its worker renews while
+the review runs; a job whose worker died is requeued once the lease runs
+out. A failed review is retried with exponential backoff until it has made
+REVIEW_JOB_MAX_ATTEMPTS attempts, then dead-lettered (status DEAD) for
+requeue_dead_jobs(). Feedback is stored under the job's idempotency key, so
+a job that runs twice still stores one review.
+
+A review deferred by the LLM backpressure (rate limit, open circuit breaker,
+provider throttling) goes back to QUEUED, without using up an attempt, and
+its token is resubmitted after a delay. Delayed tokens are coalesced per
+class: a process that already has a wake-up pending for the class at or
+before the new one doesn't send another, so a long outage keeps one
+wake-up per class instead of one per deferral.
+"""
+import heapq
+import itertools
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .ai_feedback import ReviewDeferred
+from .models import Feedback, ReviewJob
+from .reviews import review_lesson_note
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = [priority for priority, _ in ReviewJob.PRIORITY_CHOICES]
+
+# Teachers considered per claim; the rest wait for a later turn
+_FAIRNESS_CANDIDATES = 100
+
+# priority -> (monotonic time computed, teacher ids in turn order)
+_fairness_orders = {}
+_fairness_lock = threading.Lock()
+
+# (backend, priority) -> monotonic time of the delayed token this process last sent
+_wakeups = {}
+_wakeups_lock = threading.Lock()
+# How late a pending wake-up may be and still stand in for a new one
+_WAKEUP_SLACK = 1.0
+
+
+def class_concurrency(priority: str) -> int:
+    """Reviews of one priority class run at once per process (thread backend)"""
+    return max(1, getattr(settings, f'REVIEW_{priority}_CONCURRENCY', 2))
+
+
+def job_lease() -> float:
+    return getattr(settings, 'REVIEW_JOB_LEASE', 120)
+
+
+def max_attempts() -> int:
+    return max(1, getattr(settings, 'REVIEW_JOB_MAX_ATTEMPTS', 5))
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before retrying a job that has failed attempts times"""
+    base = getattr(settings, 'REVIEW_JOB_RETRY_DELAY', 30)
+    return min(base * 2 ** max(0, attempts - 1), 3600)
+
+
+def idempotency_key(job) -> str:
+    return f"review-job-{job.id}"
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"[:100]
+
+
+def _available(queryset, now):
+    return queryset.filter(Q(available_at__isnull=True) | Q(available_at__lte=now))
+
+
+def _fair_teachers(priority, now) -> list:
+    """Teachers with runnable jobs of a class, fewest running jobs first, then oldest job"""
+    candidates = list(
+        _available(ReviewJob.objects.filter(status='QUEUED', priority=priority), now)
+        .values('teacher_id').annotate(oldest=Min('id')).order_by('oldest')[:_FAIRNESS_CANDIDATES]
+    )
+    if not candidates:
+        return []
+    running = dict(
+        ReviewJob.objects.filter(status='RUNNING', priority=priority)
+        .values_list('teacher_id').annotate(count=Count('id')).order_by()
+    )
+    candidates.sort(key=lambda row: (running.get(row['teacher_id'], 0), row['oldest']))
+    return [row['teacher_id'] for row in candidates]
+
+
+def _turn_order(priority, now, refresh=False):
+    """
+    The class's teacher order and whether it came from this process's cache.
+    _fair_teachers() aggregates over the whole queue, so it runs at most every
+    REVIEW_FAIRNESS_REFRESH seconds per class rather than on every claim.
+    """
+    window = getattr(settings, 'REVIEW_FAIRNESS_REFRESH', 2.0)
+    with _fairness_lock:
+        cached = _fairness_orders.get(priority)
+        if not refresh and cached is not None and time.monotonic() - cached[0] < window:
+            return list(cached[1]), True
+    teachers = _fair_teachers(priority, now)
+    with _fairness_lock:
+        _fairness_orders[priority] = (time.monotonic(), teachers)
+    return list(teachers), False
+
+
+def _took_turn(priority, teacher_id, claimed):
+    """Send a teacher to the back of the cached order, or drop them if they had nothing to claim"""
+    with _fairness_lock:
+        cached = _fairness_orders.get(priority)
+        if cached is None or teacher_id not in cached[1]:
+            return
+        order = [other for other in cached[1] if other != teacher_id]
+        if claimed:
+            order.append(teacher_id)
+        _fairness_orders[priority] = (cached[0], order)
+
+
+def _claim(queryset, now, owner):
+    """
+    Lock the first job of queryset, skipping rows other workers hold, and
+    move it to RUNNING under owner's lease. Returns the job id or None.
+    """
+    with transaction.atomic():
+        job = queryset.select_for_update(skip_locked=True).order_by('id').only('id', 'created_at').first()
+        if job is None:
+            return None
+        # Still conditional: databases without SKIP LOCKED (SQLite) don't lock at all
+        claimed = ReviewJob.objects.filter(id=job.id, status='QUEUED').update(
+            status='RUNNING', started_at=now, wait_seconds=max(0.0, (now - job.created_at).total_seconds()),
+            attempts=F('attempts') + 1, lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=job_lease()),
+        )
+    return job.id if claimed else None
+
+
+def _claimed_job(job_id):
+    return ReviewJob.objects.select_related('lesson_note__teacher').get(id=job_id)
+
+
+def claim_next_job(priority: str, owner: str = None):
+    """
+    Move the next QUEUED job of a priority class to RUNNING and return it,
+    or None if there is nothing to run. The teacher with the fewest running
+    jobs in the class goes first, ties broken by the oldest queued job.
+    """
+    owner = owner or worker_name()
+    now = timezone.now()
+    teachers, cached = _turn_order(priority, now)
+    while True:
+        for teacher_id in teachers:
+            job_id = _claim(
+                _available(ReviewJob.objects.filter(status='QUEUED', priority=priority, teacher_id=teacher_id), now),
+                now, owner
+            )
+            _took_turn(priority, teacher_id, claimed=job_id is not None)
+            if job_id is not None:
+                return _claimed_job(job_id)
+        if not cached:
+            return None
+        # The cached order may predate teachers who have queued since
+        teachers, cached = _turn_order(priority, now, refresh=True)
+
+
+def renew_lease(job) -> bool:
+    """Extend a running job's lease; False if the worker no longer owns it"""
+    return bool(ReviewJob.objects.filter(id=job.id, status='RUNNING', lease_owner=job.lease_owner).update(
+        lease_expires_at=timezone.now() + timedelta(seconds=job_lease())
+    ))
+
+
+class LeaseHeartbeat:
+    """Renew a job's lease from a background thread while the block runs"""
+
+    def __init__(self, job):
+        self.job = job
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'lease-{job.id}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(job_lease() / 3):
+                if not renew_lease(self.job):
+                    logger.warning("Review job %s lost its lease", self.job.id)
+                    return
+        except Exception:
+            logger.exception("Could not renew the lease of review job %s", self.job.id)
+        finally:
+            connections.close_all()
+
+
+def _release(job, **fields):
+    """Update a job this worker still owns, clearing its lease"""
+    return ReviewJob.objects.filter(id=job.id, status='RUNNING', lease_owner=job.lease_owner).update(
+        lease_owner='', lease_expires_at=None, **fields
+    )
+
+
+def _dispatch_later(backend_name, priority, delay) -> bool:
+    """
+    Send a class a delayed token, unless this process already sent one that
+    is still pending and due no later (within _WAKEUP_SLACK). Returns
+    whether a token was sent.
+    """
+    now = time.monotonic()
+    due = now + delay
+    with _wakeups_lock:
+        pending = _wakeups.get((backend_name, priority))
+        if pending is not None and now < pending <= due + _WAKEUP_SLACK:
+            return False
+        _wakeups[(backend_name, priority)] = due
+    get_review_backend(backend_name).dispatch(priority, delay=delay)
+    return True
+
+
+def _retry_or_dead_letter(job, error: str):
+    if job.attempts >= max_attempts():
+        logger.error("Review job %s dead-lettered after %s attempts: %s", job.id, job.attempts, error)
+        _release(job, status='DEAD', error=error, finished_at=timezone.now())
+        return
+    delay = retry_delay(job.attempts)
+    if _release(
+        job, status='QUEUED', started_at=None, available_at=timezone.now() + timedelta(seconds=delay),
+        error=f"Attempt {job.attempts} failed, retrying in {delay:.0f}s: {error}"
+    ):
+        _dispatch_later(job.backend, job.priority, delay)
+
+
+def execute_review_job(job):
+    """Review a claimed (RUNNING) job's note, recording the outcome on the job row"""
+    key = idempotency_key(job)
+    # A previous attempt stored the feedback but died before marking the job done
+    feedback = Feedback.objects.filter(idempotency_key=key).first()
+    try:
+        if feedback is None:
+            with LeaseHeartbeat(job):
+                feedback, _ = review_lesson_note(job.lesson_note, idempotency_key=key, force=job.force)
+    except ReviewDeferred as e:
+        delay = defer_delay(e)
+        if _release(
+            job, status='QUEUED', started_at=None, attempts=F('attempts') - 1,
+            available_at=timezone.now() + timedelta(seconds=delay), error=f"Deferred {delay:.0f}s: {str(e)}"
+        ):
+            _dispatch_later(job.backend, job.priority, delay)
+    except Exception as e:
+        logger.exception("Review job %s failed on attempt %s", job.id, job.attempts)
+        _retry_or_dead_letter(job, str(e))
+    else:
+        _release(job, status='DONE', feedback=feedback, finished_at=timezone.now())
+    job.refresh_from_db()
+    return job
+
+
+def run_review_job(job_id):
+    """Execute one specific review job, bypassing the scheduler"""
+    claimed = _claim(ReviewJob.objects.filter(id=job_id, status='QUEUED'), timezone.now(), worker_name())
+    if claimed is None:
+        return ReviewJob.objects.filter(id=job_id).first()
+    return execute_review_job(_claimed_job(claimed))
+
+
+def requeue_expired_jobs():
+    """
+    Requeue RUNNING jobs whose worker stopped renewing the lease, or
+    dead-letter them if that was their last attempt. Returns (requeued, dead).
+    """
+    now = timezone.now()
+    expired = ReviewJob.objects.filter(status='RUNNING', lease_expires_at__lt=now)
+    dead = expired.filter(attempts__gte=max_attempts()).update(
+        status='DEAD', finished_at=now, lease_owner='', lease_expires_at=None,
+        error='Worker lost during the last attempt (lease expired)',
+    )
+    retryable = expired.filter(attempts__lt=max_attempts())
+    classes = set(retryable.values_list('backend', 'priority').distinct())
+    requeued = retryable.update(
+        status='QUEUED', started_at=None, lease_owner='', lease_expires_at=None,
+        error='Worker lost (lease expired); requeued',
+    )
+    if requeued or dead:
+        logger.warning("Requeued %s and dead-lettered %s review jobs with expired leases", requeued, dead)
+    if requeued:
+        # One token per class drains it; without one nothing would run them until the next enqueue
+        def dispatch_all():
+            for backend, priority in classes:
+                get_review_backend(backend).dispatch(priority)
+
+        transaction.on_commit(dispatch_all)
+    return requeued, dead
+
+
+_last_reap = 0.0
+
+
+def _maybe_requeue_expired():
+    """requeue_expired_jobs() at most every quarter lease per process"""
+    global _last_reap
+    if time.monotonic() - _last_reap < job_lease() / 4:
+        return
+    _last_reap = time.monotonic()
+    requeue_expired_jobs()
+
+
+def requeue_dead_jobs(job_ids=None) -> int:
+    """Give dead-lettered jobs (all, or those in job_ids) a fresh set of attempts"""
+    jobs = ReviewJob.objects.filter(status='DEAD')
+    if job_ids is not None:
+        jobs = jobs.filter(id__in=job_ids)
+    priorities = list(jobs.values_list('priority', flat=True))
+    requeued = jobs.update(status='QUEUED', attempts=0, available_at=None, started_at=None, finished_at=None)
+    backend = get_review_backend()
+    for priority in priorities[:requeued]:
+        backend.dispatch(priority)
+    return requeued
+
+
+def run_next_review_job(priority: str):
+    """
+    Handle one token of a priority class: run the class's jobs, claiming
+    the next fair one each time, until none is available - so a lost token
+    never strands a job while another token runs. If only deferred jobs are
+    left, the token comes back when the first is due, unless a wake-up at
+    or before then is already pending. Returns the number of jobs run.
+    """
+    _maybe_requeue_expired()
+    ran = 0
+    job = claim_next_job(priority)
+    while job is not None:
+        execute_review_job(job)
+        ran += 1
+        job = claim_next_job(priority)
+
+    next_due = ReviewJob.objects.filter(
+        status='QUEUED', priority=priority, available_at__gt=timezone.now()
+    ).aggregate(due=Min('available_at'))['due']
+    if next_due is not None:
+        delay = max(0.0, (next_due - timezone.now()).total_seconds())
+        _dispatch_later(get_review_backend().name, priority, delay)
+    return ran
+
+
+def run_worker(priorities, stop: threading.Event, poll_interval: float = None, exit_when_idle: bool = False) -> int:
+    """
+    Database worker loop (run_review_workers): claim and run jobs of the
+    given classes, highest priority first, polling every poll_interval
+    seconds while idle, until stop is set. Returns the number of jobs run.
+    """
+    if poll_interval is None:
+        poll_interval = getattr(settings, 'REVIEW_WORKER_POLL_INTERVAL', 1.0)
+    owner = worker_name()
+    ran = 0
+    while not stop.is_set():
+        job = None
+        try:
+            _maybe_requeue_expired()
+            for priority in priorities:
+                job = claim_next_job(priority, owner)
+                if job is not None:
+                    break
+        except DatabaseError:
+            # Lost connection or lock timeout: back off and try again
+            logger.exception("Review worker %s could not claim a job", owner)
+            connections.close_all()
+            stop.wait(poll_interval)
+            continue
+        if job is None:
+            if exit_when_idle:
+                break
+            stop.wait(poll_interval)
+            continue
+        execute_review_job(job)
+        ran += 1
+    return ran
+
+
+def defer_delay(error) -> float:
+    """Seconds to hold back a deferred review before retrying it"""
+    return error.retry_after or getattr(settings, 'REVIEW_DEFER_DELAY', 30)
+
+
+def celery_queue(priority: str) -> str:
+    return f"{getattr(settings, 'REVIEW_CELERY_QUEUE_PREFIX', 'reviews')}.{priority.lower()}"
+
+
+class CeleryReviewBackend:
+    """One Celery queue per priority class; run a worker per queue sized to the class"""
+    name = 'celery'
+
+    def dispatch(self, priority, delay=None):
+        from .tasks import run_next_review_job_task
+        run_next_review_job_task.apply_async((priority,), countdown=delay, queue=celery_queue(priority))
+
+
+class ThreadPoolReviewBackend:
+    """
+    A per-process thread pool per priority class. Delayed tokens wait in a
+    heap served by one scheduler thread. Tokens queued at shutdown are lost;
+    their jobs stay QUEUED and are picked up by later tokens.
+    """
+    name = 'thread'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executors = {}
+        self._scheduler_pid = None
+        self._due = []
+        self._due_changed = None
+        self._sequence = itertools.count()
+
+    def dispatch(self, priority, delay=None):
+        if delay:
+            self._schedule(priority, delay)
+            return
+        self._get_executor(priority).submit(self._run, priority)
+
+    def _schedule(self, priority, delay):
+        # Like the executors, the scheduler thread is rebuilt in a forked process
+        with self._lock:
+            if self._scheduler_pid != os.getpid():
+                self._due, self._due_changed = [], threading.Condition()
+                self._scheduler_pid = os.getpid()
+                threading.Thread(
+                    target=self._run_scheduler, args=(self._due, self._due_changed),
+                    name='review-scheduler', daemon=True,
+                ).start()
+            due, due_changed = self._due, self._due_changed
+        with due_changed:
+            heapq.heappush(due, (time.monotonic() + delay, next(self._sequence), priority))
+            due_changed.notify()
+
+    def _run_scheduler(self, due, due_changed):
+        while True:
+            with due_changed:
+                while not due or due[0][0] > time.monotonic():
+                    due_changed.wait(due[0][0] - time.monotonic() if due else None)
+                _, _, priority = heapq.heappop(due)
+            try:
+                self.dispatch(priority)
+            except Exception:
+                logger.exception("Could not dispatch a delayed review token (%s)", priority)
+
+    def _get_executor(self, priority):
+        # Executor threads don't survive fork(), so each worker process builds its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executors = {}
+                self._pid = os.getpid()
+            executor = self._executors.get(priority)
+            if executor is None:
+                executor = self._executors[priority] = ThreadPoolExecutor(
+                    max_workers=class_concurrency(priority), thread_name_prefix=f'review-{priority.lower()}'
+                )
+            return executor
+
+    def _run(self, priority):
+        try:
+            run_next_review_job(priority)
+        except Exception:
+            logger.exception("Review job runner (%s) crashed", priority)
+        finally:
+            connections.close_all()
+
+
+class DatabaseReviewBackend:
+    """Nothing to dispatch: run_review_workers processes poll the ReviewJob table"""
+    name = 'database'
+
+    def dispatch(self, priority, delay=None):
+        pass
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_review_backend(name=None):
+    """Return the process-wide backend instance for name (default: REVIEW_JOB_BACKEND)"""
+    name = name or getattr(settings, 'REVIEW_JOB_BACKEND', 'thread')
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name == 'celery':
+                backend = CeleryReviewBackend()
+            elif name == 'thread':
+                backend = ThreadPoolReviewBackend()
+            elif name == 'database':
+                backend = DatabaseReviewBackend()
+            else:
+                raise ValueError(f"Unknown review job backend: {name}")
+            _backends[name] = backend
+    return backend
+
+
+def enqueue_review(lesson_note, delay: float = None, priority: str = 'INTERACTIVE') -> ReviewJob:
+    """
+    Create a ReviewJob for lesson_note and dispatch it once the current
+    transaction commits, so workers never see an uncommitted note. delay
+    (seconds) holds the job back, e.g. while the LLM is throttled.
+    """
+    backend = get_review_backend()
+    available_at = timezone.now() + timedelta(seconds=delay) if delay else None
+    job = ReviewJob.objects.create(
+        lesson_note=lesson_note, backend=backend.name, priority=priority, available_at=available_at
+    )
+    transaction.on_commit(lambda: backend.dispatch(priority, delay=delay))
+    return job
+
+
+def enqueue_reviews(lesson_notes, batch_id, priority: str = 'BULK', force: bool = False) -> list:
+    """
+    Bulk variant of enqueue_review: one INSERT for all jobs, tagged with
+    batch_id so clients can poll the batch as a whole. force makes every
+    job review its note from scratch (see incremental_review).
+    """
+    backend = get_review_backend()
+    jobs = ReviewJob.objects.bulk_create([
+        ReviewJob(
+            lesson_note=lesson_note, teacher_id=lesson_note.teacher_id, backend=backend.name, batch_id=batch_id,
+            priority=priority, force=force,
+        )
+        for lesson_note in lesson_notes
+    ])
+    if jobs and jobs[0].pk is None:
+        # MySQL can't return primary keys from a bulk INSERT
+        jobs = list(ReviewJob.objects.filter(
+            batch_id=batch_id, lesson_note_id__in=[lesson_note.pk for lesson_note in lesson_notes], status='QUEUED'
+        ).order_by('id'))
+
+    def dispatch_all():
+        for _ in jobs:
+            backend.dispatch(priority)
+
+    transaction.on_commit(dispatch_all)
+    return jobs
+
+
+def _percentile(samples: list, pct: float):
+    if not samples:
+        return None
+    rank = max(0, math.ceil(pct / 100.0 * len(samples)) - 1)
+    return round(samples[min(rank, len(samples) - 1)], 3)
+
+
+def queue_wait_stats(window_seconds: float = None) -> dict:
+    """
+    Per priority class: jobs waiting now, the oldest one's age, and wait
+    percentiles of jobs started in the last window_seconds (default
+    REVIEW_WAIT_STATS_WINDOW)
+    """
+    if window_seconds is None:
+        window_seconds = getattr(settings, 'REVIEW_WAIT_STATS_WINDOW', 3600)
+    now = timezone.now()
+    queued = {
+        row['priority']: row for row in ReviewJob.objects.filter(status='QUEUED').values('priority').annotate(
+            count=Count('id'), oldest=Min('created_at')
+        ).order_by()
+    }
+    stats = {}
+    for priority in PRIORITIES:
+        waits = sorted(
+            ReviewJob.objects.filter(
+                priority=priority, started_at__gte=now - timedelta(seconds=window_seconds), wait_seconds__isnull=False
+            ).order_by('-started_at').values_list('wait_seconds', flat=True)[:5000]
+        )
+        waiting = queued.get(priority)
+        stats[priority.lower()] = {
+            'queued': waiting['count'] if waiting else 0,
+            'oldest_queued_seconds': round((now - waiting['oldest']).total_seconds(), 1) if waiting else None,
+            'started': len(waits),
+            'wait_p50': _percentile(waits, 50),
+            'wait_p95': _percentile(waits, 95),
+            'wait_max': round(waits[-1], 3) if waits else None,
+        }
+    return stats
+
+
+def review_job_stats():
+    """Job counts per status and queue wait per priority class"""
+    counts = {status: 0 for status, _ in ReviewJob.STATUS_CHOICES}
+    for row in ReviewJob.objects.order_by().values('status').annotate(total=Count('id')):
+        counts[row['status']] = row['total']
+    return {
+        'backend': getattr(settings, 'REVIEW_JOB_BACKEND', 'thread'),
+        'by_status': counts,
+        'queue_wait': queue_wait_stats(),
+    }
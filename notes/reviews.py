@@ -0,0 +1,401 @@
+"""
+Review pipeline shared by the API views, async views and background tasks.
+
+A review runs in three stages so no database transaction (and no pooled
+connection's row locks) is held across the slow LLM call:
+
+1. a short transaction that commits the lesson note (done by the caller),
+2. the LLM review, outside any transaction, bounded by REVIEW_LLM_TIMEOUT,
+3. a short transaction that commits the Feedback.
+
+Regenerating a review first compares the note's content fingerprint with the
+one its last AI review recorded (see fingerprints): an unchanged note reuses
+that review, and a note with a few edited sections only has those re-reviewed.
+A note with no usable review of its own is looked up in the near-duplicate
+index: a near-identical note's review is reused, a similar one seeds an
+incremental review. Reviews are addressed to the teacher named in the
+prompt, so another teacher's review is readdressed before it is reused, and
+the other teacher's note id is not reported.
+
+While a review waits in the queue, the note gets a provisional HEURISTIC
+Feedback scored locally (see heuristics); the AI review replaces it.
+
+Concurrent reviews of the same note are coalesced into one (see
+single_flight), so a double-clicked regenerate makes a single LLM call.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .fingerprints import plan_review
+from .heuristics import heuristic_feedback
+from .near_duplicates import find_near_duplicate
+from .models import Feedback, LessonNote
+from .llm_clients import get_feedback_generator
+from .single_flight import arun_single_flight, run_single_flight
+
+
+@contextmanager
+def short_transaction(timeout: float = None):
+    """
+    transaction.atomic() for the quick DB stages of a review. On MySQL, lock
+    waits inside the block are capped at timeout (default
+    REVIEW_DB_STAGE_TIMEOUT) seconds so a stage fails fast instead of queueing
+    behind unrelated writers.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'REVIEW_DB_STAGE_TIMEOUT', 5)
+    with transaction.atomic():
+        if connection.vendor == 'mysql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET SESSION innodb_lock_wait_timeout = %s', [max(1, int(timeout))])
+        yield
+
+
+def save_ai_feedback(lesson_note, feedback_data, review_mode: str = 'FULL', tokens_saved: int = 0,
+                     source_feedback=None, idempotency_key: str = None) -> Feedback:
+    """
+    Persist structured AI feedback for a lesson note, recording the content
+    it covered (not for fallback feedback, which must never be reused). If
+    feedback was already stored under idempotency_key, that row is returned
+    and nothing new is stored.
+    """
+    if idempotency_key:
+        existing = Feedback.objects.filter(idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing
+    try:
+        return _store_ai_feedback(
+            lesson_note, feedback_data, review_mode, tokens_saved, source_feedback, idempotency_key
+        )
+    except IntegrityError:
+        # Another run of the same job stored it first
+        if not idempotency_key:
+            raise
+        return Feedback.objects.get(idempotency_key=idempotency_key)
+
+
+def _store_ai_feedback(lesson_note, feedback_data, review_mode, tokens_saved, source_feedback, idempotency_key):
+    reviewed = not get_feedback_generator().is_fallback(feedback_data)
+    with short_transaction():
+        # The provisional score is superseded by the real review
+        Feedback.objects.filter(lesson_note=lesson_note, reviewer_type='HEURISTIC').delete()
+        feedback = Feedback.objects.create(
+            lesson_note=lesson_note,
+            reviewer='AI Assistant',
+            reviewer_type='AI',
+            feedback_text=feedback_data['feedback_text'],
+            score=feedback_data['score'],
+            strengths=feedback_data['strengths'],
+            suggestions=feedback_data['suggestions'],
+            areas_for_improvement=feedback_data['areas_for_improvement'],
+            overall_assessment=feedback_data['overall_assessment'],
+            review_mode=review_mode,
+            content_fingerprint=lesson_note.content_fingerprint if reviewed else '',
+            section_hashes=lesson_note.section_hashes if reviewed else [],
+            tokens_saved=tokens_saved,
+            source_feedback=source_feedback,
+            idempotency_key=idempotency_key or None,
+        )
+        if tokens_saved:
+            LessonNote.objects.filter(pk=lesson_note.pk).update(
+                review_tokens_saved=F('review_tokens_saved') + tokens_saved
+            )
+        return feedback
+
+
+def save_provisional_feedback(lesson_notes) -> dict:
+    """
+    Score notes locally and store the result as provisional HEURISTIC
+    Feedback, scoring the whole batch in one vectorised pass. Notes that
+    already have an AI review keep it. Returns {lesson_note_id: Feedback}.
+    """
+    if not getattr(settings, 'PROVISIONAL_FEEDBACK_ENABLED', True):
+        return {}
+    reviewed_ids = set(
+        Feedback.objects.filter(lesson_note__in=lesson_notes, reviewer_type='AI')
+        .values_list('lesson_note_id', flat=True)
+    )
+    pending = [note for note in lesson_notes if note.pk not in reviewed_ids]
+    if not pending:
+        return {}
+    provisional = [
+        Feedback(
+            lesson_note=lesson_note,
+            reviewer='Automatic Check',
+            reviewer_type='HEURISTIC',
+            feedback_text=feedback_data['feedback_text'],
+            score=feedback_data['score'],
+            strengths=feedback_data['strengths'],
+            suggestions=feedback_data['suggestions'],
+            areas_for_improvement=feedback_data['areas_for_improvement'],
+            overall_assessment=feedback_data['overall_assessment'],
+        )
+        for lesson_note, feedback_data in zip(pending, heuristic_feedback([note.content for note in pending]))
+    ]
+    with short_transaction():
+        Feedback.objects.filter(lesson_note__in=pending, reviewer_type='HEURISTIC').delete()
+        Feedback.objects.bulk_create(provisional)
+    return {feedback.lesson_note_id: feedback for feedback in provisional}
+
+
+def feedback_as_data(feedback) -> dict:
+    """The structured feedback dict for a stored Feedback row"""
+    return {
+        'feedback_text': feedback.feedback_text,
+        'score': feedback.score,
+        'strengths': feedback.strengths,
+        'suggestions': feedback.suggestions,
+        'areas_for_improvement': feedback.areas_for_improvement,
+        'overall_assessment': feedback.overall_assessment,
+    }
+
+
+def _donor_feedback_data(lesson_note, donor) -> dict:
+    """
+    feedback_as_data() of a near-duplicate donor review, with the donor
+    teacher's name (whole, then each part) replaced by lesson_note's teacher's
+    """
+    data = feedback_as_data(donor)
+    donor_name, name = donor.lesson_note.teacher.name.split(), lesson_note.teacher.name.split()
+    if donor.lesson_note.teacher_id == lesson_note.teacher_id or not donor_name or not name:
+        return data
+    # Full name first; then a lone first or last name becomes the matching part
+    replacements = {' '.join(donor_name): ' '.join(name)}
+    for i, part in enumerate(donor_name):
+        if len(part) > 1:
+            replacements.setdefault(part, name[0] if i == 0 and len(donor_name) > 1 else name[-1])
+    pattern = re.compile(r'(?<!\w)(' + '|'.join(map(re.escape, replacements)) + r')(?!\w)')
+
+    def readdress(text):
+        return pattern.sub(lambda found: replacements[found.group(1)], text)
+
+    return {
+        key: readdress(value) if isinstance(value, str)
+        else [readdress(item) for item in value] if isinstance(value, list) else value
+        for key, value in data.items()
+    }
+
+
+def _review_outcome(mode, plan, tokens_saved=0, sections_reviewed=None, source=None, lesson_note=None):
+    outcome = {
+        'mode': mode,
+        'sections': len(plan.sections),
+        'sections_reviewed': len(plan.sections) if sections_reviewed is None else sections_reviewed,
+        'tokens_saved': tokens_saved,
+    }
+    if source is not None:
+        feedback, similarity = source
+        outcome['similarity'] = round(similarity, 3)
+        # Another teacher's note id is not theirs to see
+        if feedback.lesson_note.teacher_id == lesson_note.teacher_id:
+            outcome['source_lesson_note_id'] = feedback.lesson_note_id
+    return outcome
+
+
+def _reuse_previous_review(lesson_note, previous, plan):
+    """Answer a regeneration of an unchanged note with its last AI review"""
+    tokens_saved = get_feedback_generator().full_review_tokens(lesson_note)
+    LessonNote.objects.filter(pk=lesson_note.pk).update(
+        reviews_skipped=F('reviews_skipped') + 1,
+        review_tokens_saved=F('review_tokens_saved') + tokens_saved,
+    )
+    return previous, feedback_as_data(previous), _review_outcome('unchanged', plan, tokens_saved, 0)
+
+
+def _near_duplicate_plan(lesson_note):
+    """
+    (plan, (feedback, similarity)) for the best near-duplicate review, where
+    plan.mode is 'unchanged' when that review can be copied as it is
+    """
+    if not getattr(settings, 'AI_NEAR_DUPLICATE_ENABLED', True):
+        return None, None
+    match = find_near_duplicate(lesson_note)
+    if match is None:
+        return None, None
+    donor, similarity = match
+    plan = plan_review(lesson_note, donor, match_header=False)
+    if similarity >= getattr(settings, 'AI_NEAR_DUPLICATE_REUSE_SIMILARITY', 0.85):
+        plan.mode = 'unchanged'
+    return plan, match
+
+
+def _reuse_near_duplicate(lesson_note, plan, match, idempotency_key=None):
+    """Store a copy of a near-duplicate note's review, readdressed to this note's teacher"""
+    donor, _ = match
+    tokens_saved = get_feedback_generator().full_review_tokens(lesson_note)
+    feedback_data = _donor_feedback_data(lesson_note, donor)
+    feedback = save_ai_feedback(
+        lesson_note, feedback_data, 'NEAR_DUPLICATE', tokens_saved, source_feedback=donor,
+        idempotency_key=idempotency_key,
+    )
+    return feedback, feedback_data, _review_outcome('near_duplicate', plan, tokens_saved, 0, match, lesson_note)
+
+
+def incremental_review(lesson_note, timeout: float = None, force: bool = False, idempotency_key: str = None):
+    """
+    Review a lesson note, reusing earlier reviews where the content allows.
+    Returns (feedback, feedback_data, outcome); outcome['mode'] is
+    'unchanged' (feedback is the previous row, nothing new stored),
+    'incremental', 'near_duplicate' (copied from a near-identical note),
+    'seeded' (incremental review on top of a similar note's review) or
+    'full', with the sections reviewed and the estimated LLM tokens saved.
+    force skips all reuse. New feedback is stored under idempotency_key
+    (see save_ai_feedback). Raises ReviewTimeout / ReviewDeferred like
+    review_lesson_note.
+
+    A caller that arrives while the same note is being reviewed shares that
+    review; its outcome has 'coalesced': True.
+    """
+    def review(waited):
+        # Another worker has just reviewed the note: reuse that, even if forced
+        return _incremental_review(lesson_note, timeout, force and not waited, idempotency_key)
+
+    (feedback, feedback_data, outcome), coalesced = run_single_flight(lesson_note, review, timeout)
+    if coalesced:
+        outcome = {**outcome, 'coalesced': True}
+    return feedback, feedback_data, outcome
+
+
+def _incremental_review(lesson_note, timeout, force, idempotency_key=None):
+    previous = None if force else lesson_note.ai_feedback
+    plan = plan_review(lesson_note, previous)
+    if plan.mode == 'unchanged':
+        return _reuse_previous_review(lesson_note, previous, plan)
+
+    match = None
+    if plan.mode == 'full' and not force:
+        near_plan, match = _near_duplicate_plan(lesson_note)
+        if near_plan is not None and near_plan.mode == 'unchanged':
+            return _reuse_near_duplicate(lesson_note, near_plan, match, idempotency_key)
+        if near_plan is not None and near_plan.mode == 'incremental':
+            plan, previous = near_plan, match[0]
+
+    generator = get_feedback_generator()
+    if plan.mode == 'incremental':
+        previous_data = _donor_feedback_data(lesson_note, previous) if match else feedback_as_data(previous)
+        result = generator.generate_incremental_feedback(lesson_note, previous_data, plan, timeout=timeout)
+        if result is not None:
+            feedback_data, tokens_saved = result
+            feedback = save_ai_feedback(
+                lesson_note, feedback_data, 'INCREMENTAL', tokens_saved, source_feedback=match and match[0],
+                idempotency_key=idempotency_key,
+            )
+            return feedback, feedback_data, _review_outcome(
+                'seeded' if match else 'incremental', plan, tokens_saved, len(plan.changed_indexes), match,
+                lesson_note,
+            )
+
+    # A forced review must reach the model, not the cache of identical prompts
+    feedback_data = generator.generate_feedback(lesson_note, use_cache=not force, timeout=timeout)
+    feedback = save_ai_feedback(lesson_note, feedback_data, idempotency_key=idempotency_key)
+    return feedback, feedback_data, _review_outcome('full', plan)
+
+
+async def aincremental_review(lesson_note, timeout: float = None, force: bool = False):
+    """Async variant of incremental_review"""
+    def areview(waited):
+        return _aincremental_review(lesson_note, timeout, force and not waited)
+
+    (feedback, feedback_data, outcome), coalesced = await arun_single_flight(lesson_note, areview, timeout)
+    if coalesced:
+        outcome = {**outcome, 'coalesced': True}
+    return feedback, feedback_data, outcome
+
+
+async def _aincremental_review(lesson_note, timeout, force):
+    previous = None if force else await sync_to_async(lambda: lesson_note.ai_feedback)()
+    plan = plan_review(lesson_note, previous)
+    if plan.mode == 'unchanged':
+        return await sync_to_async(_reuse_previous_review)(lesson_note, previous, plan)
+
+    match = None
+    if plan.mode == 'full' and not force:
+        near_plan, match = await sync_to_async(_near_duplicate_plan)(lesson_note)
+        if near_plan is not None and near_plan.mode == 'unchanged':
+            return await sync_to_async(_reuse_near_duplicate)(lesson_note, near_plan, match)
+        if near_plan is not None and near_plan.mode == 'incremental':
+            plan, previous = near_plan, match[0]
+
+    generator = get_feedback_generator()
+    if plan.mode == 'incremental':
+        previous_data = await sync_to_async(
+            lambda: _donor_feedback_data(lesson_note, previous) if match else feedback_as_data(previous)
+        )()
+        result = await generator.agenerate_incremental_feedback(lesson_note, previous_data, plan, timeout=timeout)
+        if result is not None:
+            feedback_data, tokens_saved = result
+            feedback = await sync_to_async(save_ai_feedback)(
+                lesson_note, feedback_data, 'INCREMENTAL', tokens_saved, source_feedback=match and match[0]
+            )
+            return feedback, feedback_data, _review_outcome(
+                'seeded' if match else 'incremental', plan, tokens_saved, len(plan.changed_indexes), match,
+                lesson_note,
+            )
+
+    feedback_data = await generator.agenerate_feedback(lesson_note, use_cache=not force, timeout=timeout)
+    feedback = await sync_to_async(save_ai_feedback)(lesson_note, feedback_data)
+    return feedback, feedback_data, _review_outcome('full', plan)
+
+
+def review_lesson_note(lesson_note, timeout: float = None, idempotency_key: str = None, force: bool = False):
+    """
+    Generate and store AI feedback. Returns (feedback, feedback_data).
+    Raises ai_feedback.ReviewTimeout if the LLM stage overruns timeout, or
+    ReviewDeferred if the LLM is throttled; nothing is stored in either case.
+    A note whose content has not changed since its last AI review gets that
+    review back (see incremental_review), unless force is set.
+    """
+    feedback, feedback_data, _ = incremental_review(
+        lesson_note, timeout=timeout, force=force, idempotency_key=idempotency_key
+    )
+    return feedback, feedback_data
+
+
+async def areview_lesson_note(lesson_note, timeout: float = None):
+    """Async variant of review_lesson_note; the LLM call does not hold a thread"""
+    feedback, feedback_data, _ = await aincremental_review(lesson_note, timeout=timeout)
+    return feedback, feedback_data
+
+
+def review_lesson_notes(lesson_notes, concurrency: int, timeout: float = None) -> list:
+    """
+    Review many notes with at most `concurrency` running at once (further
+    bounded by the per-process AI_MAX_CONCURRENT_CALLS slots). Returns one
+    (feedback, feedback_data, error) tuple per note in input order; error is
+    the exception raised for that note, if any.
+    """
+    def review_one(lesson_note):
+        try:
+            feedback, feedback_data = review_lesson_note(lesson_note, timeout=timeout)
+            return feedback, feedback_data, None
+        except Exception as e:
+            return None, None, e
+        finally:
+            # Each pool thread opened its own connection
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='bulk-review') as pool:
+        return list(pool.map(review_one, lesson_notes))
+
+
+def incremental_review_stats():
+    """Reuse and incremental-review totals across all lesson notes"""
+    notes = LessonNote.objects.aggregate(
+        reviews_skipped=Sum('reviews_skipped'), tokens_saved=Sum('review_tokens_saved')
+    )
+    feedback = Feedback.objects.filter(reviewer_type='AI').aggregate(
+        full=Count('id', filter=Q(review_mode='FULL')),
+        incremental=Count('id', filter=Q(review_mode='INCREMENTAL')),
+    )
+    return {
+        'full_reviews': feedback['full'],
+        'incremental_reviews': feedback['incremental'],
+        'reviews_skipped': notes['reviews_skipped'] or 0,
+        'llm_tokens_saved': notes['tokens_saved'] or 0,
+    }
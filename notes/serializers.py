@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Teacher, LessonNote, Feedback
+from .models import Teacher, LessonNote, Feedback, ReviewJob, LESSON_NOTE_FEEDBACK_SUMMARY_FIELDS
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
@@ -17,8 +17,7 @@ class TeacherSerializer(serializers.ModelSerializer):
 class LessonNoteSerializer(serializers.ModelSerializer):
     teacher_name = serializers.CharField(source='teacher.name', read_only=True)
     teacher_id = serializers.CharField(source='teacher.id', read_only=True)
-    feedback_count = serializers.SerializerMethodField()
-    has_ai_feedback = serializers.SerializerMethodField()
+    has_ai_feedback = serializers.BooleanField(read_only=True)
     latest_feedback = serializers.SerializerMethodField()
 
     class Meta:
@@ -26,28 +25,16 @@ class LessonNoteSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'subject', 'grade_level', 'term', 'content', 
             'submitted_at', 'status', 'teacher', 'teacher_name', 
-            'teacher_id', 'feedback_count', 'has_ai_feedback', 
-            'latest_feedback'
+            'teacher_id', 'feedback_count', 'ai_feedback_count', 'has_ai_feedback', 
+            'latest_feedback', 'latest_score', 'last_reviewed_at'
         ]
         read_only_fields = ['teacher', 'submitted_at']
 
-    def get_feedback_count(self, obj):
-        return obj.feedback_set.count()
-
-    def get_has_ai_feedback(self, obj):
-        return obj.feedback_set.filter(reviewer_type='AI').exists()
-
     def get_latest_feedback(self, obj):
-        latest = obj.feedback_set.first()  # Uses ordering from model
+        # Joined by LessonNote.objects.with_feedback_summary()
+        latest = obj.latest_feedback
         if latest:
-            return {
-                'id': latest.id,
-                'reviewer': latest.reviewer,
-                'reviewer_type': latest.reviewer_type,
-                'score': latest.score,
-                'created_at': latest.created_at,
-                'overall_assessment': latest.overall_assessment
-            }
+            return {field: getattr(latest, field) for field in LESSON_NOTE_FEEDBACK_SUMMARY_FIELDS}
         return None
 
 class FeedbackSerializer(serializers.ModelSerializer):
@@ -122,4 +109,17 @@ class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'teacher_name', 'teacher_id']
-        read_only_fields = ['id', 'username']
\ No newline at end of file
+        read_only_fields = ['id', 'username']
+
+
+class ReviewJobSerializer(serializers.ModelSerializer):
+    lesson_note_id = serializers.IntegerField(read_only=True)
+    feedback_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ReviewJob
+        fields = [
+            'id', 'lesson_note_id', 'status', 'priority', 'backend', 'feedback_id',
+            'error', 'attempts', 'created_at', 'started_at', 'finished_at', 'wait_seconds'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,40 @@
+import logging
+
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .authentication import forget_cached_user
+from .models import LessonNote
+from .near_duplicates import index_lesson_notes
+from .token_revocation import revoke_user_tokens
+
+logger = logging.getLogger(__name__)
+
+# Fields that feed the near-duplicate signature or its scope
+_INDEXED_FIELDS = {'content', 'subject', 'grade_level'}
+
+
+@receiver(post_save, sender=LessonNote)
+def index_near_duplicates(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the near-duplicate index in step with a saved lesson note"""
+    if raw or not getattr(settings, 'AI_NEAR_DUPLICATE_ENABLED', True):
+        return
+    if update_fields is not None and not _INDEXED_FIELDS & set(update_fields):
+        return
+    try:
+        index_lesson_notes([instance])
+    except Exception:
+        # The index is an optimisation; never fail the save over it
+        logger.exception("Near-duplicate indexing failed for lesson note %s", instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def revoke_deactivated_user_tokens(sender, instance, created=False, raw=False, **kwargs):
+    """Keep cached and token-described users in step with the users table"""
+    if raw:
+        return
+    forget_cached_user(instance.pk)
+    if not created and not instance.is_active:
+        # Reads trust the is_active claim; revoking is what locks them out
+        revoke_user_tokens(instance, reason='User deactivated')
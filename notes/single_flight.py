@@ -0,0 +1,225 @@
+"""
+Single-flight coalescing of concurrent reviews of the same lesson note.
+
+Double-clicked regenerate buttons and client retries arrive as simultaneous
+reviews of one note. Only the first caller (the leader) reviews it:
+
+- within a process, later callers wait on the leader's in-flight call and
+  get its result (or its exception) back;
+- across processes, a ReviewLock row - unique per note - marks the review
+  as in flight. A worker that finds the marker polls until it is released
+  and then runs the review itself, which by then finds the leader's
+  Feedback and reuses it (see fingerprints.plan_review) instead of calling
+  the LLM again.
+
+Markers carry a lease (REVIEW_SINGLE_FLIGHT_LEASE) so a crashed worker's
+marker is taken over once it expires. A caller that waits longer than its
+review deadline gets ReviewTimeout, so views queue the review as usual.
+"""
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .ai_feedback import ReviewTimeout
+from .models import ReviewLock
+
+
+class InFlightReview:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Per-process table of in-flight reviews, keyed by lesson note id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.cross_worker_waits = 0
+        self.wait_timeouts = 0
+
+    def join(self, key):
+        """(call, is_leader): the leader must finish() the call"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = InFlightReview()
+            self.leaders += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result, call.error = result, error
+        call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+_flights = SingleFlight()
+
+
+def _reset_flights():
+    global _flights
+    _flights = SingleFlight()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_flights)
+
+
+def single_flight_enabled() -> bool:
+    return getattr(settings, 'REVIEW_SINGLE_FLIGHT_ENABLED', True)
+
+
+def _lease() -> float:
+    return getattr(settings, 'REVIEW_SINGLE_FLIGHT_LEASE', 120)
+
+
+def _poll_interval() -> float:
+    return getattr(settings, 'REVIEW_SINGLE_FLIGHT_POLL', 0.25)
+
+
+def _wait_limit(timeout) -> float:
+    """How long a caller waits for another review: its own deadline, else the lease"""
+    return timeout if timeout is not None else _lease()
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+
+def acquire_marker(lesson_note_id, owner: str) -> bool:
+    """Insert the note's in-flight marker, taking over an expired one. False if another worker holds it"""
+    now = timezone.now()
+    ReviewLock.objects.filter(lesson_note_id=lesson_note_id, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            ReviewLock.objects.create(
+                lesson_note_id=lesson_note_id, owner=owner, expires_at=now + timedelta(seconds=_lease())
+            )
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_marker(lesson_note_id, owner: str):
+    ReviewLock.objects.filter(lesson_note_id=lesson_note_id, owner=owner).delete()
+
+
+def _wait_timeout(lesson_note_id):
+    _flights.wait_timeouts += 1
+    return ReviewTimeout(f"A review of lesson note {lesson_note_id} is already in progress")
+
+
+def _lead(lesson_note_id, review, timeout):
+    owner = _owner()
+    deadline = time.monotonic() + _wait_limit(timeout)
+    waited = False
+    while not acquire_marker(lesson_note_id, owner):
+        if not waited:
+            waited = True
+            _flights.cross_worker_waits += 1
+        if time.monotonic() >= deadline:
+            raise _wait_timeout(lesson_note_id)
+        time.sleep(_poll_interval())
+    try:
+        return review(waited), waited
+    finally:
+        release_marker(lesson_note_id, owner)
+
+
+def run_single_flight(lesson_note, review, timeout: float = None):
+    """
+    Run review(waited) for lesson_note unless the same note's review is
+    already in flight, in which case wait for it. waited is True when another
+    worker's review of the note finished first. Returns (result, coalesced).
+    """
+    if not single_flight_enabled() or lesson_note.pk is None:
+        return review(False), False
+    key = lesson_note.pk
+    call, is_leader = _flights.join(key)
+    if not is_leader:
+        if not call.done.wait(_wait_limit(timeout)):
+            raise _wait_timeout(key)
+        if call.error is not None:
+            raise call.error
+        return call.result[0], True
+
+    try:
+        result = _lead(key, review, timeout)
+    except BaseException as e:
+        _flights.finish(key, call, error=e)
+        raise
+    _flights.finish(key, call, result=result)
+    return result
+
+
+async def _alead(lesson_note_id, areview, timeout):
+    owner = _owner()
+    deadline = time.monotonic() + _wait_limit(timeout)
+    waited = False
+    while not await sync_to_async(acquire_marker)(lesson_note_id, owner):
+        if not waited:
+            waited = True
+            _flights.cross_worker_waits += 1
+        if time.monotonic() >= deadline:
+            raise _wait_timeout(lesson_note_id)
+        await asyncio.sleep(_poll_interval())
+    try:
+        return await areview(waited), waited
+    finally:
+        await sync_to_async(release_marker)(lesson_note_id, owner)
+
+
+async def arun_single_flight(lesson_note, areview, timeout: float = None):
+    """Async variant of run_single_flight; areview(waited) returns a coroutine"""
+    if not single_flight_enabled() or lesson_note.pk is None:
+        return await areview(False), False
+    key = lesson_note.pk
+    call, is_leader = _flights.join(key)
+    if not is_leader:
+        finished = await sync_to_async(call.done.wait, thread_sensitive=False)(_wait_limit(timeout))
+        if not finished:
+            raise _wait_timeout(key)
+        if call.error is not None:
+            raise call.error
+        return call.result[0], True
+
+    try:
+        result = await _alead(key, areview, timeout)
+    except BaseException as e:
+        _flights.finish(key, call, error=e)
+        raise
+    _flights.finish(key, call, result=result)
+    return result
+
+
+def single_flight_stats():
+    return {
+        'enabled': single_flight_enabled(),
+        'in_flight': _flights.in_flight(),
+        'leaders': _flights.leaders,
+        'coalesced': _flights.coalesced,
+        'cross_worker_waits': _flights.cross_worker_waits,
+        'wait_timeouts': _flights.wait_timeouts,
+        'markers_held': ReviewLock.objects.filter(expires_at__gt=timezone.now()).count(),
+    }
@@ -1,26 +1,44 @@
+import logging
+
 from celery import shared_task
-from .models import LessonNote, Feedback
-from .ai_feedback import AIFeedbackGenerator
+from .ai_feedback import ReviewDeferred
+from .models import LessonNote
+from .reviews import review_lesson_note
+from .review_jobs import defer_delay, enqueue_review, max_attempts, retry_delay, run_next_review_job, run_review_job
 
-@shared_task
-def generate_ai_feedback_async(lesson_note_id):
-    """Generate AI feedback asynchronously"""
+logger = logging.getLogger(__name__)
+
+@shared_task(bind=True)
+def generate_ai_feedback_async(self, lesson_note_id, job_id=None):
+    """
+    Generate AI feedback asynchronously, tracking progress on the ReviewJob
+    if given (the job retries and dead-letters itself). Without a job,
+    failures are retried up to REVIEW_JOB_MAX_ATTEMPTS times and then
+    raised, so Celery records the task as failed; a deferral doesn't use up
+    an attempt but hands the note to the review queue, due once the LLM is
+    expected back.
+    """
     try:
+        if job_id is not None:
+            run_review_job(job_id)
+            return
+
         lesson_note = LessonNote.objects.get(id=lesson_note_id)
-        ai_generator = AIFeedbackGenerator()
-        feedback_data = ai_generator.generate_feedback(lesson_note)
-        
-        Feedback.objects.create(
-            lesson_note=lesson_note,
-            reviewer='AI Assistant',
-            reviewer_type='AI',
-            feedback_text=feedback_data['feedback_text'],
-            score=feedback_data['score'],
-            strengths=feedback_data['strengths'],
-            suggestions=feedback_data['suggestions'],
-            areas_for_improvement=feedback_data['areas_for_improvement'],
-            overall_assessment=feedback_data['overall_assessment']
-        )
+        review_lesson_note(lesson_note)
 
+    except ReviewDeferred as e:
+        # The LLM is throttled or the circuit breaker is open - queue it for later
+        enqueue_review(lesson_note, delay=defer_delay(e))
     except Exception as e:
-        print(f"Async AI feedback generation failed: {str(e)}")
\ No newline at end of file
+        logger.exception("Async AI feedback generation failed for lesson note %s", lesson_note_id)
+        if self.request.retries + 1 >= max_attempts():
+            raise
+        raise self.retry(
+            exc=e, countdown=retry_delay(self.request.retries + 1), max_retries=max_attempts() - 1
+        )
+
+
+@shared_task
+def run_next_review_job_task(priority):
+    """Run the queued review jobs of a priority class (see review_jobs)"""
+    return run_next_review_job(priority)
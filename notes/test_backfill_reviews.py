@@ -0,0 +1,101 @@
+"""
+Tests for the resumable backfill_reviews command.
+
+Run with: python manage.py test notes.test_backfill_reviews
+"""
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import LessonNote, ReviewBackfill, ReviewJob, Teacher
+from .review_jobs import enqueue_reviews
+
+User = get_user_model()
+
+
+@override_settings(REVIEW_JOB_BACKEND='database')
+class BackfillReviewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = Teacher.objects.create(user=User.objects.create_user(username='backfill'), name='Backfill Teacher')
+        cls.notes = [
+            LessonNote.objects.create(
+                teacher=teacher, subject='Mathematics', grade_level='Grade 5', term=term,
+                content=f'Objectives: lesson {i}.',
+            )
+            for i, term in enumerate(['Term 1'] * 7 + ['Term 2'] * 2)
+        ]
+        cls.term_one = [note.id for note in cls.notes if note.term == 'Term 1']
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command('backfill_reviews', '--term', 'Term 1', '--chunk-size', '3', '--no-wait', *args, stdout=out)
+        return out.getvalue()
+
+    def queued_note_ids(self):
+        return sorted(ReviewJob.objects.values_list('lesson_note_id', flat=True))
+
+    def test_queues_every_matching_note_as_bulk_jobs(self):
+        self.backfill()
+        self.assertEqual(self.queued_note_ids(), self.term_one)
+        backfill = ReviewBackfill.objects.get()
+        self.assertEqual((backfill.total_notes, backfill.notes_queued, backfill.last_note_id), (7, 7, self.term_one[-1]))
+        self.assertEqual(set(ReviewJob.objects.values_list('priority', 'batch_id', 'force')),
+                         {('BULK', backfill.batch_id, True)})
+
+    def test_interrupted_run_resumes_from_its_checkpoint(self):
+        chunks = []
+
+        def enqueue_then_interrupt(lesson_notes, *args, **kwargs):
+            if chunks:
+                raise KeyboardInterrupt
+            chunks.append(lesson_notes)
+            return enqueue_reviews(lesson_notes, *args, **kwargs)
+
+        with mock.patch('notes.management.commands.backfill_reviews.enqueue_reviews', enqueue_then_interrupt):
+            self.assertIn('Interrupted after queueing up to note', self.backfill())
+        self.assertEqual(self.queued_note_ids(), self.term_one[:3])
+        self.assertEqual(ReviewBackfill.objects.get().last_note_id, self.term_one[2])
+
+        output = self.backfill()
+        self.assertIn('Resuming backfill', output)
+        self.assertEqual(self.queued_note_ids(), self.term_one)
+        self.assertEqual(ReviewBackfill.objects.get().notes_queued, 7)
+        self.assertEqual(ReviewJob.objects.values('batch_id').distinct().count(), 1)
+
+    def test_notes_added_after_the_checkpoint_are_picked_up(self):
+        self.backfill()
+        note = LessonNote.objects.create(
+            teacher=self.notes[0].teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1',
+            content='Objectives: a late lesson.',
+        )
+        self.backfill()
+        self.assertEqual(self.queued_note_ids(), self.term_one + [note.id])
+
+    def test_other_filters_under_the_same_name_are_refused(self):
+        self.backfill('--name', 'shared')
+        with self.assertRaisesMessage(CommandError, 'was started with filters'):
+            call_command('backfill_reviews', '--term', 'Term 2', '--name', 'shared', '--no-wait', stdout=StringIO())
+
+    def test_finished_backfill_needs_restart(self):
+        self.backfill()
+        ReviewBackfill.objects.update(finished_at=timezone.now())
+        with self.assertRaisesMessage(CommandError, 'pass --restart'):
+            self.backfill()
+
+        self.backfill('--restart')
+        self.assertEqual(len(self.queued_note_ids()), 14)
+        self.assertEqual(ReviewBackfill.objects.get().notes_queued, 7)
+
+    def test_reuse_queues_jobs_that_may_keep_the_last_review(self):
+        self.backfill('--reuse')
+        self.assertFalse(ReviewJob.objects.filter(force=True).exists())
+
+    def test_dry_run_queues_nothing(self):
+        self.assertIn('7 lesson notes match', self.backfill('--dry-run'))
+        self.assertFalse(ReviewJob.objects.exists())
+        self.assertFalse(ReviewBackfill.objects.exists())
@@ -0,0 +1,96 @@
+"""
+Tests for bulk submission of lesson notes with bounded concurrent reviews.
+
+Run with: python manage.py test notes.test_bulk_submit
+"""
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .models import LessonNote, Teacher
+from .token_revocation import reload_revocations
+
+User = get_user_model()
+
+
+def note(**fields):
+    return {'subject': 'Mathematics', 'grade_level': 'Grade 5', 'term': 'Term 1',
+            'content': 'Objectives: add fractions.', **fields}
+
+
+class InFlightReview:
+    """Stands in for review_lesson_note and records the most reviews running at once"""
+
+    def __init__(self):
+        self.running = self.most_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, lesson_note, timeout=None):
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.05)
+        with self._lock:
+            self.running -= 1
+        return SimpleNamespace(id=lesson_note.id), {'score': 75}
+
+
+@override_settings(ASYNC_REVIEW_SUBMISSION=False, BULK_REVIEW_MAX_CONCURRENCY=2)
+class BulkSubmitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bulk')
+        cls.teacher = Teacher.objects.create(user=cls.user, name='Bulk Teacher')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        reload_revocations()
+
+    def submit(self, body):
+        return self.client.post('/api/lesson-notes/bulk/', body, format='json')
+
+    def test_invalid_items_are_reported_by_index_and_nothing_is_saved(self):
+        response = self.submit([note(), note(subject=''), note(), {'subject': 'Science'}])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(set(errors), {'1', '3'})
+        self.assertIn('subject', errors['1'])
+        self.assertIn('content', errors['3'])
+        self.assertFalse(LessonNote.objects.exists())
+
+    def test_reviews_run_under_the_concurrency_cap(self):
+        review = InFlightReview()
+        with mock.patch('notes.reviews.review_lesson_note', side_effect=review):
+            response = self.submit({'notes': [note() for _ in range(6)], 'concurrency': 999})
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['concurrency'], body['count'], body['reviewed']), (2, 6, 6))
+        self.assertEqual([item['index'] for item in body['results']], list(range(6)))
+        self.assertEqual(review.most_running, 2)
+        self.assertEqual(LessonNote.objects.filter(teacher=self.teacher).count(), 6)
+
+    def test_concurrency_below_one_runs_reviews_one_at_a_time(self):
+        review = InFlightReview()
+        with mock.patch('notes.reviews.review_lesson_note', side_effect=review):
+            response = self.submit({'notes': [note(), note(), note()], 'concurrency': 0})
+        self.assertEqual(response.json()['concurrency'], 1)
+        self.assertEqual(review.most_running, 1)
+
+    def test_failed_review_is_reported_per_item(self):
+        review = InFlightReview()
+
+        def fail_marked(lesson_note, timeout=None):
+            if lesson_note.content.endswith('fail'):
+                raise RuntimeError('provider exploded')
+            return review(lesson_note, timeout)
+
+        with mock.patch('notes.reviews.review_lesson_note', side_effect=fail_marked), \
+                self.assertLogs('notes.views', 'ERROR'):
+            response = self.submit([note(), note(content='Objectives: fail'), note()])
+        self.assertEqual([item['status'] for item in response.json()['results']], ['reviewed', 'failed', 'reviewed'])
@@ -0,0 +1,169 @@
+"""
+Tests for map-reduce reviews of long lesson notes: chunk boundaries and
+budget, the merge of chunk reviews, and a failing chunk.
+
+Run with: python manage.py test notes.test_chunking
+"""
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .ai_feedback import AIFeedbackGenerator, ReviewDeferred
+from .chunking import Chunk, _split_oversized, chunk_content, merge_chunk_feedback, split_sections
+from .feedback_cache import get_feedback_cache
+from .llm_backends import FakeBackend, LLMTransientError
+from .models import LessonNote, Teacher
+from .rate_limits import TokenBucketLimiter
+
+User = get_user_model()
+
+
+def words(text):
+    """Token counter for exact budgets: joiners are whitespace, so they cost nothing"""
+    return len(text.split())
+
+
+def section(title, sentences):
+    return f"{title}:\n" + ' '.join(f"Sentence {i} of the {title.lower()} section." for i in range(sentences))
+
+
+NOTE = '\n\n'.join([
+    section('Objectives', 3), section('Materials', 2), section('Activities', 40), section('Assessment', 4),
+])
+
+
+class ChunkContentTests(SimpleTestCase):
+    def test_sections_are_kept_whole_and_packed_under_the_budget(self):
+        chunks = chunk_content(section('Objectives', 3) + '\n\n' + section('Materials', 2), max_tokens=100,
+                               count_tokens=words)
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].titles, ['Objectives', 'Materials'])
+
+    def test_no_chunk_exceeds_the_budget_and_no_text_is_lost(self):
+        chunks = chunk_content(NOTE, max_tokens=60, count_tokens=words)
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            self.assertLessEqual(words(chunk.text), 60)
+            self.assertEqual(chunk.tokens, words(chunk.text))
+        self.assertEqual(' '.join(chunk.text for chunk in chunks).split(), NOTE.split())
+
+    def test_oversized_section_continues_across_chunks(self):
+        titles = [title for chunk in chunk_content(NOTE, max_tokens=60, count_tokens=words) for title in chunk.titles]
+        self.assertIn('Activities', titles)
+        self.assertIn('Activities (cont.)', titles)
+        self.assertEqual(titles[-1], 'Assessment')
+
+    def test_chunk_size_grows_to_respect_max_chunks(self):
+        chunks = chunk_content(NOTE, max_tokens=20, max_chunks=3, count_tokens=words)
+        self.assertLessEqual(len(chunks), 3)
+        self.assertEqual(' '.join(chunk.text for chunk in chunks).split(), NOTE.split())
+
+    def test_run_on_text_is_sliced_without_loss(self):
+        text = 'x' * 1000
+        pieces = _split_oversized(text, 50, lambda piece: len(piece) // 4)
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual(''.join(pieces), text)
+        self.assertTrue(all(len(piece) // 4 <= 50 for piece in pieces))
+
+    def test_split_sections_keeps_text_before_the_first_heading(self):
+        sections = split_sections("Intro line\n\nObjectives:\nAdd fractions.")
+        self.assertEqual(sections, [(None, 'Intro line'), ('Objectives', 'Objectives:\nAdd fractions.')])
+
+
+def review(score, strengths=(), suggestions=(), areas=(), text='Fine.', assessment='Good.'):
+    return {
+        'feedback_text': text, 'score': score, 'strengths': list(strengths), 'suggestions': list(suggestions),
+        'areas_for_improvement': list(areas), 'overall_assessment': assessment,
+    }
+
+
+class MergeChunkFeedbackTests(SimpleTestCase):
+    def test_score_is_weighted_by_chunk_length(self):
+        chunks = [Chunk('a', ['Objectives'], 100), Chunk('b', ['Activities'], 300)]
+        merged = merge_chunk_feedback(chunks, [review(40), review(80)])
+        self.assertEqual(merged['score'], 70)
+
+    def test_lists_are_interleaved_deduplicated_and_capped(self):
+        chunks = [Chunk('a', ['A'], 10), Chunk('b', ['B'], 10)]
+        merged = merge_chunk_feedback(chunks, [
+            review(70, strengths=['Clear goals', 'Good pacing', 'Uses visuals']),
+            review(70, strengths=['clear  GOALS', 'Group work', 'Exit ticket', 'Uses visuals']),
+        ], list_limit=4)
+        self.assertEqual(merged['strengths'], ['Clear goals', 'Good pacing', 'Group work', 'Uses visuals'])
+
+    def test_one_paragraph_per_part_and_distinct_assessments(self):
+        chunks = [Chunk('a', ['Objectives'], 10), Chunk('b', [None], 10)]
+        merged = merge_chunk_feedback(chunks, [
+            review(60, text='First.', assessment='Solid.'), review(90, text='Second.', assessment='Solid.'),
+        ])
+        self.assertEqual(merged['feedback_text'], 'Part 1 of 2 (Objectives): First.\n\nPart 2 of 2: Second.')
+        self.assertEqual(merged['overall_assessment'], 'Reviewed in 2 parts (part scores: 60, 90). Solid.')
+
+
+class FailingChunkBackend(FakeBackend):
+    """Fake backend that records its prompts and, if error is set, raises it for part 2"""
+
+    def __init__(self, error=None):
+        super().__init__('fake-model', latency=0)
+        self.error = error
+        self.prompts = []
+
+    def generate(self, prompt, generation_config, timeout=None):
+        self.prompts.append(prompt)
+        if self.error is not None and '**Part 2 of' in prompt:
+            raise self.error
+        return super().generate(prompt, generation_config, timeout=timeout)
+
+
+# Part reviews run in pool threads, so call metrics are off and the limiter
+# is an unlimited in-memory one
+@override_settings(
+    AI_REVIEW_CHUNK_THRESHOLD_TOKENS=50, AI_REVIEW_CHUNK_TOKENS=120, AI_REVIEW_CHUNK_CONCURRENCY=1,
+    AI_RETRY_ATTEMPTS=0, AI_CALL_METRICS_ENABLED=False,
+)
+class ChunkedReviewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = Teacher.objects.create(user=User.objects.create_user(username='chunks'), name='Chunk Teacher')
+        cls.note = LessonNote.objects.create(
+            teacher=teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1', content=NOTE,
+        )
+
+    def setUp(self):
+        get_feedback_cache().clear()
+        patcher = mock.patch('notes.rate_limits.get_rate_limiter', return_value=TokenBucketLimiter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generator(self, backend):
+        return AIFeedbackGenerator(model_name='fake-model', backend=backend)
+
+    def test_long_note_is_reviewed_in_parts_and_cached(self):
+        backend = FailingChunkBackend()
+        feedback = self.generator(backend).generate_feedback(self.note)
+        parts = len(backend.prompts)
+        self.assertGreater(parts, 1)
+        self.assertTrue(feedback['overall_assessment'].startswith(f'Reviewed in {parts} parts'))
+
+        self.assertEqual(self.generator(backend).generate_feedback(self.note), feedback)
+        self.assertEqual(len(backend.prompts), parts)
+
+    def assert_nothing_cached(self, backend):
+        backend.error, backend.prompts = None, []
+        self.generator(backend).generate_feedback(self.note)
+        self.assertTrue(backend.prompts)
+
+    def test_transient_failure_of_one_part_defers_the_whole_review(self):
+        backend = FailingChunkBackend(LLMTransientError('throttled'))
+        with self.assertRaises(ReviewDeferred), self.assertLogs('notes.ai_feedback', 'WARNING'):
+            self.generator(backend).generate_feedback(self.note)
+        self.assert_nothing_cached(backend)
+
+    def test_unexpected_failure_of_one_part_returns_uncached_fallback(self):
+        backend = FailingChunkBackend(RuntimeError('bad response'))
+        generator = self.generator(backend)
+        with self.assertLogs('notes.ai_feedback', 'ERROR'):
+            feedback = generator.generate_feedback(self.note)
+        self.assertTrue(generator.is_fallback(feedback))
+        self.assert_nothing_cached(backend)
@@ -0,0 +1,120 @@
+"""
+Tests for the two-tier AI feedback cache.
+
+Run with: python manage.py test notes.test_feedback_cache
+"""
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from .ai_feedback import AIFeedbackGenerator
+from .feedback_cache import FeedbackCache, get_feedback_cache, make_cache_key
+from .llm_backends import FakeBackend
+from .models import CachedFeedback, LessonNote, Teacher
+
+User = get_user_model()
+
+
+def lesson_note(**overrides):
+    fields = {'subject': 'Mathematics', 'grade_level': 'Grade 5', 'term': 'Term 1', 'content': 'Fractions.'}
+    return SimpleNamespace(**{**fields, **overrides})
+
+
+class CacheKeyTests(TestCase):
+    def test_reformatted_note_shares_its_key(self):
+        key = make_cache_key(lesson_note(), 'model', 1)
+        reformatted = lesson_note(subject='  mathematics ', content='Fractions.\n')
+        self.assertEqual(make_cache_key(reformatted, 'model', 1), key)
+
+    def test_content_model_and_prompt_version_change_the_key(self):
+        key = make_cache_key(lesson_note(), 'model', 1)
+        self.assertNotEqual(make_cache_key(lesson_note(content='Decimals.'), 'model', 1), key)
+        self.assertNotEqual(make_cache_key(lesson_note(), 'other-model', 1), key)
+        self.assertNotEqual(make_cache_key(lesson_note(), 'model', 2), key)
+
+
+class FeedbackCacheTests(TestCase):
+    def setUp(self):
+        self.cache = FeedbackCache(max_memory_entries=2, max_db_entries=2)
+
+    def test_miss_then_memory_hit(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', {'score': 80}, 'model', 1)
+        self.assertEqual(self.cache.get('key'), {'score': 80})
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['memory_hits'], stats['db_hits']), (1, 1, 0))
+
+    def test_database_hit_after_memory_eviction(self):
+        self.cache.set('key', {'score': 80}, 'model', 1)
+        self.cache.clear()
+        self.assertEqual(self.cache.get('key'), {'score': 80})
+        self.assertEqual(self.cache.stats()['db_hits'], 1)
+        entry = CachedFeedback.objects.get(key='key')
+        self.assertEqual(entry.hit_count, 1)
+        self.assertIsNotNone(entry.last_hit_at)
+
+    def test_cached_data_is_a_copy(self):
+        self.cache.set('key', {'strengths': ['clear']}, 'model', 1)
+        self.cache.get('key')['strengths'].append('changed')
+        self.assertEqual(self.cache.get('key'), {'strengths': ['clear']})
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        for key in ('a', 'b'):
+            self.cache.set(key, {'key': key}, 'model', 1)
+        self.cache.get('a')
+        self.cache.set('c', {'key': 'c'}, 'model', 1)
+        self.assertEqual(list(self.cache._memory), ['a', 'c'])
+
+    def test_expired_entry_is_a_miss(self):
+        self.cache.set('key', {'score': 80}, 'model', 1)
+        self.cache.clear()
+        CachedFeedback.objects.filter(key='key').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(self.cache.get('key'))
+        self.assertFalse(CachedFeedback.objects.filter(key='key').exists())
+
+    def test_purge_evicts_least_recently_hit_rows(self):
+        now = timezone.now()
+        for key, age in (('old-but-read', 3), ('unread', 2), ('new', 0)):
+            self.cache.set(key, {'key': key}, 'model', 1)
+            CachedFeedback.objects.filter(key=key).update(created_at=now - timedelta(hours=age))
+        CachedFeedback.objects.filter(key='old-but-read').update(last_hit_at=now - timedelta(hours=1))
+
+        self.assertEqual(self.cache.purge(), 1)
+        self.assertQuerySetEqual(
+            CachedFeedback.objects.order_by('key').values_list('key', flat=True), ['new', 'old-but-read']
+        )
+
+
+class GeneratorCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='feedback-cache', password='not-used-123')
+        cls.teacher = Teacher.objects.create(user=user, name='Feedback Cache Teacher')
+
+    def setUp(self):
+        get_feedback_cache().clear()
+        self.backend = FakeBackend('fake-model', latency=0)
+        self.generator = AIFeedbackGenerator(model_name='fake-model', backend=self.backend)
+
+    def add_note(self, content):
+        return LessonNote.objects.create(
+            teacher=self.teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1', content=content
+        )
+
+    def test_identical_note_is_reviewed_once(self):
+        with mock.patch.object(self.backend, 'generate', wraps=self.backend.generate) as generate:
+            first = self.generator.generate_feedback(self.add_note('Objectives: add fractions.'))
+            second = self.generator.generate_feedback(self.add_note('Objectives:  add fractions.'))
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(second, first)
+
+    def test_use_cache_false_calls_the_backend(self):
+        note = self.add_note('Objectives: add fractions.')
+        with mock.patch.object(self.backend, 'generate', wraps=self.backend.generate) as generate:
+            self.generator.generate_feedback(note)
+            self.generator.generate_feedback(note, use_cache=False)
+        self.assertEqual(generate.call_count, 2)
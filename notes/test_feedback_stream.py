@@ -0,0 +1,92 @@
+"""
+Tests for the Server-Sent Events AI feedback stream.
+
+Run with: python manage.py test notes.test_feedback_stream
+"""
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .ai_feedback import AIFeedbackGenerator
+from .feedback_cache import get_feedback_cache
+from .llm_backends import FakeBackend, LLMTransientError
+from .models import Feedback, LessonNote, ReviewJob, Teacher
+from .rate_limits import TokenBucketLimiter
+from .token_revocation import reload_revocations
+
+User = get_user_model()
+
+
+def parse_events(response):
+    """(event, data) pairs from a text/event-stream response"""
+    events = []
+    for block in b''.join(response.streaming_content).decode('utf-8').split('\n\n'):
+        if block:
+            fields = dict(line.split(': ', 1) for line in block.split('\n'))
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+@override_settings(AI_NEAR_DUPLICATE_ENABLED=False, AI_CALL_METRICS_ENABLED=False, REVIEW_JOB_BACKEND='database')
+class FeedbackStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='stream')
+        cls.teacher = Teacher.objects.create(user=cls.user, name='Stream Teacher')
+
+    def setUp(self):
+        get_feedback_cache().clear()
+        reload_revocations()
+        self.backend = FakeBackend('fake-model', latency=0)
+        generator = AIFeedbackGenerator(model_name='fake-model', backend=self.backend)
+        for patcher in (mock.patch('notes.views.get_feedback_generator', return_value=generator),
+                        mock.patch('notes.rate_limits.get_rate_limiter', return_value=TokenBucketLimiter())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.note = LessonNote.objects.create(
+            teacher=self.teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1',
+            content='Objectives: add fractions with unlike denominators.\n\nActivities: fraction strips in pairs.',
+        )
+
+    def stream(self):
+        response = self.client.get(f'/api/lesson-notes/{self.note.id}/ai-feedback/stream/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return parse_events(response)
+
+    def test_start_then_deltas_then_the_saved_feedback(self):
+        events = self.stream()
+        names = [name for name, _ in events]
+        self.assertEqual(names[0], 'start')
+        self.assertEqual(events[0][1], {'lesson_note_id': self.note.id})
+        self.assertEqual(names[-1], 'feedback')
+        self.assertGreater(names.count('delta'), 1)
+        self.assertEqual(set(names[1:-1]), {'delta'})
+
+        final = events[-1][1]
+        feedback = Feedback.objects.get(pk=final['feedback_id'])
+        self.assertEqual((feedback.lesson_note_id, feedback.reviewer_type), (self.note.id, 'AI'))
+        self.assertEqual(final['score'], feedback.score)
+        self.assertEqual(''.join(data['text'] for name, data in events if name == 'delta'), feedback.feedback_text)
+
+    def test_cached_review_streams_as_a_single_delta(self):
+        first = self.stream()
+        with mock.patch.object(self.backend, 'stream', wraps=self.backend.stream) as backend_stream:
+            events = self.stream()
+        backend_stream.assert_not_called()
+        self.assertEqual([name for name, _ in events], ['start', 'delta', 'feedback'])
+        self.assertEqual(events[1][1]['text'], first[-1][1]['feedback_text'])
+
+    def test_throttled_stream_ends_with_the_queued_job(self):
+        with mock.patch.object(self.backend, 'stream', side_effect=LLMTransientError('throttled')), \
+                self.assertLogs('notes.ai_feedback', 'WARNING'):
+            events = self.stream()
+        self.assertEqual([name for name, _ in events], ['start', 'queued'])
+        job = ReviewJob.objects.get(lesson_note=self.note)
+        self.assertEqual(events[-1][1]['job_id'], job.id)
+        self.assertFalse(Feedback.objects.filter(lesson_note=self.note, reviewer_type='AI').exists())
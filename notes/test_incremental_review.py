@@ -0,0 +1,127 @@
+"""
+Tests for reusing or incrementally redoing reviews of edited lesson notes.
+
+Run with: python manage.py test notes.test_incremental_review
+"""
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from .ai_feedback import AIFeedbackGenerator
+from .feedback_cache import get_feedback_cache
+from .fingerprints import plan_review
+from .llm_backends import FakeBackend
+from .models import Feedback, LessonNote, Teacher
+from .rate_limits import TokenBucketLimiter
+from .reviews import incremental_review
+
+User = get_user_model()
+
+SECTIONS = {
+    'Objectives': 'Students add fractions with unlike denominators and compare the parts.',
+    'Activities': 'Group work with fraction strips, then pairs explain their answers.',
+    'Assessment': 'An exit ticket with three problems checks every student.',
+    'Homework': 'A worksheet on equivalent fractions for practice at home.',
+}
+
+
+def note_content(**changes):
+    return '\n\n'.join(f"{title}:\n{changes.get(title, text)}" for title, text in SECTIONS.items())
+
+
+# Call metrics and rate limit buckets are written from the part-review threads,
+# which SQLite test databases can't share; the limiter is replaced by an unlimited one
+@override_settings(AI_NEAR_DUPLICATE_ENABLED=False, AI_CALL_METRICS_ENABLED=False)
+class IncrementalReviewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='incremental', password='not-used-123')
+        cls.teacher = Teacher.objects.create(user=user, name='Incremental Teacher')
+
+    def setUp(self):
+        get_feedback_cache().clear()
+        self.backend = FakeBackend('fake-model', latency=0)
+        generator = AIFeedbackGenerator(model_name='fake-model', backend=self.backend)
+        for patcher in (mock.patch('notes.reviews.get_feedback_generator', return_value=generator),
+                        mock.patch('notes.rate_limits.get_rate_limiter', return_value=TokenBucketLimiter())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.note = LessonNote.objects.create(
+            teacher=self.teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1',
+            content=note_content(),
+        )
+
+    def edit(self, **fields):
+        for name, value in fields.items():
+            setattr(self.note, name, value)
+        self.note.save()
+
+    def review(self, **kwargs):
+        with mock.patch.object(self.backend, 'generate', wraps=self.backend.generate) as generate:
+            feedback, _, outcome = incremental_review(self.note, **kwargs)
+        return feedback, outcome, [call.args[0] for call in generate.call_args_list]
+
+    def test_first_review_is_full(self):
+        feedback, outcome, prompts = self.review()
+        self.assertEqual(outcome['mode'], 'full')
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual(feedback.review_mode, 'FULL')
+
+    def test_reformatted_note_reuses_the_previous_review(self):
+        first, _, _ = self.review()
+        self.edit(content=note_content(Assessment='an EXIT ticket, with three problems - checks every student!'))
+
+        feedback, outcome, prompts = self.review()
+        self.assertEqual(outcome['mode'], 'unchanged')
+        self.assertEqual(outcome['sections_reviewed'], 0)
+        self.assertEqual(prompts, [])
+        self.assertEqual(feedback.pk, first.pk)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.reviews_skipped, 1)
+        self.assertGreater(self.note.review_tokens_saved, 0)
+
+    def test_changed_section_is_reviewed_alone(self):
+        self.review()
+        self.edit(content=note_content(Activities='Pairs build fractions on number lines and present them.'))
+
+        feedback, outcome, prompts = self.review()
+        self.assertEqual(outcome['mode'], 'incremental')
+        self.assertEqual((outcome['sections'], outcome['sections_reviewed']), (4, 1))
+        self.assertGreater(outcome['tokens_saved'], 0)
+        self.assertEqual(feedback.review_mode, 'INCREMENTAL')
+        self.assertTrue(prompts)
+        for prompt in prompts:
+            self.assertIn('number lines', prompt)
+            self.assertNotIn('exit ticket', prompt)
+
+    def test_header_change_needs_a_full_review(self):
+        self.review()
+        self.edit(grade_level='Grade 6')
+        _, outcome, _ = self.review()
+        self.assertEqual(outcome['mode'], 'full')
+
+    def test_mostly_rewritten_note_needs_a_full_review(self):
+        self.review()
+        self.edit(content=note_content(
+            Objectives='Students measure angles.', Activities='Protractor practice in pairs.',
+            Assessment='A quiz on acute and obtuse angles.',
+        ))
+        _, outcome, _ = self.review()
+        self.assertEqual(outcome['mode'], 'full')
+
+    def test_force_skips_reuse(self):
+        self.review()
+        _, outcome, prompts = self.review(force=True)
+        self.assertEqual(outcome['mode'], 'full')
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual(Feedback.objects.filter(lesson_note=self.note, reviewer_type='AI').count(), 2)
+
+    def test_moved_sections_are_not_changes(self):
+        self.review()
+        sections = {**SECTIONS, 'Homework': 'Measure three objects at home in centimetres.'}
+        titles = ['Homework', 'Assessment', 'Objectives', 'Activities']
+        self.edit(content='\n\n'.join(f"{title}:\n{sections[title]}" for title in titles))
+
+        plan = plan_review(self.note, self.note.ai_feedback)
+        self.assertEqual((plan.mode, plan.changed_indexes), ('incremental', [0]))
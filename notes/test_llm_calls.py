@@ -0,0 +1,134 @@
+"""
+Tests for retried and hedged LLM calls, using the deterministic fake backend.
+
+Run with: python manage.py test notes.test_llm_calls
+"""
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from . import llm_calls
+from .llm_backends import FakeBackend, LLMTimeout, LLMTransientError
+from .llm_calls import CallPolicy, acall_llm, call_llm
+from .metrics import metrics
+from .rate_limits import CircuitBreaker, RateLimited, TokenBucketLimiter
+
+
+class ScriptedFakeBackend(FakeBackend):
+    """FakeBackend whose calls take the scripted (latency, fails) draws in order"""
+
+    def __init__(self, *draws):
+        super().__init__('fake-model')
+        self.draws = list(draws)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            return self.draws.pop(0)
+
+
+class LLMCallTestCase(SimpleTestCase):
+    def setUp(self):
+        # An unlimited limiter needs no database; the breaker never opens here
+        for patcher in (mock.patch('notes.rate_limits.get_rate_limiter', return_value=TokenBucketLimiter()),
+                        mock.patch('notes.rate_limits.get_circuit_breaker',
+                                   return_value=CircuitBreaker(min_calls=1000))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.counters = {name: getattr(metrics, name).value
+                         for name in ('llm_retries', 'llm_hedges_fired', 'llm_hedges_won')}
+
+    def counted(self, name):
+        return getattr(metrics, name).value - self.counters[name]
+
+    def call(self, backend, deadline=None, **policy):
+        options = {'retries': 2, 'base_delay': 0, 'hedge_percentile': 0, **policy}
+        return call_llm(backend, 'Review this lesson', {}, 100, deadline, CallPolicy(**options))
+
+
+class RetryTests(LLMCallTestCase):
+    def test_transient_errors_are_retried_then_raised(self):
+        backend = ScriptedFakeBackend(*[(0, True)] * 3)
+        with self.assertRaises(LLMTransientError):
+            self.call(backend)
+        self.assertEqual(backend.calls, 3)
+        self.assertEqual(self.counted('llm_retries'), 2)
+
+    def test_call_recovers_after_a_transient_error(self):
+        backend = ScriptedFakeBackend((0, True), (0, False))
+        self.assertIsNotNone(self.call(backend).text)
+        self.assertEqual(backend.calls, 2)
+
+    def test_attempt_timeouts_are_retried(self):
+        backend = ScriptedFakeBackend((0.2, False), (0, False))
+        self.call(backend, call_timeout=0.05)
+        self.assertEqual(backend.calls, 2)
+
+    def test_backpressure_and_own_errors_are_not_retried(self):
+        for error in (RateLimited('limit', retry_after=5), ValueError('bug')):
+            with self.subTest(error=type(error).__name__):
+                backend = FakeBackend('fake-model', latency=0)
+                with mock.patch.object(backend, 'generate', side_effect=error) as generate:
+                    with self.assertRaises(type(error)):
+                        self.call(backend)
+                self.assertEqual(generate.call_count, 1)
+
+    def test_no_retry_when_the_backoff_would_pass_the_deadline(self):
+        backend = ScriptedFakeBackend(*[(0, True)] * 3)
+        with mock.patch.object(llm_calls.random, 'uniform', side_effect=lambda low, high: high):
+            with self.assertRaises(LLMTransientError):
+                self.call(backend, deadline=time.monotonic() + 0.5, base_delay=1)
+        self.assertEqual(backend.calls, 1)
+
+    def test_backoff_is_full_jitter_capped_at_max_delay(self):
+        policy = CallPolicy(base_delay=0.5, max_delay=8)
+        with mock.patch.object(llm_calls.random, 'uniform', side_effect=lambda low, high: (low, high)):
+            self.assertEqual([policy.backoff(retry) for retry in (1, 3, 6)], [(0, 1.0), (0, 4.0), (0, 8)])
+
+    def test_deadline_already_passed_sends_nothing(self):
+        backend = ScriptedFakeBackend()
+        with self.assertRaises(LLMTimeout):
+            self.call(backend, deadline=time.monotonic() - 1)
+        self.assertEqual(backend.calls, 0)
+
+
+class HedgeTests(LLMCallTestCase):
+    def test_hedge_fires_after_the_delay_and_its_answer_wins(self):
+        backend = ScriptedFakeBackend((0.5, False), (0.0, False))
+        started = time.monotonic()
+        response = self.call(backend, hedge_delay=0.05)
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(response.latency, 0.0)
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual((self.counted('llm_hedges_fired'), self.counted('llm_hedges_won')), (1, 1))
+
+    def test_primary_answering_before_the_delay_is_not_hedged(self):
+        backend = ScriptedFakeBackend((0.0, False))
+        self.call(backend, hedge_delay=0.2)
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(self.counted('llm_hedges_fired'), 0)
+
+    def test_primary_answering_first_after_the_hedge_fired_wins(self):
+        backend = ScriptedFakeBackend((0.15, False), (0.5, False))
+        response = self.call(backend, hedge_delay=0.05)
+        self.assertEqual(response.latency, 0.15)
+        self.assertEqual((self.counted('llm_hedges_fired'), self.counted('llm_hedges_won')), (1, 0))
+
+    def test_hedge_answer_wins_when_the_primary_fails(self):
+        backend = ScriptedFakeBackend((0.1, True), (0.2, False))
+        response = self.call(backend, hedge_delay=0.05, retries=0)
+        self.assertEqual(response.latency, 0.2)
+
+    def test_async_hedge_wins_and_the_primary_is_cancelled(self):
+        backend = ScriptedFakeBackend((0.5, False), (0.0, False))
+        policy = CallPolicy(retries=0, hedge_delay=0.05, hedge_percentile=0)
+        started = time.monotonic()
+        response = asyncio.run(acall_llm(backend, 'Review this lesson', {}, 100, policy=policy))
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(response.latency, 0.0)
+        self.assertEqual(self.counted('llm_hedges_won'), 1)
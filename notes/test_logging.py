@@ -0,0 +1,27 @@
+"""
+Keeps the notes package logging through its module loggers.
+
+Run with: python manage.py test notes.test_logging
+"""
+import ast
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+PACKAGE = Path(__file__).resolve().parent
+
+# tests.py is a standalone client script and commands write to self.stdout
+EXCLUDED = ('tests.py', 'migrations', 'management')
+
+
+class NoPrintTests(SimpleTestCase):
+    def test_package_modules_log_instead_of_printing(self):
+        offenders = []
+        for path in sorted(PACKAGE.rglob('*.py')):
+            relative = path.relative_to(PACKAGE)
+            if relative.parts[0] in EXCLUDED:
+                continue
+            for node in ast.walk(ast.parse(path.read_text(encoding='utf-8'))):
+                if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'print':
+                    offenders.append(f"{relative}:{node.lineno}")
+        self.assertEqual(offenders, [], "use the module logger rather than print()")
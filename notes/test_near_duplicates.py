@@ -0,0 +1,106 @@
+"""
+Tests for reusing reviews of near-duplicate lesson notes.
+
+Run with: python manage.py test notes.test_near_duplicates
+"""
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from .ai_feedback import AIFeedbackGenerator
+from .feedback_cache import get_feedback_cache
+from .llm_backends import FakeBackend
+from .models import LessonNote, Teacher
+from .near_duplicates import find_near_duplicate
+from .rate_limits import TokenBucketLimiter
+from .reviews import incremental_review, save_ai_feedback
+
+User = get_user_model()
+
+CONTENT = (
+    "Objectives:\nStudents add fractions with unlike denominators and explain each step to a partner.\n\n"
+    "Activities:\nFraction strips in groups of four, then a number line walk across the classroom floor.\n\n"
+    "Assessment:\nAn exit ticket with three problems and one written explanation checks every student."
+)
+
+DONOR_REVIEW = {
+    'feedback_text': 'Ada Okafor has planned a clear lesson. Ms. Okafor could add a warm-up; Ada should time it.',
+    'score': 81,
+    'strengths': ['Okafor uses concrete materials'],
+    'suggestions': ['Add a warm-up'],
+    'areas_for_improvement': ['Differentiation'],
+    'overall_assessment': 'A solid plan from Ada Okafor.',
+}
+
+
+@override_settings(AI_NEAR_DUPLICATE_ENABLED=True, AI_CALL_METRICS_ENABLED=False)
+class NearDuplicateReuseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor_teacher = Teacher.objects.create(user=User.objects.create_user(username='donor'), name='Ada Okafor')
+        cls.teacher = Teacher.objects.create(user=User.objects.create_user(username='reuser'), name='Ben Musa')
+
+    def setUp(self):
+        get_feedback_cache().clear()
+        self.backend = FakeBackend('fake-model', latency=0)
+        generator = AIFeedbackGenerator(model_name='fake-model', backend=self.backend)
+        for patcher in (mock.patch('notes.reviews.get_feedback_generator', return_value=generator),
+                        mock.patch('notes.rate_limits.get_rate_limiter', return_value=TokenBucketLimiter())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def add_note(self, teacher, content=CONTENT):
+        return LessonNote.objects.create(
+            teacher=teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1', content=content,
+        )
+
+    def reviewed_note(self, teacher):
+        note = self.add_note(teacher)
+        save_ai_feedback(note, DONOR_REVIEW)
+        return note
+
+    def review(self, note):
+        with mock.patch.object(self.backend, 'generate', wraps=self.backend.generate) as generate:
+            feedback, _, outcome = incremental_review(note)
+        self.assertEqual(generate.call_count, 0)
+        return feedback, outcome
+
+    def test_another_teachers_review_is_readdressed_and_its_note_not_reported(self):
+        self.reviewed_note(self.donor_teacher)
+        feedback, outcome = self.review(self.add_note(self.teacher))
+
+        self.assertEqual(outcome['mode'], 'near_duplicate')
+        self.assertNotIn('source_lesson_note_id', outcome)
+        self.assertEqual(
+            feedback.feedback_text,
+            'Ben Musa has planned a clear lesson. Ms. Musa could add a warm-up; Ben should time it.',
+        )
+        self.assertEqual(feedback.strengths, ['Musa uses concrete materials'])
+        self.assertEqual(feedback.overall_assessment, 'A solid plan from Ben Musa.')
+        self.assertEqual(feedback.score, 81)
+
+    def test_own_review_is_copied_as_it_is(self):
+        donor = self.reviewed_note(self.donor_teacher)
+        feedback, outcome = self.review(self.add_note(self.donor_teacher))
+
+        self.assertEqual(outcome['source_lesson_note_id'], donor.id)
+        self.assertEqual(feedback.feedback_text, DONOR_REVIEW['feedback_text'])
+
+    @override_settings(AI_NEAR_DUPLICATE_MAX_CANDIDATES=1)
+    def test_unreviewed_copies_do_not_hide_a_reviewed_donor(self):
+        for _ in range(3):
+            self.add_note(self.donor_teacher)
+        donor = self.reviewed_note(self.donor_teacher)
+        for _ in range(3):
+            self.add_note(self.donor_teacher)
+
+        feedback, similarity = find_near_duplicate(self.add_note(self.teacher))
+        self.assertEqual(feedback.lesson_note_id, donor.id)
+        self.assertEqual(similarity, 1.0)
+
+    def test_edited_donor_no_longer_donates(self):
+        donor = self.reviewed_note(self.donor_teacher)
+        donor.content = CONTENT.replace('three problems', 'five problems')
+        donor.save()
+        self.assertIsNone(find_near_duplicate(self.add_note(self.teacher)))
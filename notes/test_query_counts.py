@@ -0,0 +1,193 @@
+"""
+Query-count regression tests for the lesson note endpoints.
+
+Run with: python manage.py test notes.test_query_counts
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .models import LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS, Feedback, LessonNote, Teacher
+from .token_revocation import reload_revocations
+
+User = get_user_model()
+
+# The teacher lookup and the lesson note query joining the newest feedback
+LIST_QUERIES = 2
+# With a token from /api/token/ the user and teacher come from its claims
+TOKEN_LIST_QUERIES = 1
+
+
+class LessonNoteListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='query-count', password='not-used-123')
+        cls.teacher = Teacher.objects.create(user=cls.user, name='Query Count Teacher')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # The revocation list is per process; drop what earlier tests revoked
+        reload_revocations()
+
+    def add_notes(self, count, with_feedback=True):
+        notes = []
+        for i in range(count):
+            note = LessonNote.objects.create(
+                teacher=self.teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1',
+                content=f"Objectives: fractions, lesson {LessonNote.objects.count()} of {i}.",
+            )
+            if with_feedback:
+                Feedback.objects.create(
+                    lesson_note=note, reviewer='AI Assistant', reviewer_type='AI',
+                    feedback_text='Clear objectives.', score=72, overall_assessment='Good',
+                )
+                Feedback.objects.create(
+                    lesson_note=note, reviewer='Head Teacher', reviewer_type='HUMAN',
+                    feedback_text='Agreed.', score=80, overall_assessment='Approved',
+                )
+            notes.append(note)
+        return notes
+
+    def list_notes(self, url='/api/lesson-notes/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries.captured_queries)
+
+    def test_list_query_count_does_not_grow_with_notes(self):
+        self.add_notes(2)
+        small, small_queries = self.list_notes()
+        self.add_notes(25)
+        large, large_queries = self.list_notes()
+
+        self.assertEqual((len(small['results']), len(large['results'])), (2, 27))
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(large_queries, LIST_QUERIES)
+
+    def test_list_query_count_with_notes_without_feedback(self):
+        self.add_notes(3, with_feedback=False)
+        self.add_notes(3)
+        with self.assertNumQueries(LIST_QUERIES):
+            response = self.client.get('/api/lesson-notes/')
+        unreviewed = [note for note in response.json()['results'] if note['feedback_count'] == 0]
+        self.assertEqual(len(unreviewed), 3)
+        for note in unreviewed:
+            self.assertFalse(note['has_ai_feedback'])
+            self.assertIsNone(note['latest_feedback'])
+
+    def test_retrieve_is_one_note_query(self):
+        note = self.add_notes(1)[0]
+        with self.assertNumQueries(LIST_QUERIES):
+            response = self.client.get(f'/api/lesson-notes/{note.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deep_pages_cost_the_same_and_keep_ties_in_order(self):
+        notes = self.add_notes(12, with_feedback=False)
+        # Same timestamp for every note: the id decides the order
+        LessonNote.objects.filter(id__in=[note.id for note in notes]).update(submitted_at=notes[0].submitted_at)
+
+        seen, page_queries = [], set()
+        url = '/api/lesson-notes/?page_size=5'
+        while url:
+            page, queries = self.list_notes(url)
+            seen.extend(note['id'] for note in page['results'])
+            page_queries.add(queries)
+            url = page['next']
+        self.assertEqual(seen, sorted((note.id for note in notes), reverse=True))
+        self.assertEqual(page_queries, {LIST_QUERIES})
+
+    @override_settings(API_COUNT_LIMIT=3)
+    def test_count_is_capped(self):
+        self.add_notes(4, with_feedback=False)
+        page, queries = self.list_notes('/api/lesson-notes/?count=true')
+        self.assertEqual((page['count'], page['count_is_estimate']), (3, True))
+        self.assertEqual(queries, LIST_QUERIES + 1)
+        self.assertNotIn('count', self.list_notes()[0])
+
+    def obtain_tokens(self):
+        self.user.set_password('not-used-123')
+        self.user.save()
+        return APIClient().post('/api/token/', {'username': 'query-count', 'password': 'not-used-123'}).json()
+
+    def test_token_claims_replace_user_and_teacher_lookups(self):
+        self.add_notes(3)
+        client = APIClient()
+        tokens = self.obtain_tokens()
+        refreshed = client.post('/api/token/refresh/', {'refresh': tokens['refresh']}).json()
+        reload_revocations()
+
+        for access in (tokens['access'], refreshed['access']):
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+            with self.assertNumQueries(TOKEN_LIST_QUERIES):
+                response = client.get('/api/lesson-notes/')
+            self.assertEqual(len(response.json()['results']), 3)
+
+    def test_revoked_tokens_are_refused_on_reads(self):
+        tokens = self.obtain_tokens()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        self.assertEqual(client.get('/api/lesson-notes/').status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get('/api/lesson-notes/').status_code, 401)
+        refresh = APIClient().post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(refresh.status_code, 401)
+
+    def assertSummaryMatchesFeedback(self, note):
+        live = LessonNote.objects.with_live_feedback_summary().get(pk=note.pk)
+        self.assertEqual(
+            {column: getattr(live, column) for column in LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS},
+            {column: getattr(live, f'live_{column}') for column in LESSON_NOTE_FEEDBACK_SUMMARY_COLUMNS},
+        )
+
+    def test_summary_columns_follow_feedback_writes(self):
+        note = self.add_notes(1)[0]
+        self.assertSummaryMatchesFeedback(note)
+        listed = self.list_notes()[0]['results']
+        self.assertEqual(listed[0]['feedback_count'], 2)
+        self.assertTrue(listed[0]['has_ai_feedback'])
+        self.assertEqual(listed[0]['latest_feedback']['reviewer_type'], 'HUMAN')
+
+        Feedback.objects.filter(lesson_note=note, reviewer_type='HUMAN').update(score=90)
+        self.assertSummaryMatchesFeedback(note)
+        response = self.client.delete(f'/api/lesson-notes/{note.id}/ai-feedback/')
+        self.assertEqual(response.status_code, 200)
+        self.assertSummaryMatchesFeedback(note)
+        note.feedback_set.get().delete()
+        self.assertSummaryMatchesFeedback(note)
+
+        data = self.client.get(f'/api/lesson-notes/{note.id}/').json()
+        self.assertEqual((data['feedback_count'], data['has_ai_feedback'], data['latest_feedback']), (0, False, None))
+
+    def test_saving_a_stale_note_keeps_the_summary(self):
+        note = self.add_notes(1, with_feedback=False)[0]
+        stale = LessonNote.objects.get(pk=note.pk)
+        Feedback.objects.create(
+            lesson_note=note, reviewer='AI Assistant', reviewer_type='AI',
+            feedback_text='Clear objectives.', score=70,
+        )
+        stale.status = 'APPROVED'
+        stale.save()
+        response = self.client.patch(f'/api/lesson-notes/{note.pk}/', {'term': 'Term 2'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        note.refresh_from_db()
+        self.assertEqual((note.status, note.term), ('APPROVED', 'Term 2'))
+        self.assertEqual((note.feedback_count, note.ai_feedback_count, note.latest_score), (1, 1, 70))
+        self.assertSummaryMatchesFeedback(note)
+
+    def test_summary_columns_follow_bulk_create(self):
+        notes = self.add_notes(3, with_feedback=False)
+        Feedback.objects.bulk_create([
+            Feedback(lesson_note=note, reviewer='Automatic Check', reviewer_type='HEURISTIC',
+                     feedback_text='Provisional.', score=50)
+            for note in notes
+        ])
+        for note in notes:
+            self.assertSummaryMatchesFeedback(note)
+            note.refresh_from_db()
+            self.assertEqual((note.feedback_count, note.latest_score, note.last_reviewed_at), (1, 50, None))
@@ -0,0 +1,189 @@
+"""
+Tests for the LLM rate limiter and circuit breaker.
+
+Run with: python manage.py test notes.test_rate_limits
+"""
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from . import rate_limits
+from .ai_feedback import ReviewTimeout
+from .llm_backends import LLMTimeout, LLMTransientError
+from .models import RateLimitBucket
+from .rate_limits import (
+    REQUESTS_BUCKET, TOKENS_BUCKET, CircuitBreaker, CircuitOpen, TokenBucketLimiter, allm_guard, llm_guard
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        for patcher in (mock.patch.object(rate_limits.time, 'monotonic', self.clock),
+                        mock.patch.object(rate_limits, 'logger')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window=60, cooldown=30)
+
+    def fail(self, times=1):
+        for _ in range(times):
+            self.breaker.allow()
+            self.breaker.record_failure()
+
+    def open_breaker(self):
+        self.fail(4)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_stays_closed_below_min_calls(self):
+        self.fail(3)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_stays_closed_below_the_failure_rate(self):
+        for _ in range(3):
+            self.breaker.allow()
+            self.breaker.record_success()
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failures_outside_the_window_are_forgotten(self):
+        self.fail(3)
+        self.clock.now += 61
+        self.fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_open_breaker_short_circuits_until_the_cooldown(self):
+        self.open_breaker()
+        self.clock.now += 10
+        with self.assertRaises(CircuitOpen) as raised:
+            self.breaker.allow()
+        self.assertEqual(raised.exception.retry_after, 20)
+        self.assertEqual(self.breaker.stats()['short_circuited'], 1)
+
+    def test_half_open_admits_one_probe(self):
+        self.open_breaker()
+        self.clock.now += 30
+        self.breaker.allow()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.allow()
+
+    def test_successful_probe_closes(self):
+        self.open_breaker()
+        self.clock.now += 30
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.stats()['window_calls'], 0)
+
+    def test_failed_probe_reopens(self):
+        self.open_breaker()
+        self.clock.now += 30
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.stats()['times_opened'], 2)
+
+    def test_released_probe_lets_the_next_call_probe(self):
+        self.open_breaker()
+        self.clock.now += 30
+        self.breaker.allow()
+        self.breaker.release()
+        self.breaker.allow()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+class LLMGuardTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(min_calls=1, cooldown=30)
+        for patcher in (mock.patch.object(rate_limits, 'get_circuit_breaker', return_value=self.breaker),
+                        mock.patch.object(rate_limits, 'get_rate_limiter', return_value=TokenBucketLimiter()),
+                        mock.patch.object(rate_limits, 'logger')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def raise_in_guard(self, error):
+        with self.assertRaises(type(error)):
+            with llm_guard(100):
+                raise error
+
+    def test_provider_errors_and_timeouts_trip_the_breaker(self):
+        for error in (LLMTransientError('throttled'), LLMTimeout('slow'), TimeoutError()):
+            with self.subTest(error=type(error).__name__):
+                self.breaker = CircuitBreaker(min_calls=1)
+                rate_limits.get_circuit_breaker.return_value = self.breaker
+                self.raise_in_guard(error)
+                self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_review_deadline_and_own_errors_do_not_count(self):
+        for error in (ReviewTimeout('deadline'), ValueError('bug')):
+            with self.subTest(error=type(error).__name__):
+                self.raise_in_guard(error)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.stats()['window_calls'], 0)
+
+    def test_cancelled_async_call_does_not_count(self):
+        async def cancelled():
+            async with allm_guard(100):
+                raise asyncio.CancelledError
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancelled())
+        self.assertEqual(self.breaker.stats()['window_calls'], 0)
+
+    def test_success_is_recorded(self):
+        with llm_guard(100):
+            pass
+        self.assertEqual(self.breaker.stats()['window_calls'], 1)
+
+
+class TokenBucketLimiterTests(TestCase):
+    def setUp(self):
+        self.limiter = TokenBucketLimiter(requests_per_minute=2, tokens_per_minute=100)
+
+    def level(self, name):
+        return RateLimitBucket.objects.get(name=name).tokens
+
+    def test_takes_until_a_bucket_is_exhausted(self):
+        self.assertEqual(self.limiter.try_take(10), (0.0, None))
+        self.assertEqual(self.limiter.try_take(10), (0.0, None))
+        wait, bucket = self.limiter.try_take(10)
+        self.assertEqual(bucket, REQUESTS_BUCKET)
+        self.assertAlmostEqual(wait, 30, delta=1)
+
+    def test_a_short_bucket_takes_nothing_from_the_others(self):
+        self.limiter.try_take(90)
+        wait, bucket = self.limiter.try_take(90)
+        self.assertEqual(bucket, TOKENS_BUCKET)
+        self.assertGreater(wait, 0)
+        self.assertAlmostEqual(self.level(REQUESTS_BUCKET), 1, delta=0.1)
+        self.assertAlmostEqual(self.level(TOKENS_BUCKET), 10, delta=1)
+
+    def test_settle_refunds_unused_tokens(self):
+        self.limiter.try_take(90)
+        self.limiter.settle(90, 30)
+        self.assertAlmostEqual(self.level(TOKENS_BUCKET), 70, delta=1)
+
+    def test_call_larger_than_the_bucket_still_runs(self):
+        self.assertEqual(self.limiter.try_take(500), (0.0, None))
+
+    def test_acquire_raises_rate_limited_without_waiting(self):
+        self.limiter.acquire(10)
+        self.limiter.acquire(10)
+        with self.assertRaises(rate_limits.RateLimited):
+            self.limiter.acquire(10)
+        self.assertEqual(RateLimitBucket.objects.get(name=REQUESTS_BUCKET).rejected, 1)
+
+    def test_missing_bucket_is_recreated(self):
+        self.limiter.try_take(10)
+        RateLimitBucket.objects.all().delete()
+        self.assertEqual(self.limiter.try_take(10), (0.0, None))
+        self.assertEqual(RateLimitBucket.objects.count(), 2)
@@ -0,0 +1,93 @@
+"""
+Tests for the model response JSON scanner and the streamed feedback_text decoder.
+
+Run with: python manage.py test notes.test_response_parser
+"""
+import json
+
+from django.test import SimpleTestCase
+
+from .ai_feedback import AIFeedbackGenerator, FeedbackTextStreamer, find_json_object, parse_json_response
+from .llm_backends import FakeBackend
+
+FEEDBACK = {
+    'feedback_text': 'Well organised {with braces} and "quotes".',
+    'score': 82,
+    'strengths': ['Clear objectives'],
+    'details': {'pacing': {'warm_up': 5}},
+}
+
+
+class ParseJsonResponseTests(SimpleTestCase):
+    def test_fenced(self):
+        text = f"Here is the review:\n```json\n{json.dumps(FEEDBACK, indent=2)}\n```\nThanks!"
+        self.assertEqual(parse_json_response(text), (FEEDBACK, 'FENCED_JSON'))
+
+    def test_fence_without_language(self):
+        self.assertEqual(parse_json_response(f"```\n{json.dumps(FEEDBACK)}\n```"), (FEEDBACK, 'FENCED_JSON'))
+
+    def test_bare(self):
+        self.assertEqual(parse_json_response(f"Review: {json.dumps(FEEDBACK)} end"), (FEEDBACK, 'BARE_JSON'))
+
+    def test_braces_in_prose_before_the_object(self):
+        text = f"Use {{curly}} sets and [lists}} freely. {json.dumps(FEEDBACK)}"
+        self.assertEqual(find_json_object(text), FEEDBACK)
+
+    def test_object_after_an_invalid_balanced_span(self):
+        text = f"{{not: json}} then {json.dumps(FEEDBACK)}"
+        self.assertEqual(find_json_object(text), FEEDBACK)
+
+    def test_escaped_quotes_and_backslashes_in_strings(self):
+        data = {'feedback_text': 'Ends with a backslash \\', 'note': 'She said "}" twice'}
+        self.assertEqual(find_json_object(f"prefix {{ {json.dumps(data)[1:]}"), data)
+
+    def test_truncated_mid_string(self):
+        text = '```json\n{"feedback_text": "Good pacing", "strengths": ["Clear'
+        self.assertEqual(find_json_object(text), {'feedback_text': 'Good pacing', 'strengths': ['Clear']})
+
+    def test_truncated_after_a_dangling_key(self):
+        self.assertEqual(find_json_object('{"score": 80, "strengths": ["A"], "sugg'), {'score': 80, 'strengths': ['A']})
+
+    def test_truncated_after_a_comma(self):
+        self.assertEqual(find_json_object('{"score": 80, "details": {"pacing": 5},'), {'score': 80, 'details': {'pacing': 5}})
+
+    def test_garbage(self):
+        for text in ('', 'No JSON at all', '}{', '{"unterminated": [1, 2}', '[1, 2, 3]', '{{{{'):
+            with self.subTest(text=text):
+                self.assertEqual(parse_json_response(text), (None, None))
+
+
+class ResponseFallbackTests(SimpleTestCase):
+    def setUp(self):
+        self.generator = AIFeedbackGenerator(backend=FakeBackend('fake-model', latency=0))
+
+    def test_fake_backend_response_parses_as_fenced_json(self):
+        response = self.generator.backend.generate('Review this lesson', {})
+        data, path = self.generator._parse_response(response.text)
+        self.assertEqual(path, 'FENCED_JSON')
+        self.assertEqual(data['strengths'], ['Clear lesson structure', 'Stated learning objectives'])
+
+    def test_text_response_is_structured_from_its_sections(self):
+        text = "Score: 64\nStrengths:\n- Clear goals\n- Good pacing\nSuggestions:\n1. Add a quiz"
+        data, path = self.generator._parse_response(text)
+        self.assertEqual(path, 'TEXT')
+        self.assertEqual((data['score'], data['strengths'], data['suggestions']),
+                         (64, ['Clear goals', 'Good pacing'], ['Add a quiz']))
+
+
+class FeedbackTextStreamerTests(SimpleTestCase):
+    def stream(self, text, size):
+        streamer = FeedbackTextStreamer()
+        return ''.join(streamer.feed(text[start:start + size]) for start in range(0, len(text), size))
+
+    def test_decodes_feedback_text_across_chunk_boundaries(self):
+        text = json.dumps({'score': 80, 'feedback_text': 'Line one\nTab\there "quoted" é done', 'strengths': []})
+        for size in (1, 2, 5, 24):
+            with self.subTest(size=size):
+                self.assertEqual(self.stream(text, size), 'Line one\nTab\there "quoted" é done')
+
+    def test_stops_at_the_closing_quote(self):
+        streamer = FeedbackTextStreamer()
+        self.assertEqual(streamer.feed('{"feedback_text": "Done", "overall_assessment": "x"}'), 'Done')
+        self.assertTrue(streamer.finished)
+        self.assertEqual(streamer.feed('more'), '')
@@ -0,0 +1,255 @@
+"""
+Tests for the review job queue: retries, dead-lettering, idempotent reruns,
+expired leases and fair claiming.
+
+Run with: python manage.py test notes.test_review_jobs
+"""
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import review_jobs, tasks
+from .ai_feedback import AIFeedbackGenerator, ReviewDeferred
+from .feedback_cache import get_feedback_cache
+from .llm_backends import FakeBackend
+from .models import Feedback, LessonNote, ReviewJob, Teacher
+from .rate_limits import TokenBucketLimiter
+from .review_jobs import (
+    ThreadPoolReviewBackend, claim_next_job, enqueue_review, requeue_dead_jobs, requeue_expired_jobs,
+    run_next_review_job, run_review_job
+)
+
+User = get_user_model()
+
+
+@override_settings(
+    REVIEW_JOB_BACKEND='database', REVIEW_JOB_MAX_ATTEMPTS=2, AI_NEAR_DUPLICATE_ENABLED=False,
+    AI_CALL_METRICS_ENABLED=False,
+)
+class ReviewJobTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers = [
+            Teacher.objects.create(user=User.objects.create_user(username=f'jobs-{i}'),
+                                   name=f'Jobs Teacher {i}')
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        get_feedback_cache().clear()
+        review_jobs._fairness_orders.clear()
+        review_jobs._wakeups.clear()
+        self.backend = FakeBackend('fake-model', latency=0)
+        generator = AIFeedbackGenerator(model_name='fake-model', backend=self.backend)
+        for patcher in (mock.patch('notes.reviews.get_feedback_generator', return_value=generator),
+                        mock.patch('notes.rate_limits.get_rate_limiter', return_value=TokenBucketLimiter()),
+                        mock.patch.object(review_jobs, 'logger')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def add_note(self, teacher=None, content='Objectives: add fractions with unlike denominators.'):
+        return LessonNote.objects.create(
+            teacher=teacher or self.teachers[0], subject='Mathematics', grade_level='Grade 5', term='Term 1',
+            content=content,
+        )
+
+    def enqueue(self, teacher=None, priority='INTERACTIVE'):
+        return enqueue_review(self.add_note(teacher, f'Objectives: lesson {LessonNote.objects.count()}.'),
+                              priority=priority)
+
+
+class RetryTests(ReviewJobTestCase):
+    def failing_review(self, error):
+        return mock.patch.object(review_jobs, 'review_lesson_note', side_effect=error)
+
+    def test_failed_job_is_retried_with_backoff_then_dead_lettered(self):
+        job = self.enqueue()
+        with self.failing_review(RuntimeError('provider exploded')):
+            job = run_review_job(job.id)
+            self.assertEqual((job.status, job.attempts), ('QUEUED', 1))
+            self.assertGreater(job.available_at, timezone.now())
+            self.assertIn('provider exploded', job.error)
+            # Not claimable before its backoff ends
+            self.assertIsNone(claim_next_job('INTERACTIVE'))
+
+            job = run_review_job(job.id)
+        self.assertEqual((job.status, job.attempts), ('DEAD', 2))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(job.lease_owner, '')
+
+    def test_requeued_dead_job_gets_fresh_attempts(self):
+        job = self.enqueue()
+        with self.failing_review(RuntimeError('down')):
+            run_review_job(job.id)
+            run_review_job(job.id)
+        self.assertEqual(requeue_dead_jobs([job.id]), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.available_at), ('QUEUED', 0, None))
+
+        job = run_review_job(job.id)
+        self.assertEqual(job.status, 'DONE')
+
+    def test_deferred_job_keeps_its_attempt(self):
+        job = self.enqueue()
+        with self.failing_review(ReviewDeferred('throttled', retry_after=60)):
+            job = run_review_job(job.id)
+        self.assertEqual((job.status, job.attempts), ('QUEUED', 0))
+        self.assertAlmostEqual((job.available_at - timezone.now()).total_seconds(), 60, delta=5)
+
+
+class DeferralWakeupTests(ReviewJobTestCase):
+    def test_an_outage_keeps_one_wake_up_per_class(self):
+        for _ in range(3):
+            self.enqueue()
+        clock = [1000.0]
+        with mock.patch.object(review_jobs, 'review_lesson_note', side_effect=ReviewDeferred('open', retry_after=30)), \
+                mock.patch.object(review_jobs.time, 'monotonic', lambda: clock[0]), \
+                mock.patch.object(review_jobs, 'get_review_backend') as get_backend:
+            get_backend.return_value.name = 'database'
+            dispatch = get_backend.return_value.dispatch
+            for cycle in range(4):
+                with self.subTest(cycle=cycle):
+                    dispatch.reset_mock()
+                    # Every token the previous cycle sent fires once the jobs are due
+                    for _ in range(max(1, dispatch.call_count)):
+                        run_next_review_job('INTERACTIVE')
+                    self.assertEqual(dispatch.call_args_list, [mock.call('INTERACTIVE', delay=30)])
+                    self.assertEqual(ReviewJob.objects.filter(status='QUEUED', attempts=0).count(), 3)
+                clock[0] += 31
+                ReviewJob.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+
+    def test_tail_wakes_the_class_for_a_job_deferred_elsewhere(self):
+        self.enqueue()
+        ReviewJob.objects.update(available_at=timezone.now() + timedelta(seconds=45))
+        with mock.patch.object(review_jobs, 'get_review_backend') as get_backend:
+            get_backend.return_value.name = 'database'
+            self.assertEqual(run_next_review_job('INTERACTIVE'), 0)
+            run_next_review_job('INTERACTIVE')
+        (priority,), kwargs = get_backend.return_value.dispatch.call_args
+        self.assertEqual(get_backend.return_value.dispatch.call_count, 1)
+        self.assertAlmostEqual(kwargs['delay'], 45, delta=2)
+
+
+class CeleryTaskTests(ReviewJobTestCase):
+    def run_task(self, error):
+        note = self.add_note()
+        with mock.patch.object(tasks, 'review_lesson_note', side_effect=error) as review, \
+                mock.patch.object(tasks, 'logger'):
+            result = tasks.generate_ai_feedback_async.apply(args=(note.id,))
+        return note, result, review.call_count
+
+    @override_settings(REVIEW_JOB_MAX_ATTEMPTS=12)
+    def test_failures_are_retried_up_to_the_job_attempt_limit(self):
+        _, result, calls = self.run_task(RuntimeError('down'))
+        self.assertTrue(result.failed())
+        self.assertEqual(calls, 12)
+
+    def test_deferral_hands_the_note_to_the_review_queue(self):
+        note, result, calls = self.run_task(ReviewDeferred('open', retry_after=90))
+        self.assertTrue(result.successful())
+        self.assertEqual(calls, 1)
+        job = ReviewJob.objects.get(lesson_note=note)
+        self.assertEqual((job.status, job.attempts), ('QUEUED', 0))
+        self.assertAlmostEqual((job.available_at - timezone.now()).total_seconds(), 90, delta=5)
+
+
+class IdempotencyTests(ReviewJobTestCase):
+    def test_rerun_of_a_finished_job_stores_one_review(self):
+        job = run_review_job(self.enqueue().id)
+        self.assertEqual(job.status, 'DONE')
+
+        # The worker stored the feedback but died before marking the job done
+        ReviewJob.objects.filter(id=job.id).update(status='QUEUED', feedback=None)
+        with mock.patch.object(self.backend, 'generate', wraps=self.backend.generate) as generate:
+            rerun = run_review_job(job.id)
+        self.assertEqual(generate.call_count, 0)
+        self.assertEqual((rerun.status, rerun.feedback_id), ('DONE', job.feedback_id))
+        self.assertEqual(Feedback.objects.filter(lesson_note_id=job.lesson_note_id, reviewer_type='AI').count(), 1)
+
+    def test_finished_job_is_not_claimed_again(self):
+        job = run_review_job(self.enqueue().id)
+        self.assertEqual(run_review_job(job.id).attempts, 1)
+
+
+class ExpiredLeaseTests(ReviewJobTestCase):
+    def running_job(self, attempts, priority='INTERACTIVE'):
+        job = self.enqueue(priority=priority)
+        ReviewJob.objects.filter(id=job.id).update(
+            status='RUNNING', attempts=attempts, lease_owner='lost-worker',
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        return job
+
+    def test_expired_jobs_are_requeued_or_dead_lettered_and_dispatched(self):
+        retryable = self.running_job(attempts=1)
+        bulk = self.running_job(attempts=1, priority='BULK')
+        last_attempt = self.running_job(attempts=2)
+        with mock.patch.object(review_jobs, 'get_review_backend') as get_backend:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(requeue_expired_jobs(), (2, 1))
+
+        statuses = dict(ReviewJob.objects.values_list('id', 'status'))
+        self.assertEqual(
+            [statuses[job.id] for job in (retryable, bulk, last_attempt)], ['QUEUED', 'QUEUED', 'DEAD']
+        )
+        self.assertCountEqual(
+            [call.args for call in get_backend.return_value.dispatch.call_args_list], [('INTERACTIVE',), ('BULK',)]
+        )
+
+    def test_live_lease_is_left_alone(self):
+        job = self.running_job(attempts=1)
+        ReviewJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(requeue_expired_jobs(), (0, 0))
+
+
+class FairClaimTests(ReviewJobTestCase):
+    def claim_all(self, priority='INTERACTIVE'):
+        claimed = []
+        while (job := claim_next_job(priority)) is not None:
+            claimed.append(job.teacher_id)
+        return claimed
+
+    def test_teachers_take_turns(self):
+        busy, other = self.teachers
+        for _ in range(4):
+            self.enqueue(busy)
+        for _ in range(2):
+            self.enqueue(other)
+        self.assertEqual(self.claim_all(), [busy.id, other.id, busy.id, other.id, busy.id, busy.id])
+
+    def test_teacher_queueing_after_the_order_was_cached_is_claimed(self):
+        self.enqueue(self.teachers[0])
+        self.assertIsNotNone(claim_next_job('INTERACTIVE'))
+        job = self.enqueue(self.teachers[1])
+        self.assertEqual(claim_next_job('INTERACTIVE').id, job.id)
+
+    def test_classes_are_claimed_separately(self):
+        bulk = self.enqueue(priority='BULK')
+        self.assertIsNone(claim_next_job('INTERACTIVE'))
+        self.assertEqual(claim_next_job('BULK').id, bulk.id)
+
+
+class DelayedDispatchTests(TestCase):
+    def test_delayed_tokens_fire_in_due_order_from_one_thread(self):
+        backend = ThreadPoolReviewBackend()
+        fired, done = [], threading.Event()
+
+        def run(priority):
+            fired.append((priority, threading.current_thread().name))
+            if len(fired) == 3:
+                done.set()
+
+        with mock.patch.object(backend, '_get_executor') as get_executor:
+            get_executor.return_value.submit.side_effect = lambda _run, priority: run(priority)
+            for priority, delay in (('BULK', 0.3), ('INTERACTIVE', 0.1), ('REGENERATE', 0.2)):
+                backend.dispatch(priority, delay=delay)
+            started = time.monotonic()
+            self.assertTrue(done.wait(5))
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+        self.assertEqual([priority for priority, _ in fired], ['INTERACTIVE', 'REGENERATE', 'BULK'])
+        self.assertEqual({thread for _, thread in fired}, {'review-scheduler'})
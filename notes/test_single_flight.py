@@ -0,0 +1,142 @@
+"""
+Tests for single-flight coalescing of concurrent reviews of one lesson note.
+
+Run with: python manage.py test notes.test_single_flight
+"""
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import single_flight
+from .ai_feedback import AIFeedbackGenerator, ReviewTimeout
+from .feedback_cache import get_feedback_cache
+from .llm_backends import FakeBackend
+from .models import Feedback, LessonNote, ReviewLock, Teacher
+from .rate_limits import TokenBucketLimiter
+from .reviews import incremental_review, save_ai_feedback
+from .single_flight import acquire_marker, run_single_flight
+
+User = get_user_model()
+
+REVIEW = {
+    'feedback_text': 'Clear objectives.', 'score': 78, 'strengths': ['Clear objectives'],
+    'suggestions': ['Add a warm-up'], 'areas_for_improvement': ['Pacing'], 'overall_assessment': 'Solid.',
+}
+
+
+# Followers run in threads but only wait on the leader's call; every database
+# write happens on the test thread, which SQLite test databases need
+@override_settings(AI_NEAR_DUPLICATE_ENABLED=False, AI_CALL_METRICS_ENABLED=False, REVIEW_SINGLE_FLIGHT_POLL=0.01)
+class SingleFlightTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create(user=User.objects.create_user(username='flight'), name='Flight Teacher')
+
+    def setUp(self):
+        get_feedback_cache().clear()
+        single_flight._reset_flights()
+        self.backend = FakeBackend('fake-model', latency=0)
+        generator = AIFeedbackGenerator(model_name='fake-model', backend=self.backend)
+        for patcher in (mock.patch('notes.reviews.get_feedback_generator', return_value=generator),
+                        mock.patch('notes.rate_limits.get_rate_limiter', return_value=TokenBucketLimiter())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.note = LessonNote.objects.create(
+            teacher=self.teacher, subject='Mathematics', grade_level='Grade 5', term='Term 1',
+            content='Objectives: add fractions with unlike denominators.',
+        )
+
+    def start_follower(self, call):
+        """Run call() in a thread and wait until it has joined the in-flight review"""
+        outcome = {}
+
+        def follow():
+            try:
+                outcome['result'] = call()
+            except BaseException as e:
+                outcome['error'] = e
+
+        joined = single_flight._flights.coalesced + 1
+        thread = threading.Thread(target=follow)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while single_flight._flights.coalesced < joined and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(single_flight._flights.coalesced, joined)
+        return thread, outcome
+
+    def test_concurrent_reviews_make_one_llm_call(self):
+        followers = []
+        generate = self.backend.generate
+
+        def generate_with_follower(*args, **kwargs):
+            followers.append(self.start_follower(lambda: incremental_review(self.note, timeout=5)))
+            return generate(*args, **kwargs)
+
+        with mock.patch.object(self.backend, 'generate', side_effect=generate_with_follower) as backend_generate:
+            feedback, _, outcome = incremental_review(self.note, timeout=5)
+        thread, follower = followers[0]
+        thread.join(5)
+
+        self.assertEqual(backend_generate.call_count, 1)
+        self.assertNotIn('coalesced', outcome)
+        follower_feedback, _, follower_outcome = follower['result']
+        self.assertEqual(follower_feedback.pk, feedback.pk)
+        self.assertIs(follower_outcome['coalesced'], True)
+        self.assertEqual(Feedback.objects.filter(lesson_note=self.note, reviewer_type='AI').count(), 1)
+
+    def test_leader_error_reaches_followers(self):
+        followers = []
+
+        def failing_review(waited):
+            followers.append(self.start_follower(lambda: run_single_flight(self.note, failing_review, timeout=5)))
+            raise RuntimeError('provider exploded')
+
+        with self.assertRaisesMessage(RuntimeError, 'provider exploded'):
+            run_single_flight(self.note, failing_review, timeout=5)
+        thread, follower = followers[0]
+        thread.join(5)
+        self.assertEqual(len(followers), 1)
+        self.assertEqual(str(follower['error']), 'provider exploded')
+        self.assertFalse(ReviewLock.objects.exists())
+
+    def test_expired_marker_is_taken_over(self):
+        ReviewLock.objects.create(lesson_note=self.note, owner='crashed', expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(acquire_marker(self.note.pk, 'new-owner'))
+        self.assertEqual(ReviewLock.objects.get(lesson_note=self.note).owner, 'new-owner')
+
+    def test_live_marker_is_not_taken(self):
+        ReviewLock.objects.create(lesson_note=self.note, owner='busy', expires_at=timezone.now() + timedelta(minutes=1))
+        self.assertFalse(acquire_marker(self.note.pk, 'new-owner'))
+        self.assertEqual(ReviewLock.objects.get(lesson_note=self.note).owner, 'busy')
+
+    def test_waiter_gives_up_at_its_deadline(self):
+        ReviewLock.objects.create(lesson_note=self.note, owner='busy', expires_at=timezone.now() + timedelta(minutes=1))
+        review = mock.Mock()
+        started = time.monotonic()
+        with self.assertRaises(ReviewTimeout):
+            run_single_flight(self.note, review, timeout=0.1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        review.assert_not_called()
+        self.assertEqual((single_flight._flights.cross_worker_waits, single_flight._flights.wait_timeouts), (1, 1))
+
+    def test_forced_regenerate_that_waited_reuses_the_other_workers_review(self):
+        ReviewLock.objects.create(lesson_note=self.note, owner='other', expires_at=timezone.now() + timedelta(minutes=1))
+        stored = []
+
+        def other_worker_finishes(_):
+            if not stored:
+                stored.append(save_ai_feedback(self.note, REVIEW))
+                ReviewLock.objects.filter(owner='other').delete()
+
+        with mock.patch.object(single_flight.time, 'sleep', side_effect=other_worker_finishes), \
+                mock.patch.object(self.backend, 'generate', wraps=self.backend.generate) as generate:
+            feedback, _, outcome = incremental_review(self.note, timeout=5, force=True)
+        self.assertEqual(generate.call_count, 0)
+        self.assertEqual(outcome['mode'], 'unchanged')
+        self.assertEqual(feedback.pk, stored[0].pk)
@@ -0,0 +1,56 @@
+"""
+Tests for the JWT revocation list.
+
+Run with: python manage.py test notes.test_token_revocation
+"""
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .token_revocation import is_revoked, reload_revocations, revoke_token, revoke_user_tokens
+
+User = get_user_model()
+
+# Revocations are stored at 1_700_000_000.6 - partway through a second
+REVOKED_SECOND = 1_700_000_000
+REVOKED_AT = datetime.fromtimestamp(REVOKED_SECOND + 0.6, tz=dt_timezone.utc)
+
+
+class TokenRevocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='revocation', password='not-used-123')
+
+    def setUp(self):
+        reload_revocations()
+
+    def token_issued_at(self, second):
+        token = AccessToken.for_user(self.user)
+        token['iat'] = second
+        return token
+
+    def revoke_user(self):
+        with mock.patch('notes.token_revocation.timezone.now', return_value=REVOKED_AT):
+            revoke_user_tokens(self.user, reason='test')
+
+    def test_tokens_issued_before_the_revocation_are_revoked(self):
+        self.revoke_user()
+        self.assertTrue(is_revoked(self.token_issued_at(REVOKED_SECOND - 1)))
+
+    def test_token_from_the_revocation_second_is_revoked(self):
+        # Issued 0.3s after the revocation, but iat only keeps the whole second
+        self.revoke_user()
+        self.assertTrue(is_revoked(self.token_issued_at(REVOKED_SECOND)))
+
+    def test_tokens_issued_after_the_revocation_second_are_valid(self):
+        self.revoke_user()
+        self.assertFalse(is_revoked(self.token_issued_at(REVOKED_SECOND + 1)))
+
+    def test_revoking_one_token_leaves_the_others_valid(self):
+        token, other = AccessToken.for_user(self.user), AccessToken.for_user(self.user)
+        revoke_token(token, reason='test')
+        self.assertTrue(is_revoked(token))
+        self.assertFalse(is_revoked(other))
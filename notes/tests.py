@@ -226,7 +226,7 @@ class APITester:
             
             if response.status_code == 200:
                 data = response.json()
-                count = len(data) if isinstance(data, list) else data.get('count', 0)
+                count = len(data) if isinstance(data, list) else data.get('count', len(data.get('results', [])))
                 self.log_success(f"Retrieved {count} lesson notes")
                 return True
             else:
@@ -332,7 +332,7 @@ class APITester:
             
             if response.status_code == 200:
                 data = response.json()
-                count = data.get('count', 0)
+                count = data.get('count', len(data.get('feedback', [])))
                 self.log_success(f"Retrieved {count} AI feedback records")
                 return True
             else:
@@ -0,0 +1,105 @@
+"""
+Revocation list for JWTs.
+
+Stateless authentication never loads the user row, so without a list a
+deactivated user or a leaked token would stay valid until it expired.
+Revocations are RevokedToken rows; each process keeps the unexpired ones in
+memory and reloads them every JWT_REVOCATION_REFRESH seconds, so checking a
+token costs no query and a revocation reaches every process within that
+interval (the process that revokes sees it at once).
+"""
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+_lock = threading.Lock()
+_loaded_at = None
+_revoked_jtis = frozenset()
+# str(user_id) -> tokens issued at or before this Unix second are revoked
+_revoked_users = {}
+
+
+def _load():
+    global _loaded_at, _revoked_jtis, _revoked_users
+    jtis, users = set(), {}
+    rows = RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list('user_id', 'jti', 'revoked_at')
+    for user_id, jti, revoked_at in rows:
+        if jti:
+            jtis.add(jti)
+        else:
+            # iat has whole-second precision, so the revocation time is truncated to match
+            key, revoked_second = str(user_id), int(revoked_at.timestamp())
+            users[key] = max(revoked_second, users.get(key, revoked_second))
+    _revoked_jtis, _revoked_users = frozenset(jtis), users
+    _loaded_at = time.monotonic()
+
+
+def _current():
+    with _lock:
+        refresh = getattr(settings, 'JWT_REVOCATION_REFRESH', 5.0)
+        if _loaded_at is None or time.monotonic() - _loaded_at >= refresh:
+            try:
+                _load()
+            except DatabaseError:
+                # Keep checking against the last list rather than failing every request
+                if _loaded_at is None:
+                    raise
+        return _revoked_jtis, _revoked_users
+
+
+def reload_revocations() -> None:
+    """Reload this process's copy of the list now"""
+    with _lock:
+        _load()
+
+
+def is_revoked(token) -> bool:
+    """Whether a validated token (access or refresh) has been revoked"""
+    jtis, users = _current()
+    if token.get(api_settings.JTI_CLAIM) in jtis:
+        return True
+    revoked_second = users.get(str(token.get(api_settings.USER_ID_CLAIM)))
+    if revoked_second is None:
+        return False
+    # A token from the revocation's own second can't be told apart from an earlier one
+    return int(token.get('iat', 0)) <= revoked_second
+
+
+def _token_lifetime():
+    return max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+
+
+def revoke_user_tokens(user, reason='') -> None:
+    """Revoke every token issued to user so far"""
+    now = timezone.now()
+    RevokedToken.objects.update_or_create(
+        user=user, jti='',
+        defaults={'revoked_at': now, 'expires_at': now + _token_lifetime(), 'reason': reason[:100]},
+    )
+    reload_revocations()
+
+
+def revoke_token(token, reason='') -> None:
+    """Revoke one validated token by its jti"""
+    RevokedToken.objects.get_or_create(
+        user_id=token[api_settings.USER_ID_CLAIM], jti=token[api_settings.JTI_CLAIM],
+        defaults={
+            'revoked_at': timezone.now(),
+            'expires_at': datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc),
+            'reason': reason[:100],
+        },
+    )
+    reload_revocations()
+
+
+def prune_revocations() -> int:
+    """Delete rows whose tokens have all expired; returns the number deleted"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -1,34 +1,56 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path
+from . import async_views
 from .views import (
     TeacherViewSet,
     LessonNoteViewSet,
     FeedbackViewSet,
+    ReviewJobViewSet,
     RegisterView,
     ProfileView,
+    AIStatsView,
+    MetricsView,
 )
 
 router = DefaultRouter()
 router.register(r'teachers', TeacherViewSet, basename='teachers')
 router.register(r'lesson-notes', LessonNoteViewSet, basename='lesson-notes')
 router.register(r'feedback', FeedbackViewSet, basename='feedback')
+router.register(r'review-jobs', ReviewJobViewSet, basename='review-jobs')
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('profile/', ProfileView.as_view(), name='profile'),
+    path('ai-stats/', AIStatsView.as_view(), name='ai-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('async/lesson-notes/', async_views.create_lesson_note, name='async-lesson-note-create'),
+    path(
+        'async/lesson-notes/<int:pk>/generate-ai-feedback/',
+        async_views.regenerate_ai_feedback,
+        name='async-lesson-note-generate-ai-feedback'
+    ),
 ] + router.urls
 
 # This will generate the following URL patterns:
 # /api/register/ - POST (register new user)
 # /api/profile/ - GET, PUT (get/update profile)
+# /api/ai-stats/ - GET (AI pipeline counters, admin only)
+# /api/metrics/ - GET (LLM call metrics in Prometheus format; METRICS_TOKEN or admin)
+# /api/async/lesson-notes/ - POST (create + review, native async for ASGI)
+# /api/async/lesson-notes/{id}/generate-ai-feedback/ - POST (regenerate, native async)
 # /api/teachers/ - GET, POST (list/create teachers)
 # /api/teachers/{id}/ - GET, PUT, DELETE (teacher details)
-# /api/lesson-notes/ - GET, POST (list/create lesson notes)
+# /api/lesson-notes/ - GET, POST (list/create lesson notes; ?async=true returns 202 + review job)
+# /api/lesson-notes/bulk/ - POST (bulk submit; reviews fan out with bounded concurrency)
 # /api/lesson-notes/{id}/ - GET, PUT, DELETE (lesson note details)
 # /api/lesson-notes/{id}/generate-ai-feedback/ - POST (generate AI feedback)
 # /api/lesson-notes/{id}/ai-feedback/ - GET, DELETE (get/delete AI feedback)
+# /api/lesson-notes/{id}/ai-feedback/stream/ - GET, POST (stream AI feedback as Server-Sent Events)
 # /api/lesson-notes/{id}/feedback/ - GET (get all feedback)
 # /api/feedback/ - GET, POST (list/create feedback)
 # /api/feedback/{id}/ - GET, PUT, DELETE (feedback details)
 # /api/feedback/ai-feedback/ - GET (get all AI feedback for teacher)
-# /api/feedback/human-feedback/ - GET (get all human feedback for teacher)
\ No newline at end of file
+# /api/feedback/human-feedback/ - GET (get all human feedback for teacher)
+# /api/review-jobs/ - GET (list queued/finished AI review jobs)
+# /api/review-jobs/{id}/ - GET (poll job status)
+# /api/review-jobs/{id}/feedback/ - GET (feedback produced by the job)
\ No newline at end of file
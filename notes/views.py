@@ -1,18 +1,57 @@
+import logging
+import uuid
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework import status, viewsets
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from .models import Teacher, LessonNote, Feedback
-from .serializers import TeacherSerializer, LessonNoteSerializer, FeedbackSerializer, RegisterSerializer
+from .models import Teacher, LessonNote, Feedback, ReviewJob
+from .serializers import (
+    TeacherSerializer, LessonNoteSerializer, FeedbackSerializer, RegisterSerializer, ReviewJobSerializer
+)
 from rest_framework.decorators import action
+from rest_framework.reverse import reverse
+from rest_framework.renderers import JSONRenderer
+from django.conf import settings
 from django.utils import timezone
-from .ai_feedback import AIFeedbackGenerator
+from .llm_clients import client_stats, get_feedback_generator
+from .ai_feedback import ReviewDeferred
+from .reviews import (
+    feedback_as_data, incremental_review, incremental_review_stats, review_lesson_note, review_lesson_notes,
+    save_ai_feedback, save_provisional_feedback, short_transaction
+)
+from .renderers import EventStreamRenderer, PrometheusRenderer, format_event
+from .review_jobs import enqueue_review, enqueue_reviews, review_job_stats
+from .feedback_cache import get_feedback_cache
+from .rate_limits import backpressure_stats
+from .metrics import latency_stats
+from .near_duplicates import index_lesson_notes, near_duplicate_stats
+from .single_flight import single_flight_stats
+from .call_metrics import call_metric_stats, prometheus_text
+from .authentication import (
+    IsMetricsScraper, MetricsTokenAuthentication, StatelessJWTAuthentication, authentication_stats, request_teacher,
+    request_teacher_id
+)
+from .pagination import FEEDBACK_ORDERING, LESSON_NOTE_ORDERING, KeysetPagination
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+
+def paginated_feedback(view, feedback, **extra):
+    """A page of feedback, newest first, under 'feedback' with the next/previous cursors"""
+    paginator = KeysetPagination(ordering=FEEDBACK_ORDERING)
+    page = paginator.paginate_queryset(
+        feedback.select_related('lesson_note__teacher'), view.request, view=view
+    )
+    return paginator.get_paginated_response(
+        FeedbackSerializer(page, many=True).data, results_key='feedback', **extra
+    )
+
+
 class TeacherViewSet(viewsets.ModelViewSet):
     queryset = Teacher.objects.all()
     serializer_class = TeacherSerializer
@@ -20,89 +59,312 @@ class TeacherViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # Only return the teacher record for the current user
-        try:
-            teacher = Teacher.objects.get(user=self.request.user)
-            return Teacher.objects.filter(id=teacher.id)
-        except Teacher.DoesNotExist:
+        teacher_id = request_teacher_id(self.request)
+        if teacher_id is None:
             return Teacher.objects.none()
+        return Teacher.objects.filter(id=teacher_id)
 
 class LessonNoteViewSet(viewsets.ModelViewSet):
     serializer_class = LessonNoteSerializer
     permission_classes = [IsAuthenticated]
+    pagination_ordering = LESSON_NOTE_ORDERING
 
     def get_queryset(self):
-        try:
-            teacher = Teacher.objects.get(user=self.request.user)
-            lesson_note = LessonNote.objects.filter(teacher=teacher)
-            return Feedback.objects.filter(lesson_note__in=lesson_note).order_by('-created_at')
-        except Teacher.DoesNotExist:
+        teacher_id = request_teacher_id(self.request)
+        if teacher_id is None:
             return LessonNote.objects.none()
+        lesson_notes = LessonNote.objects.filter(teacher_id=teacher_id)
+        if self.action in ('list', 'retrieve', 'update', 'partial_update'):
+            # Feedback summaries are stored columns; only the newest feedback is joined
+            lesson_notes = lesson_notes.with_feedback_summary()
+        return lesson_notes
 
     def create(self, request, *args, **kwargs):
 
         try:
-            teacher = Teacher.objects.get(user=request.user)
+            teacher = request_teacher(request)
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+
+            if self.wants_async_review(request):
+                return self.create_with_queued_review(request, serializer, teacher)
             
-            # Use transaction to ensure atomicity
-            with transaction.atomic():
-                serializer = self.get_serializer(data=request.data)
-                serializer.is_valid(raise_exception=True)
+            # Commit the note on its own: no transaction (or its row locks)
+            # may stay open across the Gemini round-trip
+            with short_transaction():
                 lesson_note = serializer.save(teacher=teacher)
-                
-                # Generate AI feedback
-                feedback_data = self.generate_ai_feedback(lesson_note)
-                
-                if feedback_data:
-                    return Response(feedback_data, status=status.HTTP_201_CREATED)
-                else:
-                    return Response(
-                        {'error': 'Lesson note created but AI feedback generation failed'},
-                        status=status.HTTP_201_CREATED
-                    )
+            
+            # Generate AI feedback outside any transaction; the Feedback row
+            # is committed in its own short transaction
+            try:
+                feedback_data = self.generate_ai_feedback(
+                    lesson_note, timeout=settings.REVIEW_LLM_TIMEOUT
+                )
+            except ReviewDeferred as e:
+                # The note is already saved - finish its review in the background
+                job = enqueue_review(lesson_note, delay=e.retry_after)
+                return self.queued_review_response(
+                    request, lesson_note, job,
+                    'Lesson note created; AI review is taking longer than usual and was queued'
+                )
+            
+            if feedback_data:
+                return Response(feedback_data, status=status.HTTP_201_CREATED)
+            else:
+                return Response(
+                    {'error': 'Lesson note created but AI feedback generation failed'},
+                    status=status.HTTP_201_CREATED
+                )
                 
         except Teacher.DoesNotExist:
             from rest_framework.exceptions import ValidationError
-            raise ValidationError("Teacher profile not found for this user")
+            raise ValidationError("Teacher profile not found for this user")
         
-    def generate_ai_feedback(self, lesson_note):
-        """Generate AI feedback for a lesson note"""
+    def wants_async_review(self, request):
+        """
+        Async submission is opt-in: enabled globally by ASYNC_REVIEW_SUBMISSION,
+        or per request with ?async=true or a 'Prefer: respond-async' header
+        """
+        flag = request.query_params.get('async')
+        if flag is not None:
+            return flag.lower() in ('1', 'true', 'yes')
+        if 'respond-async' in request.headers.get('Prefer', ''):
+            return True
+        return settings.ASYNC_REVIEW_SUBMISSION
+
+    def create_with_queued_review(self, request, serializer, teacher):
+        """Persist the note, queue its review and return 202 with the job to poll"""
+        with short_transaction():
+            lesson_note = serializer.save(teacher=teacher)
+            job = enqueue_review(lesson_note)
+        return self.queued_review_response(request, lesson_note, job, 'Lesson note created; AI review queued')
+
+    def queued_review_response(self, request, lesson_note, job, message):
+        """
+        202 Accepted pointing the client at the review job to poll, with a
+        provisional heuristic score to show until the AI review lands
+        """
+        status_url = reverse('review-jobs-detail', args=[job.id], request=request)
+        provisional = save_provisional_feedback([lesson_note]).get(lesson_note.id)
+        return Response({
+            'message': message,
+            'lesson_note_id': lesson_note.id,
+            'job': ReviewJobSerializer(job).data,
+            'provisional_feedback': feedback_as_data(provisional) if provisional else None,
+            'status_url': status_url,
+            'feedback_url': reverse('review-jobs-feedback', args=[job.id], request=request),
+        }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+        
+    def generate_ai_feedback(self, lesson_note, timeout=None):
+        """Generate AI feedback for a lesson note; ReviewDeferred is left to the caller"""
         try:
-            ai_generator = AIFeedbackGenerator()
-            feedback_data = ai_generator.generate_feedback(lesson_note)
-            
-            # Create feedback record
-            Feedback.objects.create(
-                lesson_note=lesson_note,
-                reviewer='AI Assistant',
-                reviewer_type='AI',
-                feedback_text=feedback_data['feedback_text'],
-                score=feedback_data['score'],
-                strengths=feedback_data['strengths'],
-                suggestions=feedback_data['suggestions'],
-                areas_for_improvement=feedback_data['areas_for_improvement'],
-                overall_assessment=feedback_data['overall_assessment']
-            )
+            feedback, feedback_data = review_lesson_note(lesson_note, timeout=timeout)
             return feedback_data
-        except Exception as e:
-            # Log error in production
-            print(f"Failed to generate AI feedback: {str(e)}")
+        except ReviewDeferred:
+            raise
+        except Exception:
+            logger.exception("Failed to generate AI feedback for lesson note %s", lesson_note.id)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_submit(self, request):
+        """
+        Submit many lesson notes at once and review them concurrently
+        Endpoint: POST /api/lesson-notes/bulk/
+        Body: a list of notes, or {"notes": [...], "concurrency": 8}
+        With ?async=true the reviews are queued and 202 returns a batch id to poll.
+        """
+        try:
+            teacher = request_teacher(request)
+        except Teacher.DoesNotExist:
+            from rest_framework.exceptions import ValidationError
+            raise ValidationError("Teacher profile not found for this user")
+
+        payload = request.data
+        notes_data = payload.get('notes') if isinstance(payload, dict) else payload
+        if not isinstance(notes_data, list) or not notes_data:
+            return Response({'error': 'Expected a non-empty list of lesson notes'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(notes_data) > settings.BULK_MAX_NOTES:
+            return Response({'error': f'At most {settings.BULK_MAX_NOTES} lesson notes per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            concurrency = int(payload.get('concurrency', settings.BULK_REVIEW_CONCURRENCY)
+                              if isinstance(payload, dict) else settings.BULK_REVIEW_CONCURRENCY)
+        except (TypeError, ValueError):
+            return Response({'error': 'concurrency must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        concurrency = min(max(concurrency, 1), settings.BULK_REVIEW_MAX_CONCURRENCY)
+
+        serializer = self.get_serializer(data=notes_data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        batch_id = uuid.uuid4()
+        with short_transaction():
+            lesson_notes = self.bulk_save_lesson_notes(serializer.validated_data, teacher, batch_id)
+            if self.wants_async_review(request):
+                jobs = enqueue_reviews(lesson_notes, batch_id)
+
+        if self.wants_async_review(request):
+            status_url = reverse('review-jobs-list', request=request) + f'?batch={batch_id}'
+            provisional = save_provisional_feedback(lesson_notes)
+            return Response({
+                'message': f'{len(lesson_notes)} lesson notes created; AI reviews queued',
+                'batch_id': str(batch_id),
+                'status_url': status_url,
+                'jobs': ReviewJobSerializer(jobs, many=True).data,
+                'provisional_scores': {note_id: feedback.score for note_id, feedback in provisional.items()},
+            }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+        outcomes = review_lesson_notes(lesson_notes, concurrency, timeout=settings.REVIEW_LLM_TIMEOUT)
+        provisional = save_provisional_feedback([
+            lesson_note for lesson_note, (_, _, error) in zip(lesson_notes, outcomes)
+            if isinstance(error, ReviewDeferred)
+        ])
+        results = []
+        for index, (lesson_note, (feedback, feedback_data, error)) in enumerate(zip(lesson_notes, outcomes)):
+            item = {'index': index, 'lesson_note_id': lesson_note.id}
+            if error is None:
+                item.update(status='reviewed', feedback_id=feedback.id, feedback=feedback_data)
+            elif isinstance(error, ReviewDeferred):
+                job = enqueue_review(lesson_note, delay=error.retry_after, priority='BULK')
+                item.update(status='queued', job_id=job.id)
+                if lesson_note.id in provisional:
+                    item.update(provisional_score=provisional[lesson_note.id].score)
+            else:
+                logger.error("Failed to generate AI feedback for lesson note %s", lesson_note.id, exc_info=error)
+                item.update(status='failed', error='AI feedback generation failed')
+            results.append(item)
+
+        return Response({
+            'batch_id': str(batch_id),
+            'count': len(results),
+            'reviewed': sum(1 for item in results if item['status'] == 'reviewed'),
+            'concurrency': concurrency,
+            'results': results,
+        }, status=status.HTTP_201_CREATED)
+
+    def bulk_save_lesson_notes(self, validated_data, teacher, batch_id):
+        """Insert all notes with one bulk INSERT, returning them with primary keys"""
+        lesson_notes = [LessonNote(teacher=teacher, batch_id=batch_id, **data) for data in validated_data]
+        # bulk_create skips save(), which normally computes the fingerprint
+        for lesson_note in lesson_notes:
+            lesson_note.update_fingerprint()
+        lesson_notes = LessonNote.objects.bulk_create(lesson_notes)
+        if lesson_notes and lesson_notes[0].pk is None:
+            # MySQL can't return primary keys from a bulk INSERT
+            lesson_notes = list(
+                LessonNote.objects.select_related('teacher').filter(batch_id=batch_id).order_by('id')
+            )
+        # Nor does it send post_save, which keeps the near-duplicate index current
+        if settings.AI_NEAR_DUPLICATE_ENABLED:
+            index_lesson_notes(lesson_notes)
+        return lesson_notes
+
+    @action(detail=True, methods=['post'], url_path='generate-ai-feedback')
+    def regenerate_ai_feedback(self, request, pk=None):
+        """
+        Generate a new AI review for an existing lesson note
+        Endpoint: POST /api/lesson-notes/{id}/generate-ai-feedback/
+        If the content has not materially changed since the last AI review,
+        that review is returned (200) without calling the LLM; if only some
+        sections changed, only those are re-reviewed. ?force=true always
+        runs a full review.
+        """
+        lesson_note = self.get_object()
+        force = request.query_params.get('force', '').lower() in ('1', 'true', 'yes')
+        try:
+            feedback, feedback_data, outcome = incremental_review(
+                lesson_note, timeout=settings.REVIEW_LLM_TIMEOUT, force=force
+            )
+        except ReviewDeferred as e:
+            job = enqueue_review(lesson_note, delay=e.retry_after, priority='REGENERATE')
+            return self.queued_review_response(
+                request, lesson_note, job, 'AI review is taking longer than usual and was queued'
+            )
+        except Exception:
+            logger.exception("Failed to generate AI feedback for lesson note %s", lesson_note.id)
+            return Response({
+                'error': 'AI feedback generation failed',
+                'lesson_note_id': lesson_note.id
+            }, status=status.HTTP_502_BAD_GATEWAY)
 
+        if outcome['mode'] == 'unchanged':
+            return Response({
+                'message': 'Lesson note unchanged since its last AI review; existing feedback returned',
+                'lesson_note_id': lesson_note.id,
+                'feedback_id': feedback.id,
+                'feedback': feedback_data,
+                'review': outcome
+            }, status=status.HTTP_200_OK)
+        return Response({
+            'message': 'AI feedback generated successfully',
+            'lesson_note_id': lesson_note.id,
+            'feedback_id': feedback.id,
+            'feedback': feedback_data,
+            'review': outcome
+        }, status=status.HTTP_201_CREATED)
  
     @action(detail=True, methods=['get'], url_path='feedback')
     def get_feedback(self, request, pk=None):
         """
-        Get all feedback for a lesson note
+        Get a lesson note's feedback, a page at a time
         Endpoint: GET /api/lesson-notes/{id}/feedback/
         """
-        print('what the helly')
         lesson_note = self.get_object()
-        feedback = Feedback.objects.filter(lesson_note=lesson_note)
-        serializer = FeedbackSerializer(feedback, many=True)
-        return Response({
-            'lesson_note_id': lesson_note.id,
-            'feedback_count': feedback.count(),
-            'feedback': serializer.data
-        })
+        return paginated_feedback(
+            self, Feedback.objects.filter(lesson_note=lesson_note),
+            lesson_note_id=lesson_note.id, feedback_count=lesson_note.feedback_count,
+        )
+
+    @action(
+        detail=True, methods=['get', 'post'], url_path='ai-feedback/stream',
+        renderer_classes=[EventStreamRenderer, JSONRenderer]
+    )
+    def stream_ai_feedback(self, request, pk=None):
+        """
+        Generate AI feedback, streaming feedback_text as Server-Sent Events
+        Endpoint: GET/POST /api/lesson-notes/{id}/ai-feedback/stream/
+        Events: 'start', then 'delta' ({"text": ...}) as tokens arrive, then
+        'feedback' with the validated structure once it is saved, or 'queued'
+        with the review job if the LLM is throttled or too slow.
+        """
+        lesson_note = self.get_object()
+        response = StreamingHttpResponse(
+            self.feedback_event_stream(request, lesson_note), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def feedback_event_stream(self, request, lesson_note):
+        yield format_event('start', {'lesson_note_id': lesson_note.id})
+        generator = get_feedback_generator()
+        events = generator.stream_feedback(lesson_note, timeout=settings.REVIEW_LLM_TIMEOUT)
+        while True:
+            try:
+                event, payload = next(events)
+            except StopIteration:
+                return
+            except ReviewDeferred as e:
+                job = enqueue_review(lesson_note, delay=e.retry_after, priority='REGENERATE')
+                provisional = save_provisional_feedback([lesson_note]).get(lesson_note.id)
+                yield format_event('queued', {
+                    'job_id': job.id,
+                    'status_url': reverse('review-jobs-detail', args=[job.id], request=request),
+                    'provisional_feedback': feedback_as_data(provisional) if provisional else None,
+                })
+                return
+            if event == 'delta':
+                yield format_event('delta', {'text': payload})
+                continue
+            try:
+                feedback = save_ai_feedback(lesson_note, payload)
+            except Exception:
+                logger.exception("Failed to save streamed AI feedback for lesson note %s", lesson_note.id)
+                yield format_event('error', {'error': 'AI feedback could not be saved'})
+                return
+            yield format_event('feedback', {'feedback_id': feedback.id, **payload})
 
     @action(detail=True, methods=['delete'], url_path='ai-feedback')
     def delete_ai_feedback(self, request, pk=None):
@@ -129,60 +391,89 @@ class LessonNoteViewSet(viewsets.ModelViewSet):
                 'lesson_note_id': lesson_note.id
             }, status=status.HTTP_404_NOT_FOUND)
 
+class ReviewJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status of queued AI reviews for the current teacher's lesson notes"""
+    serializer_class = ReviewJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        teacher_id = request_teacher_id(self.request)
+        if teacher_id is None:
+            return ReviewJob.objects.none()
+        jobs = ReviewJob.objects.filter(teacher_id=teacher_id)
+        batch_id = self.request.query_params.get('batch')
+        if batch_id:
+            try:
+                jobs = jobs.filter(batch_id=uuid.UUID(batch_id))
+            except ValueError:
+                return ReviewJob.objects.none()
+        return jobs
+
+    @action(detail=True, methods=['get'], url_path='feedback')
+    def feedback(self, request, pk=None):
+        """
+        Get the Feedback produced by a review job
+        Endpoint: GET /api/review-jobs/{id}/feedback/
+        """
+        job = self.get_object()
+        if job.status == 'DONE' and job.feedback_id:
+            return Response(FeedbackSerializer(job.feedback).data)
+        if job.status in ('FAILED', 'DEAD'):
+            return Response({
+                'error': 'AI review failed',
+                'detail': job.error,
+                'job': ReviewJobSerializer(job).data
+            }, status=status.HTTP_404_NOT_FOUND)
+        # Still queued or running: show the provisional score meanwhile
+        provisional = job.lesson_note.feedback_set.filter(reviewer_type='HEURISTIC').first()
+        return Response({
+            **ReviewJobSerializer(job).data,
+            'provisional_feedback': FeedbackSerializer(provisional).data if provisional else None,
+        }, status=status.HTTP_202_ACCEPTED)
+
 class FeedbackViewSet(viewsets.ModelViewSet):
     serializer_class = FeedbackSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        try:
-            teacher = Teacher.objects.get(user=self.request.user)
-            return Feedback.objects.filter(lesson_note__teacher=teacher)
-        except Teacher.DoesNotExist:
+        teacher_id = request_teacher_id(self.request)
+        if teacher_id is None:
             return Feedback.objects.none()
+        return Feedback.objects.filter(lesson_note__teacher_id=teacher_id).select_related('lesson_note__teacher')
 
     @action(detail=False, methods=['get'], url_path='ai-feedback')
     def get_all_ai_feedback(self, request):
         """
-        Get all AI feedback for current teacher
+        Get the current teacher's AI feedback, a page at a time
         Endpoint: GET /api/feedback/ai-feedback/
         """
-        try:
-            teacher = Teacher.objects.get(user=self.request.user)
-            ai_feedback = Feedback.objects.filter(
-                lesson_note__teacher=teacher,
-                reviewer_type='AI'
-            )
-            serializer = FeedbackSerializer(ai_feedback, many=True)
-            return Response({
-                'count': ai_feedback.count(),
-                'feedback': serializer.data
-            })
-        except Teacher.DoesNotExist:
+        teacher_id = request_teacher_id(request)
+        if teacher_id is None:
             return Response({
                 'error': 'Teacher profile not found'
             }, status=status.HTTP_404_NOT_FOUND)
+        ai_feedback = Feedback.objects.filter(
+            lesson_note__teacher_id=teacher_id,
+            reviewer_type='AI'
+        )
+        return paginated_feedback(self, ai_feedback)
 
     @action(detail=False, methods=['get'], url_path='human-feedback')
     def get_all_human_feedback(self, request):
         """
-        Get all human feedback for current teacher
+        Get the current teacher's human feedback, a page at a time
         Endpoint: GET /api/feedback/human-feedback/
         """
-        try:
-            teacher = Teacher.objects.get(user=self.request.user)
-            human_feedback = Feedback.objects.filter(
-                lesson_note__teacher=teacher,
-                reviewer_type='HUMAN'
-            )
-            serializer = FeedbackSerializer(human_feedback, many=True)
-            return Response({
-                'count': human_feedback.count(),
-                'feedback': serializer.data
-            })
-        except Teacher.DoesNotExist:
+        teacher_id = request_teacher_id(request)
+        if teacher_id is None:
             return Response({
                 'error': 'Teacher profile not found'
             }, status=status.HTTP_404_NOT_FOUND)
+        human_feedback = Feedback.objects.filter(
+            lesson_note__teacher_id=teacher_id,
+            reviewer_type='HUMAN'
+        )
+        return paginated_feedback(self, human_feedback)
 
 class RegisterView(APIView):
     permission_classes = [AllowAny]
@@ -201,10 +492,12 @@ class RegisterView(APIView):
     
 class ProfileView(APIView):
     permission_classes = [IsAuthenticated]
+    # Shows the user's email, which the token doesn't carry
+    stateless_authentication = False
 
     def get(self, request):
         try:
-            teacher = Teacher.objects.get(user=request.user)
+            teacher = request_teacher(request)
             return Response({
                 "id": request.user.id,
                 "username": request.user.username,
@@ -225,7 +518,7 @@ class ProfileView(APIView):
     def put(self, request):
         """Update user profile"""
         try:
-            teacher = Teacher.objects.get(user=request.user)
+            teacher = request_teacher(request)
             
             # Update user fields
             if 'email' in request.data:
@@ -250,4 +543,41 @@ class ProfileView(APIView):
         except Teacher.DoesNotExist:
             return Response({
                 "error": "Teacher profile not found"
-            }, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            }, status=status.HTTP_404_NOT_FOUND)
+
+class AIStatsView(APIView):
+    """
+    Operational counters for the AI review pipeline
+    Endpoint: GET /api/ai-stats/
+    """
+    permission_classes = [IsAdminUser]
+    stateless_authentication = False
+
+    def get(self, request):
+        cache = get_feedback_cache()
+        return Response({
+            'cache': cache.stats() if cache is not None else {'enabled': False},
+            'llm_clients': client_stats(),
+            **backpressure_stats(),
+            'latency': latency_stats(),
+            'review_jobs': review_job_stats(),
+            'incremental_reviews': incremental_review_stats(),
+            'near_duplicates': near_duplicate_stats(),
+            'single_flight': single_flight_stats(),
+            'llm_calls': call_metric_stats(),
+            'authentication': authentication_stats(),
+        })
+
+
+class MetricsView(APIView):
+    """
+    LLM call metrics in Prometheus text format, for scraping
+    Endpoint: GET /api/metrics/
+    """
+    authentication_classes = [MetricsTokenAuthentication, StatelessJWTAuthentication]
+    stateless_authentication = False
+    permission_classes = [IsMetricsScraper | IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request):
+        return Response(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')